@@ -0,0 +1,13 @@
+"""Daemon test script"""
+from shipper import run, command
+
+@command
+def hello(name, shout=False):
+    greeting = "hello " + name
+    print greeting.upper() if shout else greeting
+
+@command
+def fail():
+    raise ValueError("boom")
+
+run()
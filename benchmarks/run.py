@@ -0,0 +1,307 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Benchmarks of the shipper hot paths against a fake docker fleet.
+
+Scenarios run fleet-wide operations on many fake daemons listening on
+local ports and report throughput, p50/p99 latency and peak RSS:
+
+    python benchmarks/run.py --hosts 100 --containers 1000
+    python benchmarks/run.py --hosts 1000 --latency 0.05 --failures 0.01 \\
+        containers run
+
+`request` and `create` measure the overhead of the client itself, the
+requests get canned replies without touching the network. `flatten` and
+`running` build and filter the container records, the `_dicts` variants
+do the same with plain dictionary copies of the replies to compare the
+time and the retained memory.
+
+Use --target to run against fleet started in another process with
+`python -m shipper.fakedocker`, so the daemons do not share the CPU with
+the client, and --json to compare the results between the revisions.
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twisted.internet import reactor, defer, task
+from twisted.python.failure import Failure
+from twisted.web.client import HTTPConnectionPool, ResponseDone
+
+from shipper.async_shipper import AsyncShipper, _flatten, _grouped_by_host
+from shipper.client import Client
+from shipper.record import Record
+from shipper.container import Container, ContainerConfig
+from shipper.pretty import containers_to_ascii_table
+from shipper.fakedocker import FakeFleet, lognormal
+
+SCENARIOS = []
+
+
+def scenario(fn):
+    SCENARIOS.append(fn)
+    return fn
+
+
+@scenario
+def containers(shipper):
+    return shipper.containers(all=True)
+
+
+@scenario
+def run(shipper):
+    return shipper.run("bench", "sleep 1")
+
+
+@scenario
+def build(shipper):
+    return shipper.build(fobj=StringIO("FROM base\n"))
+
+
+@scenario
+def stop(shipper):
+    return shipper.plan().containers().then(
+        lambda s, cs: s.stop(*cs[:1])).submit()
+
+
+@scenario
+def flatten(shipper):
+    """Builds Container objects out of decoded replies, no network"""
+    return _flatten(shipper.bench_replies, shipper.hosts, Container)
+
+
+@scenario
+def flatten_dicts(shipper):
+    """Copies decoded replies into dictionaries, the layout before the
+    records, no network
+    """
+    return [_Dict(h, value) for h, host_values in
+            zip(shipper.hosts, shipper.bench_replies)
+            for value in host_values]
+
+
+@scenario
+def running(shipper):
+    """Filters running containers out of the records, no network"""
+    return [c for c in shipper.bench_records if c.is_running]
+
+
+@scenario
+def running_dicts(shipper):
+    """Filters running containers out of the dictionaries, no network"""
+    return [c for c in shipper.bench_dicts if c.is_running]
+
+
+@scenario
+def pretty(shipper):
+    """Renders containers of all the hosts as ascii tables, no network"""
+    containers_to_ascii_table(_grouped_by_host(
+        _flatten(shipper.bench_replies, shipper.hosts, Container)))
+
+
+@scenario
+def request(shipper):
+    """Single get per host through the client, no network"""
+    client = shipper.offline.c
+    return defer.gatherResults([
+        client.get(host, "containers/ps", params={'all': None})
+        for host in shipper.hosts])
+
+
+@scenario
+def create(shipper):
+    """Creates the same container on every host, no network"""
+    return shipper.offline.create_container(
+        ContainerConfig("bench", "sleep 1"))
+
+
+class _Dict(dict):
+    """Container as a plain dictionary copy of the reply"""
+
+    def __init__(self, host, values):
+        dict.__init__(self, values)
+        self.host = host
+
+    @property
+    def status(self):
+        return self.get("Status") or ""
+
+    @property
+    def is_running(self):
+        return self.status.startswith("Up")
+
+
+class _Reply(object):
+    """Already received reply"""
+    code = 201
+
+    def __init__(self, body):
+        self.body = body
+        self.length = len(body)
+
+    def deliverBody(self, protocol):
+        protocol.dataReceived(self.body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+def _replied(method, body):
+    def reply(**kwargs):
+        return defer.succeed(_Reply(body))
+    reply.__name__ = method
+    return reply
+
+
+class OfflineClient(Client):
+    """Client getting canned replies instead of sending the requests"""
+    _get = staticmethod(_replied('get', '[]'))
+    _post = staticmethod(_replied('post', '{"Id": "0123456789ab"}'))
+
+    def get(self, host, path, **kwargs):
+        return self.request(self._get, host, path, **kwargs)
+
+    def post(self, host, path, **kwargs):
+        return self.request(self._post, host, path, **kwargs)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def peak_rss():
+    """Peak resident memory of the process in megabytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def retained(value):
+    """Megabytes held by the value and everything reachable from it
+    through containers, dictionaries, lists and tuples
+    """
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        v = stack.pop()
+        if id(v) in seen:
+            continue
+        seen.add(id(v))
+        total += sys.getsizeof(v)
+        if isinstance(v, dict):
+            stack.extend(v.iterkeys())
+            stack.extend(v.itervalues())
+        elif isinstance(v, (list, tuple)):
+            stack.extend(v)
+        elif isinstance(v, Record):
+            total += sys.getsizeof(v._values)
+            stack.extend(v.itervalues())
+    return total / 1024.0 ** 2
+
+
+@defer.inlineCallbacks
+def measure(fn, shipper, repeat):
+    timings = []
+    failed = 0
+    result = None
+    started = time.time()
+    for _ in xrange(repeat):
+        t = time.time()
+        try:
+            result = yield defer.maybeDeferred(fn, shipper)
+        except Exception:
+            failed += 1
+        timings.append(time.time() - t)
+    elapsed = time.time() - started
+    defer.returnValue({
+        'scenario': fn.__name__,
+        'hosts': len(shipper.hosts),
+        'repeat': repeat,
+        'failed': failed,
+        'ops_per_second': repeat / elapsed,
+        'host_calls_per_second': repeat * len(shipper.hosts) / elapsed,
+        'p50': percentile(timings, 0.5),
+        'p99': percentile(timings, 0.99),
+        'peak_rss_mb': peak_rss(),
+        'retained_mb': retained(result)
+    })
+
+
+@defer.inlineCallbacks
+def main(args):
+    fleet = None
+    if args.target:
+        hosts = args.target.split(",")
+    else:
+        latency = {}
+        if args.latency:
+            latency["*"] = lognormal(args.latency, args.sigma)
+        fleet = FakeFleet(args.hosts, args.containers, args.images,
+                          latency=latency, failures={"*": args.failures})
+        hosts = fleet.hosts
+
+    shipper = AsyncShipper(
+        hosts, pool=HTTPConnectionPool(reactor, persistent=False))
+    selected = [s for s in SCENARIOS
+                if not args.scenarios or s.__name__ in args.scenarios]
+
+    offline = set(["flatten", "flatten_dicts", "running", "running_dicts",
+                   "pretty"])
+    if set(s.__name__ for s in selected) & offline:
+        # replies of a single host are reused for the whole fleet
+        reply = yield shipper.on(hosts[:1]).parallel(
+            shipper.c.containers, {'all': True})
+        shipper.bench_replies = reply * len(hosts)
+        shipper.bench_records = flatten(shipper)
+        shipper.bench_dicts = flatten_dicts(shipper)
+
+    shipper.offline = AsyncShipper(
+        hosts, version="1.21", client_builder=OfflineClient)
+
+    results = []
+    for fn in selected:
+        result = yield measure(fn, shipper, args.repeat)
+        results.append(result)
+        if not args.json:
+            print ("{scenario:<12} hosts={hosts} ops/s={ops_per_second:.2f} "
+                   "host calls/s={host_calls_per_second:.1f} "
+                   "p50={p50:.4f}s p99={p99:.4f}s failed={failed} "
+                   "peak rss={peak_rss_mb:.1f}MB "
+                   "retained={retained_mb:.1f}MB".format(**result))
+
+    if args.json:
+        print json.dumps(results, indent=2)
+    if fleet:
+        fleet.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("scenarios", nargs="*",
+                        help="scenarios to run: {}".format(
+                            ", ".join(s.__name__ for s in SCENARIOS)))
+    parser.add_argument("--hosts", type=int, default=100)
+    parser.add_argument("--containers", type=int, default=100,
+                        help="containers per fake host")
+    parser.add_argument("--images", type=int, default=10,
+                        help="images per fake host")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="median latency of fake endpoints, seconds")
+    parser.add_argument("--sigma", type=float, default=0.5,
+                        help="spread of the lognormal latency")
+    parser.add_argument("--failures", type=float, default=0,
+                        help="failure rate of fake endpoints")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--target",
+                        help="comma separated hosts of an external fleet")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    task.react(lambda _, args: main(args), [parse_args()])
@@ -17,6 +17,9 @@ setup(name='shipper',
           "treq==0.2.0",
           "ago==0.0.5",
           "texttable==0.8.1",
-      ])
+      ],
+      extras_require={
+          "tls": ["pyOpenSSL", "service_identity"],
+      })
 
 
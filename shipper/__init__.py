@@ -13,5 +13,34 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import sys
+import importlib
+from types import ModuleType
+
 from .shipper import Shipper
 from .runner import run, command
+
+__all__ = ["Shipper", "AsyncShipper", "run", "command"]
+
+# attributes pulling twisted and treq in, imported on the first access
+_lazy = {
+    "AsyncShipper": ".async_shipper",
+}
+
+
+class _Package(ModuleType):
+    """Package module resolving the heavy attributes lazily"""
+
+    def __getattr__(self, name):
+        if name not in _lazy:
+            raise AttributeError(name)
+        value = getattr(importlib.import_module(_lazy[name], __name__), name)
+        setattr(self, name, value)
+        return value
+
+
+_package = _Package(__name__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+# python 2 clears globals of the module once it's collected
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
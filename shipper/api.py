@@ -0,0 +1,68 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Docker remote api versions and the features they bring.
+
+Unless the version is pinned, :class:`shipper.client.Client` asks every
+host for its api version once, negotiates the newest one both sides
+speak and caches it with the set of supported features, so mixed
+fleets use server side filters, exec, stats and archives where the
+hosts have them:
+
+    >>> Api.negotiate("1.18").supports("exec")
+    True
+"""
+import re
+
+# version used when the host does not report one
+DEFAULT = "1.6"
+
+# newest version the client speaks
+MAXIMUM = "1.21"
+
+# feature: first api version that has it
+FEATURES = {
+    'repo_tags': "1.7",        # images/json lists RepoTags, not Repository
+    'exec': "1.15",            # containers/{id}/exec, exec/{id}/start
+    'filters': "1.16",         # status filter of containers/json
+    'stats': "1.17",           # containers/{id}/stats
+    'host_config': "1.18",     # Memory of create and inspect in HostConfig
+    'event_filters': "1.18",   # filters of events
+    'stats_once': "1.19",      # single sample of stats with stream=0
+    'archive': "1.20",         # containers/{id}/archive, otherwise copy
+}
+
+
+def parse(version):
+    """Converts "1.16" to (1, 16), so versions compare as numbers"""
+    return tuple(int(v) for v in re.findall(r"\d+", str(version))[:2])
+
+
+class Api(object):
+    """Api version of the host and the features it supports"""
+
+    def __init__(self, version):
+        self.version = version
+        parsed = parse(version)
+        self.features = frozenset(
+            f for f, v in FEATURES.iteritems() if parsed >= parse(v))
+
+    @classmethod
+    def negotiate(cls, server):
+        """Newest version spoken by both the client and the server"""
+        if not server:
+            return cls(DEFAULT)
+        return cls(min(server, MAXIMUM, key=parse))
+
+    def supports(self, feature):
+        return feature in self.features
+
+    def __eq__(self, other):
+        return isinstance(other, Api) and self.version == other.version
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Api({})".format(self.version)
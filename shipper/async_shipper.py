@@ -0,0 +1,742 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Non-blocking flavour of Shipper.
+
+AsyncShipper methods are executed in the reactor thread and return
+deferreds, so they can be used from twisted applications directly, without
+crossing threads on every call, e.g. with `defer.inlineCallbacks`. Like
+the rest of the package it is python 2 only.
+
+Blocking :class:`shipper.Shipper` is a thin wrapper on top of it.
+"""
+import os
+import re
+import logging
+from copy import copy
+from collections import namedtuple
+
+from twisted.internet import defer, threads, task, reactor
+from twisted.python.failure import Failure
+
+from .utils import parse_volumes, parse_ports
+from .container import Container, ContainerConfig
+from .image import Image
+from .host import parse_hosts
+from .pretty import (
+    images_to_ascii_table, containers_to_ascii_table,
+    images_stream, containers_stream)
+from .client import Client
+from .build import DockerFile, Archive
+from .placement import Snapshot, place, release, SPREAD
+from .streams import RingSink
+from .stats import Stats
+from .inventory import Inventory
+from .plan import Plan
+from . import worker
+from . import waiter
+from . import hooks
+from . import cleanup
+from . import progress
+
+
+class AsyncShipper(object):
+    """Parallelized operations on multiple docker hosts that return
+    deferreds. Should be used from the reactor thread only.
+    Api version of every host is negotiated on the first request
+    unless `version` is pinned.
+    """
+
+    def __init__(self, hosts=None, version=None, timeout=None,
+                 client_builder=None, processes=None, pool=None,
+                 log=None, inventory=None, snapshots=None, output=None,
+                 tls=None, history=None, listings=None):
+        if isinstance(hosts, basestring):
+            inventory = inventory or Inventory()
+            self.hosts = inventory.select(hosts)
+            if not self.hosts:
+                raise ValueError("No hosts match {}".format(hosts))
+        else:
+            self.hosts = parse_hosts(hosts or ["localhost"])
+
+        self.log = log or logging.getLogger("shipper")
+        if client_builder is None:
+            client_builder = Client
+        self.c = client_builder(
+            version, timeout, log=self.log, pool=pool, output=output,
+            tls=tls)
+
+        self.version = version
+        self.timeout = timeout
+        self.tls = tls
+        self.processes = processes
+        # placement snapshots keyed by the hosts, can be shared
+        # between the shippers to keep them warm
+        self._snapshots = {} if snapshots is None else snapshots
+        # :class:`shipper.history.History` recording the listings
+        self.history = history
+        # :class:`shipper.listings.Listings` shared between the shippers
+        self.listings = listings
+
+    def negotiate(self):
+        """Returns list of :class:`shipper.api.Api` negotiated with the
+        hosts, the versions are cached by the client
+        """
+        return self.parallel(self.c.api, {})
+
+    def on(self, hosts):
+        """Returns shipper that shares the client with this one
+        but operates on the other hosts
+        """
+        view = copy(self)
+        view.hosts = parse_hosts(hosts)
+        return view
+
+    def traced(self, name):
+        """Returns shipper whose requests are tagged with a new
+        :class:`hooks.Operation`, e.g. `a.traced("deploy").run(...)`
+        """
+        view = copy(self)
+        view.c = self.c.traced(hooks.Operation(name))
+        return view
+
+    def plan(self):
+        """Returns :class:`Plan` that executes chain of operations
+        per host, its `submit` returns deferred
+        """
+        return Plan(self)
+
+    def build(self, path=None, fobj=None, tag=None,
+              quiet=False, nocache=False, rm=False):
+        """Run build of a container from buildfile
+        that can be passed as local/remote path or file object(fobj)
+        """
+        dockerfile = DockerFile(path, fobj)
+
+        deferreds = []
+        tracked = self._progress("build")
+        try:
+            for host in self.hosts:
+                d = self.c.build(
+                    host, dockerfile, tag=tag, quiet=quiet,
+                    nocache=nocache, rm=rm)
+                if tracked is not None:
+                    tracked.track(host, d)
+                deferreds.append(d)
+        finally:
+            if tracked is not None:
+                tracked.close()
+        d = defer.gatherResults(deferreds, consumeErrors=True)
+        d.addCallback(lambda responses: [
+            Response(h, 200, r) for h, r in zip(self.hosts, responses)])
+        return d
+
+    def parallel(self, method, params, each=None, settle=False):
+        """Calls method for every host in parallel, `each(host, response)`
+        if set is called as soon as the host replies and its result
+        replaces the response of the host. Fails as soon as one of the
+        calls fails, or once all of them are done with `settle` set, for
+        the calls sharing resources that are released afterwards.
+        """
+        tracked = self._progress(getattr(method, '__name__', 'call'))
+        if self._is_sharded(method, params):
+            # replies are streamed by the workers host by host
+            hosts = self.hosts
+            deferreds, exited = worker.dispatch(
+                hosts, method.__name__, params, self.processes,
+                self.version, self.timeout, self.tls, self.c.apis)
+            if tracked is not None:
+                for host, d in zip(hosts, deferreds):
+                    tracked.track(host, d)
+                tracked.close()
+        else:
+            exited = None
+            hosts, deferreds = self._calls(method, params, tracked)
+
+        if each is not None:
+            for host, d in zip(hosts, deferreds):
+                d.addCallback(lambda r, host=host: each(host, r))
+
+        if settle:
+            d = _settled(deferreds)
+        else:
+            d = defer.gatherResults(deferreds, consumeErrors=True)
+        if exited is not None:
+            d = worker.when_exited(d, exited)
+        return d
+
+    def _calls(self, method, params, tracked):
+        """Calls method for every host, returns the hosts and
+        the deferreds of the calls
+        """
+        if isinstance(params, dict):
+            # we assume that it's all the same call to all default hosts
+            # with the same arguments
+            hosts = self.hosts
+            calls = [(h, params) for h in hosts]
+        elif isinstance(params, list):
+            # we assume that it's a list of tuples (host, kwargs)
+            # (useful in case if you have parallel calls to
+            # different endpoints)
+            calls = params
+            hosts = [host for host, _ in params]
+
+        if tracked is None:
+            deferreds = [method(host, **copy(kwargs))
+                         for host, kwargs in calls]
+            return hosts, deferreds
+
+        tasks = [tracked.add(host) for host in hosts]
+        deferreds = []
+        try:
+            for task, (host, kwargs) in zip(tasks, calls):
+                kwargs = copy(kwargs)
+                if getattr(method, 'starts_task', False) is True:
+                    kwargs['task'] = task
+                else:
+                    task.start()
+                d = method(host, **kwargs)
+                deferreds.append(d.addBoth(task.finish))
+        except Exception:
+            # calls that raised or were never made fail the progress
+            failure = Failure()
+            for task in tasks[len(deferreds):]:
+                task.finish(failure)
+            raise
+        finally:
+            tracked.close()
+        return hosts, deferreds
+
+    def _progress(self, name):
+        """Returns :class:`progress.Progress` of the fan-out if there
+        are callbacks watching, named after the traced operation
+        """
+        if not progress.registry:
+            return None
+        operation = getattr(self.c, 'operation', None)
+        if isinstance(operation, hooks.Operation):
+            name = "{}/{}".format(operation.name, name)
+        return progress.registry.start(name)
+
+    def _is_sharded(self, method, params):
+        """Fleet-wide read only calls are sharded across worker
+        processes if Shipper was created with `processes` > 1
+        """
+        return (self.processes > 1 and
+                isinstance(params, dict) and
+                getattr(method, '__name__', None) in worker.SHARDABLE and
+                len(self.hosts) > 1)
+
+    def images(self, **kwargs):
+        """Lists images of all the hosts. With `pretty` set returns them
+        as ascii tables, with `stream` set writes every host's images to
+        the stream as soon as they arrive in the `format`: table,
+        json or csv.
+        """
+        pretty = kwargs.pop('pretty', False)
+        out = _stream(images_stream, kwargs)
+        # only the default listing is recorded, it has no intermediates
+        record = self.history is not None and not any(
+            kwargs.get(k) for k in ('name', 'quiet', 'all', 'viz'))
+
+        def convert(host, response):
+            if record:
+                self.history.record("images", host, response)
+            images = _flatten([response], [host], Image)
+            if out is not None:
+                out.write(host, images)
+            return images
+
+        def done(responses):
+            images = _concat(responses)
+            if pretty:
+                return images_to_ascii_table(_grouped_by_host(images))
+            return images
+
+        d = self.parallel(self.c.images, kwargs, each=convert)
+        return d.addCallback(done)
+
+    def containers(self, **kwargs):
+        """Lists containers of all the hosts, filtered by status (`running`)
+        and `image` and `command` regular expressions. `pretty` and
+        `stream` work the same way as in `images`.
+        """
+        pretty = kwargs.pop('pretty', False)
+        running = kwargs.setdefault('running', True)
+        image = kwargs.pop('image', None)
+        command = kwargs.pop('command', None)
+        out = _stream(containers_stream, kwargs)
+        scope = self._scope(kwargs)
+
+        def convert(host, response):
+            if scope is not False:
+                self.history.record("containers", host, response, scope)
+            containers = _flatten([response], [host], Container)
+
+            if running is not None:
+                if running:
+                    f = lambda x: x.is_running
+                else:
+                    f = lambda x: x.is_stopped
+                containers = filter(f, containers)
+
+            if image is not None:
+                f = lambda x: re.match(image, x.image)
+                containers = filter(f, containers)
+
+            if command is not None:
+                f = lambda x: re.match(command, x.command)
+                containers = filter(f, containers)
+
+            if out is not None:
+                out.write(host, containers)
+            return containers
+
+        def done(responses):
+            containers = _concat(responses)
+            if pretty:
+                return containers_to_ascii_table(
+                    _grouped_by_host(containers))
+            return containers
+
+        method = self.c.containers
+        if self.listings is not None:
+            method = self.listings.cached(method)
+        d = self.parallel(method, kwargs, each=convert)
+        return d.addCallback(done)
+
+    def _scope(self, kwargs):
+        """States of the containers fully covered by the listing, None
+        for all of them, False if the listing is not recorded
+        """
+        if self.history is None or kwargs.get('quiet') or \
+                kwargs.get('latest') or kwargs.get('since') or \
+                kwargs.get('before') or kwargs.get('limit', -1) != -1:
+            return False
+        if not kwargs.get('all'):
+            return ("running", "paused", "restarting")
+        running = kwargs.get('running')
+        if running is None:
+            return None
+        return ("running",) if running else ("exited",)
+
+    def create_container(self, config, hosts=None, name=None):
+        hosts = hosts or self.hosts
+        # the same body goes to every host, encoded once per api version
+        encoded = {}
+        kwargs = [(host, {"config": config, "name": name,
+                          "encoded": encoded}) for host in hosts]
+        d = self._changing(
+            hosts, self.parallel(self.c.create_container, kwargs))
+        d.addCallback(_flatten, hosts, Container)
+        return d
+
+    def start(self, *containers, **kwargs):
+        self.log.debug("Starting %s", containers)
+        _, port_binds = parse_ports(kwargs.get('ports', []))
+        kwargs = [(c.host, {"container": c,
+                            "binds": kwargs.get("binds"),
+                            "port_binds": port_binds,
+                            "links": kwargs.get("links", [])})
+                  for c in containers]
+        d = self._changing(
+            [c.host for c in containers], self.parallel(self.c.start, kwargs))
+        d.addCallback(lambda _: None)
+        return d
+
+    def stop(self, *containers, **kwargs):
+        self.log.debug("Stopping %s", containers)
+        stop_args = [(c.host,
+                      {"container": c,
+                       "wait_seconds": kwargs.get('wait_seconds', 5)})
+                     for c in containers]
+        d = self._changing(
+            [c.host for c in containers],
+            self.parallel(self.c.stop, stop_args))
+        d.addCallback(lambda _: containers)
+        return d
+
+    def attach(self, *containers, **kwargs):
+        self.log.debug("Attaching to %s", containers)
+        calls = []
+        for c in containers:
+            kw = copy(kwargs)
+            kw['container'] = c
+            calls.append((c.host, kw))
+        d = self.parallel(self.c.attach, calls)
+        d.addCallback(lambda _: containers)
+        return d
+
+    def logs(self, *containers, **kwargs):
+        """Streams output of the containers to the `sink`, by default
+        :class:`RingSink` keeping the last 64KB of every container.
+        With `follow` set streams until the containers stop.
+        Returns deferred firing with the sink.
+        """
+        sink = kwargs.pop('sink', None) or RingSink()
+        calls = [(c.host, dict(kwargs, container=c, sink=sink))
+                 for c in containers]
+        d = self.parallel(self.c.logs, calls)
+        d.addCallback(lambda _: sink)
+        return d
+
+    def execute(self, *containers, **kwargs):
+        """Runs `cmd` in the running containers, at most `limit` at a
+        time on every host, and streams their output to the `sink`
+        (:class:`RingSink` by default). Returns list of :class:`Exec`
+        with the container, exit code and output kept by the sink.
+        """
+        cmd = kwargs.pop('cmd')
+        limit = kwargs.pop('limit', 10)
+        sink = kwargs.pop('sink', None) or RingSink()
+        semaphores = {}
+
+        def semaphore(host):
+            if host not in semaphores:
+                semaphores[host] = defer.DeferredSemaphore(limit)
+            return semaphores[host]
+
+        def done(codes):
+            getvalue = getattr(sink, 'getvalue', None)
+            return [Exec(c, code, getvalue(c) if getvalue else None)
+                    for c, code in zip(containers, codes)]
+
+        self.log.debug("Executing %s in %s", cmd, containers)
+        calls = [(c.host, dict(kwargs, container=c, cmd=cmd, sink=sink))
+                 for c in containers]
+        d = self.parallel(_limited(semaphore, self.c.execute), calls)
+        d.addCallback(done)
+        return d
+
+    def stats(self, *containers, **kwargs):
+        """Collects resource usage of the containers into `stats`
+        (new :class:`Stats` keeping `size` samples per container by
+        default). With `follow` set keeps a streaming connection per
+        container until they stop, otherwise polls a sample of every
+        container, `batch` requests at a time. Returns deferred firing
+        with the stats.
+        """
+        stats = kwargs.get('stats') or Stats(kwargs.get('size', 60))
+        follow = kwargs.get('follow', False)
+        semaphore = defer.DeferredSemaphore(kwargs.get('batch', 20))
+
+        def sample(host, container):
+            return self.c.stats(host, container, stats.add, stream=follow)
+        sample.__name__ = "stats"
+        if not follow:
+            sample = _limited(lambda host: semaphore, sample)
+
+        calls = [(c.host, {'container': c}) for c in containers]
+        d = self.parallel(sample, calls)
+        d.addCallback(lambda _: stats)
+        return d
+
+    @defer.inlineCallbacks
+    def put_archive(self, source, path, *containers):
+        """Extracts `source` file or folder to `path` in the containers.
+        Source is archived once to a temporary file in a thread and all
+        the uploads stream it at the same time.
+        """
+        archive = yield threads.deferToThread(Archive.from_path, source)
+        try:
+            calls = [(c.host, {'container': c, 'path': path,
+                               'archive': archive})
+                     for c in containers]
+            yield self.parallel(self.c.put_archive, calls, settle=True)
+        finally:
+            archive.close()
+        defer.returnValue(containers)
+
+    @defer.inlineCallbacks
+    def get_archive(self, path, directory, *containers):
+        """Downloads `path` of every container as a tar archive to
+        `directory`/<host>-<container id>.tar, streaming it to the disk
+        as it arrives. Returns list of the archives' paths.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        files = []
+        calls = []
+        for c in containers:
+            name = "{}-{}.tar".format(
+                c.host.a.netloc.replace(":", "_"), c.id[:12])
+            files.append(open(os.path.join(directory, name), "wb"))
+            calls.append((c.host, {'container': c, 'path': path,
+                                   'fileobj': files[-1]}))
+        try:
+            yield self.parallel(self.c.get_archive, calls, settle=True)
+        finally:
+            for f in files:
+                f.close()
+        defer.returnValue([f.name for f in files])
+
+    @defer.inlineCallbacks
+    def gc(self, older_than=3600, pattern=None, containers=True,
+           images=True, batch=5, interval=0.5, dry_run=False):
+        """Removes containers that exited and images that are untagged,
+        both created more than `older_than` seconds ago. With `pattern`
+        set only containers whose image matches the regular expression
+        are removed, and untagged images built on top of a matching
+        image, see :func:`cleanup.dangling_images`. Every host removes
+        `batch` items at a time with `interval` seconds pause between
+        the batches, so the daemons stay responsive. Returns
+        :class:`cleanup.Report`.
+        """
+        listed = yield self.containers(all=True, running=None)
+        exited = []
+        if containers:
+            exited = cleanup.exited_containers(listed, older_than, pattern)
+        removed = set((c.host, c.id) for c in exited)
+        remaining = _grouped_by_host(
+            [c for c in listed if (c.host, c.id) not in removed])
+
+        dangling = []
+        sizes = {}
+        if images:
+            listed = yield self.images(all=True)
+            for host, values in _grouped_by_host(listed).iteritems():
+                used = remaining.get(host, [])
+                found = cleanup.dangling_images(
+                    values, used, older_than, pattern)
+                sizes.update(cleanup.reclaimed_sizes(values, found, used))
+                dangling.extend(found)
+
+        report = cleanup.Report(exited, dangling, dry_run, sizes)
+        if not dry_run:
+            yield self._remove(
+                self.c.remove_container, exited, batch, interval, report)
+            yield self._remove(
+                self.c.remove_image, dangling, batch, interval, report)
+        self.log.info("%s", report)
+        defer.returnValue(report)
+
+    def _remove(self, method, values, batch, interval, report):
+        """Removes the values of all the hosts in parallel, `batch` at a
+        time on every host, failures are added to the report
+        """
+        @defer.inlineCallbacks
+        def remove(values):
+            for start in xrange(0, len(values), batch):
+                if start:
+                    yield task.deferLater(reactor, interval, lambda: None)
+                chunk = values[start:start + batch]
+                results = yield defer.DeferredList(
+                    [method(v.host, v) for v in chunk], consumeErrors=True)
+                for value, (ok, result) in zip(chunk, results):
+                    if not ok:
+                        report.failed.append(
+                            (value, result.getErrorMessage()))
+
+        return self._changing(
+            [v.host for v in values],
+            defer.gatherResults(
+                [remove(v) for v in _grouped_by_host(values).itervalues()]))
+
+    def _changing(self, hosts, d):
+        """Drops cached listings of the hosts once `d` fires,
+        as their containers changed
+        """
+        if self.listings is None:
+            return d
+
+        def changed(result):
+            self.listings.invalidate(hosts)
+            return result
+        return d.addBoth(changed)
+
+    def wait(self, *containers, **kwargs):
+        """
+        Waits until all the container stop, and returns a list of
+        tuples of the container and a JSON blob containing its status code.
+
+        With `events` set every host is watched with a single /events
+        stream instead of a request per container, see
+        :mod:`shipper.waiter`: `each(container, result)` is called as
+        soon as every container stops, containers still running after
+        `timeout` seconds get None and exit codes are inspected at most
+        `limit` at a time per host.
+        """
+        if kwargs.get('events'):
+            return waiter.wait(
+                self.c, containers, timeout=kwargs.get('timeout'),
+                each=kwargs.get('each'), limit=kwargs.get('limit', 10),
+                progress=self._progress("wait"))
+        calls = [(c.host, {'container': c}) for c in containers]
+        d = self.parallel(self.c.wait, calls)
+        d.addCallback(lambda responses: zip(containers, responses))
+        return d
+
+    def inspect(self, *containers):
+        calls = [(c.host, {'container': c}) for c in containers]
+        hosts = [c.host for c in containers]
+
+        def record(host, response):
+            self.history.record("inspections", host, [response])
+            return response
+
+        d = self.parallel(self.c.inspect, calls,
+                          each=record if self.history else None)
+        d.addCallback(_flatten, hosts, Container)
+        return d
+
+    @defer.inlineCallbacks
+    def run(self, image, command, **kwargs):
+        """Creates a container and runs it
+        """
+        hosts = copy(self.hosts)
+        once = kwargs.pop('once', False)
+        detailed = kwargs.pop('detailed', False)
+        if once:
+            containers = yield self.containers(
+                image=image, command=command, running=True)
+            for host, values in _grouped_by_host(containers).iteritems():
+                if len(values):
+                    hosts.remove(host)
+                    self.log.debug(
+                        "Container %s %s is already running on %s",
+                        image, command, host)
+        if not hosts:
+            defer.returnValue([])
+        containers = yield self._create_and_start(
+            hosts, image, command, detailed, kwargs)
+        defer.returnValue(containers)
+
+    @defer.inlineCallbacks
+    def snapshot(self, refresh=False, ttl=30):
+        """Returns resources snapshot of the hosts used for placement.
+        Snapshot is cached and re-gathered only if it's older than `ttl`
+        seconds or `refresh` is set.
+        """
+        key = tuple(self.hosts)
+        snapshot = self._snapshots.get(key)
+        if refresh or not (snapshot and snapshot.is_fresh(ttl)):
+            infos = yield self.parallel(self.c.info, {})
+            containers = yield self.containers(running=True)
+            details = []
+            if containers:
+                details = yield self.inspect(*containers)
+            snapshot = self._snapshots[key] = Snapshot.from_responses(
+                self.hosts, infos, containers, details)
+        defer.returnValue(snapshot)
+
+    @defer.inlineCallbacks
+    def place(self, image, command, count=1, anti_affinity=False,
+              strategy=SPREAD, refresh=False, ttl=30, **kwargs):
+        """Places `count` containers on the hosts that have room for them
+        (respecting `mem_limit`) and runs them. With `anti_affinity` set
+        every host gets at most one container of the image.
+        """
+        detailed = kwargs.pop('detailed', False)
+        snapshot = yield self.snapshot(refresh=refresh, ttl=ttl)
+        mem_limit = kwargs.get('mem_limit', 0)
+        hosts = place(snapshot, count,
+                      mem_limit=mem_limit,
+                      image=image,
+                      anti_affinity=anti_affinity,
+                      strategy=strategy)
+        self.log.debug("Placing %s %s on %s", image, command, hosts)
+        if not hosts:
+            defer.returnValue([])
+
+        def not_created(failure):
+            # cached snapshot should not keep the room for containers
+            # that do not exist
+            release(snapshot, hosts, mem_limit, image)
+            return failure
+
+        containers = yield self._create_and_start(
+            hosts, image, command, detailed, kwargs, not_created)
+        defer.returnValue(containers)
+
+    @defer.inlineCallbacks
+    def _create_and_start(self, hosts, image, command, detailed, kwargs,
+                          not_created=None):
+        volumes, binds = parse_volumes(kwargs.pop('volumes', []))
+        kwargs['volumes'] = volumes
+        config = ContainerConfig(image, command, **kwargs)
+        d = self.create_container(
+            config, hosts=hosts, name=kwargs.get('name'))
+        if not_created is not None:
+            d.addErrback(not_created)
+        containers = yield d
+
+        yield self.start(*containers,
+                         binds=binds,
+                         ports=kwargs.get('ports', []),
+                         links=kwargs.get('links', []))
+        self.log.debug(
+            "Containers(%s) %s %s started", containers, image, command)
+
+        if detailed:
+            containers = yield self.inspect(*containers)
+        defer.returnValue(containers)
+
+
+Response = namedtuple("Response", "host code content")
+
+Exec = namedtuple("Exec", "container exit_code output")
+
+
+def _settled(deferreds):
+    """Results of all the deferreds once every one has fired, fails
+    with :class:`defer.FirstError` of the first failure like
+    `gatherResults`
+    """
+    def check(results):
+        for index, (succeeded, result) in enumerate(results):
+            if not succeeded:
+                raise defer.FirstError(result, index)
+        return [result for _, result in results]
+
+    d = defer.DeferredList(deferreds, consumeErrors=True)
+    return d.addCallback(check)
+
+
+def _grouped_by_host(values):
+    grouped = {}
+    for v in values:
+        grouped.setdefault(v.host, []).append(v)
+    return grouped
+
+
+def _stream(factory, kwargs):
+    stream = kwargs.pop('stream', None)
+    format = kwargs.pop('format', 'table')
+    if stream is None:
+        return None
+    return factory(stream, format)
+
+
+def _limited(semaphore, method):
+    """Wraps `method` to be called once `semaphore(host)` is acquired.
+    The progress task of the call starts only then, so the calls
+    waiting for the semaphore are pending.
+    """
+    def limited(host, task=None, **kwargs):
+        def acquired(lock):
+            if task is not None:
+                task.start()
+            d = defer.maybeDeferred(method, host, **kwargs)
+            d.addBoth(lambda result: (lock.release(), result)[1])
+            return d
+        return semaphore(host).acquire().addCallback(acquired)
+    limited.__name__ = getattr(method, '__name__', 'call')
+    limited.starts_task = True
+    return limited
+
+
+def _concat(lists):
+    out = []
+    for values in lists:
+        out.extend(values)
+    return out
+
+
+def _flatten(values, hosts, cls):
+    out = []
+    for h, host_values in zip(hosts, values):
+        if not isinstance(host_values, list):
+            host_values = [host_values]
+        out.extend([cls(h, value) for value in host_values])
+    return out
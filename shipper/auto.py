@@ -25,6 +25,7 @@ def generate(parser, *fn):
     subparsers = parser.add_subparsers(help="Yo")
     for fn in fn:
         _from_function(subparsers, fn)
+    return subparsers
 
 
 def _from_function(subparsers, fn):
@@ -13,8 +13,10 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-import os.path
+import os
+import mmap
 import tarfile
+import tempfile
 
 from StringIO import StringIO
 
@@ -58,11 +60,80 @@ def _parse_build(path=None, fobj=None):
         return _archive_from_file(fobj), None
 
 
+class Archive(object):
+    """Tar archive written once to a temporary file and shared by many
+    uploads, every upload reads it through the same memory map
+    instead of keeping a copy of the archive.
+    """
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.length = os.fstat(fileobj.fileno()).st_size
+        self.data = ""
+        if self.length:
+            self.data = mmap.mmap(
+                fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def from_path(cls, path):
+        """Archives the folder's contents or the file"""
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            arcname = '.'
+        else:
+            arcname = os.path.basename(path)
+        f = tempfile.TemporaryFile()
+        _write_archive(f, path, arcname)
+        f.flush()
+        return cls(f)
+
+    def producer(self):
+        """Returns new body producer streaming the archive"""
+        from twisted.web.client import FileBodyProducer
+        return FileBodyProducer(_View(self.data))
+
+    def close(self):
+        if self.length:
+            self.data.close()
+        self.file.close()
+
+
+class _View(object):
+    """Read only file over the shared archive data, with its own offset"""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size=-1):
+        end = len(self.data) if size < 0 else self.offset + size
+        chunk = self.data[self.offset:end]
+        self.offset += len(chunk)
+        return chunk
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.offset
+        elif whence == os.SEEK_END:
+            offset += len(self.data)
+        self.offset = offset
+
+    def tell(self):
+        return self.offset
+
+    def close(self):
+        pass
+
+
+def _write_archive(fileobj, path, arcname='.'):
+    t = tarfile.open(mode='w', fileobj=fileobj)
+    t.add(path, arcname=arcname)
+    t.close()
+
+
 def _archive_from_folder(path):
     memfile = StringIO()
     try:
-        t = tarfile.open(mode='w', fileobj=memfile)
-        t.add(path, arcname='.')
+        _write_archive(memfile, path)
         return memfile.getvalue()
     finally:
         memfile.close()
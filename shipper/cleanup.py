@@ -0,0 +1,159 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Garbage collection of exited containers and dangling images.
+
+Candidates are selected from the listings by age and image pattern,
+removed by :meth:`shipper.AsyncShipper.gc` in small batches per host:
+
+    print Shipper(hosts).gc(older_than=24 * 3600, dry_run=True)
+"""
+import re
+import time
+
+from .utils import human_size
+
+
+class Report(object):
+    """Containers and images removed (or to be removed in dry run)
+    and the bytes reclaimed by the removed images. `sizes` are the bytes
+    freed by every image keyed by its host and id, see
+    :func:`reclaimed_sizes`, images missing there count their own size.
+    """
+
+    def __init__(self, containers, images, dry_run=False, sizes=None):
+        self.containers = containers
+        self.images = images
+        self.dry_run = dry_run
+        self.sizes = sizes or {}
+        self.failed = []
+
+    @property
+    def reclaimed(self):
+        failed = set((v.host, v.id) for v, _ in self.failed)
+        return sum(self.sizes.get((i.host, i.id), i.size or 0)
+                   for i in self.images if (i.host, i.id) not in failed)
+
+    def __str__(self):
+        return "{}{} containers, {} images, {} reclaimed, {} failed".format(
+            "Dry run: " if self.dry_run else "",
+            len(self.containers), len(self.images),
+            human_size(self.reclaimed), len(self.failed))
+
+    __repr__ = __str__
+
+
+def exited_containers(containers, older_than=0, pattern=None, now=None):
+    """Stopped containers created more than `older_than` seconds ago
+    whose image matches the `pattern` regular expression
+    """
+    now = now or time.time()
+    out = []
+    for c in containers:
+        if not c.is_stopped:
+            continue
+        if now - c.get('Created', now) < older_than:
+            continue
+        if pattern and not re.match(pattern, c.image):
+            continue
+        out.append(c)
+    return out
+
+
+def dangling_images(images, containers, older_than=0, pattern=None,
+                    now=None):
+    """Untagged images created more than `older_than` seconds ago.
+    With `pattern` set only the ones whose nearest tagged ancestor has
+    a name matching the regular expression, tagged images are never
+    removed. Images used by the `containers` and parents of other
+    images are skipped, docker removes untagged parents together with
+    the child.
+    """
+    now = now or time.time()
+    by_id = dict((i.id, i) for i in images)
+    parents = set(i.get('ParentId') for i in images)
+    used = _used(containers)
+
+    out = []
+    seen = set()
+    for i in images:
+        if i.id in seen or i.id in parents:
+            continue
+        seen.add(i.id)
+        if now - i.get('Created', now) < older_than:
+            continue
+        if not i.is_dangling:
+            continue
+        if pattern and not any(
+                re.match(pattern, t) for t in _ancestor_tags(i, by_id)):
+            continue
+        if _is_used(i, used):
+            continue
+        out.append(i)
+    return out
+
+
+def reclaimed_sizes(images, dangling, containers=()):
+    """Bytes freed by removing each of the `dangling` images keyed by
+    the host and id. Docker removes the untagged parents no other image
+    or container uses together with the image, so it's the difference
+    of VirtualSize of the image and of its nearest ancestor that stays,
+    or the sum of the removed layers' sizes for the api versions that
+    do not report VirtualSize.
+    """
+    by_id = dict((i.id, i) for i in images)
+    children = {}
+    for i in images:
+        parent = i.get('ParentId')
+        children[parent] = children.get(parent, 0) + 1
+    used = _used(containers)
+
+    sizes = {}
+    for image in dangling:
+        layers = [image]
+        seen = set([image.id])
+        parent = by_id.get(image.get('ParentId'))
+        while (parent is not None and parent.id not in seen and
+               parent.is_dangling and children.get(parent.id) == 1 and
+               not _is_used(parent, used)):
+            layers.append(parent)
+            seen.add(parent.id)
+            parent = by_id.get(parent.get('ParentId'))
+
+        virtual = image.get('VirtualSize')
+        if virtual is not None and parent is None:
+            size = virtual
+        elif virtual is not None and \
+                parent.get('VirtualSize') is not None:
+            size = virtual - parent['VirtualSize']
+        else:
+            size = sum(layer.size or 0 for layer in layers)
+        sizes[(image.host, image.id)] = size
+    return sizes
+
+
+def _used(containers):
+    """Image names and ids the containers are created from"""
+    used = set()
+    for c in containers:
+        used.add(c.image)
+        used.add(c.image.split(":")[0])
+    return used
+
+
+def _is_used(image, used):
+    names = set(image.tags) | set(t.split(":")[0] for t in image.tags)
+    return bool(names & used) or image.id in used or image.id[:12] in used
+
+
+def _ancestor_tags(image, by_id):
+    """Names of the nearest tagged ancestor of the image"""
+    seen = set()
+    parent = by_id.get(image.get('ParentId'))
+    while parent is not None and parent.id not in seen:
+        if parent.tags:
+            return parent.tags
+        seen.add(parent.id)
+        parent = by_id.get(parent.get('ParentId'))
+    return []
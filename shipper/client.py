@@ -7,33 +7,65 @@ quirks of the official docker-py client.
 """
 import re
 import json
+import time
+import shlex
 import logging
 import logging.handlers
 from copy import copy
 
 from twisted.internet import reactor
-from twisted.web.client import HTTPConnectionPool
-from twisted.internet.defer import Deferred, succeed
-from twisted.internet.protocol import Protocol
-from twisted.web.client import ResponseDone
+from twisted.web.client import HTTPConnectionPool, Agent
+from twisted.internet.defer import Deferred, succeed, maybeDeferred
+from twisted.python.failure import Failure
 import treq
-from .errors import assert_code
+from .api import Api, DEFAULT
+from .errors import assert_code, UnsupportedError
+from . import codec as _codec
+from . import streams as _streams
+from . import metrics as _metrics
+from . import hooks as _hooks
+from . import logs as _logs
 
 
 class Client(object):
     """A generic twisted-based docker client that supports all sorts of
     docker magic like streaming replies and http session hijacking on
     container attach.
+
+    Requests use the pinned api `version`, or if it's None the version
+    negotiated with every host on the first request, see :mod:`shipper.api`.
     """
 
     pool = None
     log = None
-
-    def __init__(self, version="1.6", timeout=None, log=None, pool=None):
+    operation = None
+    # negotiated apis of the hosts and requests waiting for them,
+    # shared by all the clients of the process
+    apis = {}
+    _waiting = {}
+
+    def __init__(self, version="1.6", timeout=None, log=None, pool=None,
+                 metrics=None, hooks=None, output=None, tls=None):
         self.pool = pool or HTTPConnectionPool(reactor, persistent=False)
+        # https hosts are connected with :class:`shipper.tls.TLSOptions`
+        self.agent = None
+        if tls is not None:
+            self.agent = Agent(reactor, contextFactory=tls, pool=self.pool)
         self.version = version
         self.timeout = timeout
         self.log = log or logging.getLogger(__name__)
+        self.metrics = metrics or _metrics.registry
+        self.hooks = hooks if hooks is not None else _hooks.registry
+        # lines streamed by the hosts on build and attach
+        self.output = output or _logs.HostOutput(self.log)
+
+    def traced(self, operation):
+        """Returns copy of the client that tags all the requests it makes
+        with the operation, so hooks can correlate them
+        """
+        client = copy(self)
+        client.operation = operation
+        return client
 
     def build(self, host, dockerfile, tag=None, quiet=False,
               nocache=False, rm=False):
@@ -57,28 +89,52 @@ class Client(object):
 
         container = []
         result = Deferred()
+        started = time.time()
+        received = [0]
+        codes = []
+        traced = self._trace(host, 'POST', 'build')
 
         def on_content(line):
+            received[0] += len(line)
             if line:
-                self.log.debug("{}: {}".format(host, line.strip()))
+                self.output.line(host, line)
                 match = re.search(r'Successfully built ([0-9a-f]+)', line)
                 if match:
                     container.append(match.group(1))
 
-        d = treq.post(
-            url=self._make_url(host.url, 'build'),
-            data=dockerfile.archive,
-            params=params,
-            headers=headers,
-            pool=self.pool)
-
-        def on_done(*args, **kwargs):
+        def on_response(response):
+            codes.append(response.code)
+            self._fire(traced, "first_byte", response)
+            return treq.collect(response, on_content)
+
+        def send():
+            self._fire(traced, "before_request")
+            return treq.post(
+                url=self._make_url(host, 'build'),
+                data=dockerfile.archive,
+                params=params,
+                headers=headers,
+                **self._connection())
+
+        d = self._negotiated(host, send)
+
+        def on_done(outcome):
+            self._record(
+                host, 'POST', 'build', started,
+                code=codes[0] if codes else None,
+                received=received[0],
+                sent=len(dockerfile.archive or ''),
+                error=None if container else "BuildFailed")
             if not container:
-                result.errback(RuntimeError("Build failed"))
+                failure = Failure(RuntimeError("Build failed"))
+                self._fire(traced, "error", error=outcome
+                           if isinstance(outcome, Failure) else failure)
+                result.errback(failure)
             else:
+                self._fire(traced, "after_response")
                 result.callback(container[0])
 
-        d.addCallback(treq.collect, on_content)
+        d.addCallback(on_response)
         d.addBoth(on_done)
         return result
 
@@ -99,35 +155,72 @@ class Client(object):
                    quiet=False, all=False, trunc=True, latest=False,
                    since=None, before=None, limit=-1, pretty=False,
                    running=None, image=None):
-        params = {
-            'limit': 1 if latest else limit,
-            'only_ids': 1 if quiet else 0,
-            'all': 1 if all else 0,
-            'trunc_cmd': 1 if trunc else 0,
-            'since': since,
-            'before': before
-        }
-        return self.get(host, 'containers/ps', params=params)
-
-    def create_container(self, host, config, name=None):
+        """Lists containers, with `all` set hosts that support filters
+        send only the running or exited ones if `running` is set
+        """
+        def list():
+            params = {
+                'limit': 1 if latest else limit,
+                'only_ids': 1 if quiet else 0,
+                'all': 1 if all else 0,
+                'trunc_cmd': 1 if trunc else 0,
+                'since': since,
+                'before': before
+            }
+            if all and running is not None and \
+                    self.supports(host, 'filters'):
+                params['filters'] = json.dumps(
+                    {'status': ['running' if running else 'exited']})
+            return self.get(host, 'containers/ps', params=params)
+        return self._negotiated(host, list)
+
+    def create_container(self, host, config, name=None, encoded=None):
+        """Creates the container, `config` is :class:`ContainerConfig`
+        shaped for the api of the host or its already encoded json.
+        `encoded` caches the bodies by api version, so calls sharing it
+        encode the config once per version.
+        """
         params = {}
         if name:
             params['name'] = name
+        return self._negotiated(
+            host, self._create, host, config, params, encoded)
+
+    def _create(self, host, config, params, encoded):
+        if not isinstance(config, str):
+            api = self._api(host)
+            encoded = {} if encoded is None else encoded
+            if api.version not in encoded:
+                encoded[api.version] = _codec.encode(config.to_json(api))
+            config = encoded[api.version]
         return self.post(
             host,
             "containers/create",
             params=params,
-            data=config.to_json(),
+            data=config,
             post_json=True)
 
+    def info(self, host):
+        """Returns system wide information about the host"""
+        return self.get(host, "info", expect_json=True)
+
+    def remove_container(self, host, container, volumes=False, force=False):
+        return self.delete(
+            host, "containers/{}".format(container.id),
+            params={'v': 1 if volumes else 0, 'force': 1 if force else 0},
+            expect_json=False)
+
+    def remove_image(self, host, image):
+        return self.delete(
+            host, "images/{}".format(image.id), expect_json=False)
+
     def inspect(self, host, container):
         return self.get(
             host, "containers/{}/json".format(container.id),
             expect_json=True)
 
     def start(self, host, container, binds=None, port_binds=None, links=[]):
-        self.log.debug("Starting {} {} {}".format(container,
-                                                  binds, port_binds))
+        self.log.debug("Starting %s %s %s", container, binds, port_binds)
         data = {}
         if binds:
             data['Binds'] = binds
@@ -143,12 +236,15 @@ class Client(object):
             expect_json=False)
 
     def stop(self, host, container, wait_seconds=5):
-        self.log.debug("Stopping {}".format(container))
+        self.log.debug("Stopping %s", container)
         return self.post(host, "containers/{}/stop".format(container.id),
                          params={'t': wait_seconds},
                          expect_json=False)
 
     def attach(self, host, container, **kwargs):
+        """Attaches to the container and logs its output,
+        stops once the `stop_line` regular expression matches
+        """
         def c(v):
             return 1 if kwargs.get(v) else 0
         params = {
@@ -158,33 +254,311 @@ class Client(object):
             'stdout': c('stdout'),
             'stderr': c('stderr')
         }
+        sink = _streams.LineSink(
+            lambda container, line: self.output.line(host, line))
+        return self._stream(
+            host, container, 'containers/{}/attach'.format(container.id),
+            sink, params=params, stop_line=kwargs.get('stop_line'))
+
+    def logs(self, host, container, sink, follow=False,
+             stdout=True, stderr=True, stop_line=None):
+        """Streams output of the container to the sink (see
+        :mod:`shipper.streams`), with `follow` set keeps streaming
+        until the container stops. Returns deferred firing
+        with the sink.
+        """
+        params = {
+            'logs': 1,
+            'stream': 1 if follow else 0,
+            'stdin': 0,
+            'stdout': 1 if stdout else 0,
+            'stderr': 1 if stderr else 0
+        }
+        return self._stream(
+            host, container, 'containers/{}/attach'.format(container.id),
+            sink, params=params, stop_line=stop_line)
+
+    def execute(self, host, container, cmd, sink, stdout=True, stderr=True):
+        """Runs the command in the running container streaming its output
+        to the sink. Returns deferred firing with the exit code.
+        Needs docker api 1.15 or later.
+        """
+        return self._negotiated(
+            host, self._execute, host, container, cmd, sink, stdout, stderr)
 
-        result = Deferred()
+    def _execute(self, host, container, cmd, sink, stdout, stderr):
+        self.require(host, 'exec')
+        if isinstance(cmd, basestring):
+            cmd = shlex.split(cmd)
+        d = self.post(
+            host, "containers/{}/exec".format(container.id),
+            data={
+                'AttachStdin': False,
+                'AttachStdout': stdout,
+                'AttachStderr': stderr,
+                'Tty': False,
+                'Cmd': cmd
+            },
+            post_json=True)
 
-        def on_content(line):
-            if line:
-                self.log.debug("{}: {}".format(host, line.strip()))
+        def start(reply):
+            path = "exec/{}/start".format(reply['Id'])
+            d = self._stream(
+                host, container, path, sink,
+                data=json.dumps({'Detach': False, 'Tty': False}))
+            d.addCallback(lambda _: self.get(
+                host, "exec/{}/json".format(reply['Id'])))
+            return d
+
+        d.addCallback(start)
+        d.addCallback(lambda details: details['ExitCode'])
+        return d
 
-        url = self._make_url(
-            host.url, 'containers/{}/attach'.format(container.id))
-        d = treq.post(
-            url=url,
-            params=params,
-            pool=self.pool)
+    def put_archive(self, host, container, path, archive):
+        """Uploads :class:`shipper.build.Archive` shared by the uploads
+        and extracts it to the path in the container.
+        Needs docker api 1.20 or later.
+        """
+        return self._negotiated(
+            host, self._put_archive, host, container, path, archive)
+
+    def _put_archive(self, host, container, path, archive):
+        self.require(host, 'archive')
+        return self.request(
+            treq.put, host, "containers/{}/archive".format(container.id),
+            params={'path': path},
+            data=archive.producer(),
+            headers={'Content-Type': ['application/x-tar']},
+            expect_json=False)
+
+    def get_archive(self, host, container, path, fileobj):
+        """Streams tar archive of the path in the container to the file
+        as it arrives. Returns deferred firing with the file.
+        Hosts older than api 1.20 copy the path instead.
+        """
+        return self._negotiated(
+            host, self._get_archive, host, container, path, fileobj)
+
+    def _get_archive(self, host, container, path, fileobj):
+        started = time.time()
+        if self.supports(host, 'archive'):
+            api = "containers/{}/archive".format(container.id)
+            method = 'GET'
+        else:
+            api = "containers/{}/copy".format(container.id)
+            method = 'POST'
+        traced = self._trace(host, method, api)
+        self._fire(traced, "before_request")
+        if method == 'GET':
+            d = treq.get(
+                url=self._make_url(host, api),
+                params={'path': path},
+                **self._connection())
+        else:
+            d = treq.post(
+                url=self._make_url(host, api),
+                data=json.dumps({'Resource': path}),
+                headers={'Content-Type': ['application/json']},
+                **self._connection())
+        codes = []
+        received = [0]
+
+        def write(data):
+            received[0] += len(data)
+            fileobj.write(data)
+
+        def on_response(response):
+            codes.append(response.code)
+            self._fire(traced, "first_byte", response)
+            if response.code >= 400:
+                d = treq.content(response)
+                d.addCallback(lambda content: assert_code(
+                    response.code, content))
+                return d
+            return treq.collect(response, write)
+
+        def on_done(_):
+            self._record(host, method, api, started, code=codes[0],
+                         received=received[0])
+            self._fire(traced, "after_response")
+            return fileobj
 
-        d.addCallback(_Reader.listen, kwargs.get('stop_line'))
+        def on_error(failure):
+            self._record(host, method, api, started,
+                         code=codes[0] if codes else None,
+                         error=failure.type.__name__)
+            self._fire(traced, "error", error=failure)
+            return failure
+
+        d.addCallback(on_response)
+        d.addCallbacks(on_done, on_error)
+        return d
+
+    def stats(self, host, container, callback, stream=True):
+        """Calls `callback(container, stats)` with every stats sample of
+        the container, with `stream` set keeps receiving them (about one
+        per second) until the container stops. Needs docker api 1.17,
+        hosts older than 1.19 stream and the reply is closed after the
+        first sample.
+        """
+        return self._negotiated(
+            host, self._stats, host, container, callback, stream)
+
+    def _stats(self, host, container, callback, stream):
+        self.require(host, 'stats')
+        api = "containers/{}/stats".format(container.id)
+        started = time.time()
+        codes = []
+        # old hosts have no single sample replies
+        limit = None
+        if not stream and not self.supports(host, 'stats_once'):
+            limit = 1
+        traced = self._trace(host, 'GET', api)
+
+        def on_response(response):
+            codes.append(response.code)
+            self._fire(traced, "first_byte", response)
+            if response.code >= 400:
+                d = treq.content(response)
+                d.addCallback(lambda content: assert_code(
+                    response.code, content))
+                return d
+            return _streams.JSONReader.listen(
+                response, lambda stats: callback(container, stats), limit)
+
+        def on_done(reader):
+            self._record(host, 'GET', api, started, code=codes[0],
+                         received=reader.received if reader else 0)
+            self._fire(traced, "after_response")
 
         def on_error(failure):
-            pass
+            self._record(host, 'GET', api, started,
+                         code=codes[0] if codes else None,
+                         error=failure.type.__name__)
+            self._fire(traced, "error", error=failure)
+            return failure
+
+        self._fire(traced, "before_request")
+        d = treq.get(
+            url=self._make_url(host, api),
+            params={'stream': 1 if stream else 0},
+            **self._connection())
+        d.addCallback(on_response)
+        d.addCallbacks(on_done, on_error)
+        return d
+
+    def events(self, host, callback, events=None, since=None):
+        """Streams events of the host to `callback` as decoded json
+        objects. Returns deferred firing with
+        :class:`streams.JSONReader` once the stream is open: its
+        `finished` deferred fires when the stream ends and `stop()`
+        ends it. Hosts with api 1.18 send only the `events` listed,
+        older ones send all of them.
+        """
+        return self._negotiated(
+            host, self._events, host, callback, events, since)
+
+    def _events(self, host, callback, events, since):
+        started = time.time()
+        params = {'since': since}
+        if events and self.supports(host, 'event_filters'):
+            params['filters'] = json.dumps({'event': list(events)})
+        traced = self._trace(host, 'GET', "events")
+
+        def on_response(response):
+            self._fire(traced, "first_byte", response)
+            if response.code >= 400:
+                d = treq.content(response)
+                d.addCallback(lambda content: assert_code(
+                    response.code, content))
+                return d
+            reader = _streams.JSONReader(Deferred(), callback)
+            reader.finished.addBoth(on_finished, response.code, reader)
+            response.deliverBody(reader)
+            return reader
+
+        def on_finished(result, code, reader):
+            error = None
+            if isinstance(result, Failure):
+                error = result.type.__name__
+                self._fire(traced, "error", error=result)
+            else:
+                self._fire(traced, "after_response")
+            self._record(host, 'GET', "events", started, code=code,
+                         received=reader.received, error=error)
+            return result
+
+        def on_error(failure):
+            self._record(host, 'GET', "events", started,
+                         error=failure.type.__name__)
+            self._fire(traced, "error", error=failure)
+            return failure
+
+        self._fire(traced, "before_request")
+        d = treq.get(
+            url=self._make_url(host, "events"),
+            params=_remove_empty(params),
+            **self._connection())
+        d.addCallback(on_response)
         d.addErrback(on_error)
-        return result
+        return d
+
+    def _stream(self, host, container, path, sink, params=None, data=None,
+                stop_line=None):
+        """Posts the request and streams demultiplexed
+        output of the container to the sink
+        """
+        started = time.time()
+        codes = []
+        kwargs = {}
+        if data is not None:
+            kwargs['data'] = data
+            kwargs['headers'] = {'Content-Type': ['application/json']}
+        kwargs.update(self._connection())
+        traced = self._trace(host, 'POST', path)
+
+        def send():
+            self._fire(traced, "before_request")
+            return treq.post(
+                url=self._make_url(host, path), params=params, **kwargs)
+
+        d = self._negotiated(host, send)
+
+        def on_response(response):
+            codes.append(response.code)
+            self._fire(traced, "first_byte", response)
+            if response.code >= 400:
+                d = treq.content(response)
+                d.addCallback(lambda content: assert_code(
+                    response.code, content))
+                return d
+            return _streams.StreamReader.listen(
+                response, container, sink, stop_line)
+
+        def on_done(reader):
+            self._record(host, 'POST', path, started, code=codes[0],
+                         received=reader.received if reader else 0,
+                         sent=_length(data))
+            self._fire(traced, "after_response")
+            return sink
+
+        def on_error(failure):
+            self._record(host, 'POST', path, started,
+                         code=codes[0] if codes else None,
+                         error=failure.type.__name__)
+            self._fire(traced, "error", error=failure)
+            return failure
+
+        d.addCallback(on_response)
+        d.addCallbacks(on_done, on_error)
+        return d
 
     def wait(self, host, container):
         """Waits for the container to stop and gets the exit code"""
 
         def log_results(results):
-            self.log.debug("{0} has stopped with exit code {1}".format(
-                container, results['StatusCode']))
+            self.log.debug("%s has stopped with exit code %s",
+                           container, results['StatusCode'])
             return results
 
         d = self.post(
@@ -194,42 +568,145 @@ class Client(object):
         d.addCallback(log_results)
         return d
 
-    def request(self, method, host, path, **kwargs):
+    def api(self, host):
+        """Returns deferred firing with :class:`shipper.api.Api` of the
+        host, its `/version` is requested once and cached
+        """
+        if self.version:
+            return succeed(Api(self.version))
+        api = self.apis.get(host)
+        if api is not None:
+            return succeed(api)
+        d = Deferred()
+        waiting = self._waiting.get(host)
+        if waiting is not None:
+            waiting.append(d)
+            return d
+        self._waiting[host] = [d]
+        self._negotiate(host)
+        return d
 
-        kwargs = copy(kwargs)
-        kwargs['params'] = _remove_empty(kwargs.get('params'))
-        kwargs['pool'] = self.pool
+    def supports(self, host, feature):
+        """Whether the api of the host has the feature, hosts that were
+        not negotiated yet are assumed to speak the default version
+        """
+        return self._api(host).supports(feature)
+
+    def require(self, host, feature):
+        if not self.supports(host, feature):
+            raise UnsupportedError("{} api {} does not support {}".format(
+                host, self._api(host).version, feature))
+
+    def _api(self, host):
+        if self.version:
+            return Api(self.version)
+        return self.apis.get(host) or Api(DEFAULT)
+
+    def _negotiate(self, host):
+        def negotiate(reply):
+            if not isinstance(reply, dict):
+                reply = {}
+            return Api.negotiate(reply.get('ApiVersion'))
+
+        def done(api):
+            self.apis[host] = api
+            self.log.debug("%s speaks api %s", host, api.version)
+            for d in self._waiting.pop(host):
+                d.callback(api)
+
+        def failed(failure):
+            # not cached, the next request tries again
+            for d in self._waiting.pop(host):
+                d.errback(failure)
+
+        d = self._request(treq.get, host, "version", versioned=False)
+        d.addCallback(negotiate)
+        d.addCallbacks(done, failed)
+
+    def _negotiated(self, host, fn, *args, **kwargs):
+        """Calls `fn` once the api of the host is known"""
+        if self.version or host in self.apis:
+            return maybeDeferred(fn, *args, **kwargs)
+        d = self.api(host)
+        d.addCallback(lambda _: fn(*args, **kwargs))
+        return d
 
-        post_json = kwargs.pop('post_json', False)
+    def request(self, method, host, path, **kwargs):
+        return self._negotiated(
+            host, self._request, method, host, path, **kwargs)
+
+    def _request(self, method, host, path, params=None, post_json=False,
+                 expect_json=True, versioned=True, **kwargs):
+        """Sends the request and decodes the reply. Json bodies that
+        are already encoded strings are sent as is, so the body shared
+        by many hosts is encoded once.
+        """
+        kwargs['params'] = _remove_empty(params)
+        kwargs.update(self._connection())
         if post_json:
             headers = kwargs.setdefault('headers', {})
             headers['Content-Type'] = ['application/json']
-            kwargs['data'] = json.dumps(kwargs['data'])
+            kwargs['data'] = _codec.encode(kwargs['data'])
+        kwargs['url'] = self._make_url(host, path, versioned)
 
-        kwargs['url'] = self._make_url(host.url, path)
-        expect_json = kwargs.pop('expect_json', True)
+        name = _method_name(method)
+        started = time.time()
+        recorded = []
 
-        result = Deferred()
-        d = method(**kwargs)
+        traced = self._trace(host, name, path)
+        self._fire(traced, "before_request")
 
         def content(response):
-            content = []
-            cd = treq.collect(response, content.append)
-            cd.addCallback(lambda _: ''.join(content))
-            cd.addCallback(done, response)
+            self._fire(traced, "first_byte", response)
+            chunks = []
+            cd = treq.collect(response, chunks.append)
+            cd.addCallback(done, response, chunks)
             return cd
 
-        def done(content, response):
+        def done(_, response, chunks):
+            content = ''.join(chunks)
+            recorded.append(True)
+            self._record(host, name, path, started,
+                         code=response.code, received=len(content),
+                         sent=_length(kwargs.get('data')))
             assert_code(response.code, content)
             if expect_json:
-                content = json.loads(content)
+                content = _codec.loads(content)
+            self._fire(traced, "after_response")
             return content
 
-        d.addCallback(content)
-        d.addCallback(result.callback)
-        d.addErrback(result.errback)
+        def error(failure):
+            if not recorded:
+                self._record(host, name, path, started,
+                             sent=_length(kwargs.get('data')),
+                             error=failure.type.__name__)
+            self._fire(traced, "error", error=failure)
+            return failure
 
-        return result
+        return method(**kwargs).addCallback(content).addErrback(error)
+
+    def _trace(self, host, method, path):
+        """Returns :class:`hooks.Request` of the request if there are
+        hooks to see it, None otherwise
+        """
+        if not self.hooks:
+            return None
+        return _hooks.Request(host, method, path, self.operation)
+
+    def _fire(self, traced, event, response=None, error=None):
+        """Fires the hooks of the traced request, if it's traced"""
+        if traced is None:
+            return
+        now = time.time()
+        if event == "before_request":
+            traced.started = now
+        elif event == "first_byte":
+            traced.first_byte = now
+            traced.code = response.code
+        else:
+            traced.finished = now
+            traced.error = error
+        self.hooks.fire(event, traced)
 
     def get(self, host, path, **kwargs):
         return self.request(treq.get, host, path, **kwargs)
@@ -238,43 +715,44 @@ class Client(object):
         return self.request(treq.post, host, path, **kwargs)
 
     def delete(self, host, path, **kwargs):
-        return self.request(treq.post, host, path, **kwargs)
+        return self.request(treq.delete, host, path, **kwargs)
 
-    def _make_url(self, url, method):
-        return "{}/v{}/{}".format(url, self.version, method)
+    def _connection(self):
+        """Arguments of treq calls: the pool and the agent for https"""
+        if self.agent is None:
+            return {'pool': self.pool}
+        return {'pool': self.pool, 'agent': self.agent}
 
+    def _make_url(self, host, method, versioned=True):
+        if not versioned:
+            return "{}/{}".format(host.url, method)
+        return "{}/v{}/{}".format(host.url, self._api(host).version, method)
 
-def _remove_empty(params):
-    params = params or {}
-    clean_params = copy(params)
-    for key, val in params.iteritems():
-        if val is None:
-            del clean_params[key]
-    return clean_params
+    def _record(self, host, method, path, started, code=None,
+                received=0, sent=0, error=None):
+        self.metrics.record(
+            host.a.netloc, method, path, time.time() - started,
+            code=code, bytes_in=received, bytes_out=sent, error=error)
 
 
-class _Reader(Protocol):
-    def __init__(self, finished, stop_line):
-        self.finished = finished
-        if stop_line:
-            self.stop_line = re.compile(stop_line, re.I)
-        else:
-            self.stop_line = None
+def _method_name(method):
+    return getattr(method, '__name__', 'request').upper()
 
-    def dataReceived(self, data):
-        if self.stop_line and self.stop_line.search(data):
-            self.transport._producer.looseConnection()
 
-    def connectionLost(self, reason):
-        if reason.check(ResponseDone):
-            self.finished.callback(None)
-            return
-        self.finished.errback(reason)
+def _length(data):
+    if isinstance(data, basestring):
+        return len(data)
+    # body producers know their length
+    length = getattr(data, 'length', 0)
+    return length if isinstance(length, (int, long)) else 0
 
-    @classmethod
-    def listen(cls, response, data):
-        if response.length == 0:
-            return succeed(None)
-        d = Deferred()
-        response.deliverBody(cls(d, data))
-        return d
+
+def _remove_empty(params):
+    """Params without the unset values, copied only if there are any"""
+    if not params:
+        return {}
+    for val in params.itervalues():
+        if val is None:
+            return dict((key, val) for key, val in params.iteritems()
+                        if val is not None)
+    return params
@@ -0,0 +1,57 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""JSON encoder and decoder of the docker api requests and replies.
+
+Stdlib json is used by default, a faster codec is picked when installed:
+
+    from shipper import codec
+    codec.use("ujson")      # or a module with dumps and loads
+    codec.use()             # fastest of ujson, simplejson and json
+
+SHIPPER_JSON environment variable selects the codec at import time.
+Callers look up `codec.dumps` and `codec.loads` on every call, so the
+codec can be switched at runtime.
+"""
+import os
+import json
+import importlib
+
+# tried in order by use() without the name
+FASTEST = ("ujson", "simplejson", "json")
+
+name = "json"
+dumps = json.dumps
+loads = json.loads
+
+
+def use(codec=None):
+    """Switches the codec to the named module or a module like object
+    with `dumps` and `loads`, returns the name of the codec in use.
+    Raises ImportError if the named codec is not installed.
+    """
+    global name, dumps, loads
+    if codec is None:
+        for candidate in FASTEST:
+            try:
+                return use(candidate)
+            except ImportError:
+                continue
+    if isinstance(codec, basestring):
+        codec = importlib.import_module(codec)
+    name = getattr(codec, "__name__", repr(codec))
+    dumps = codec.dumps
+    loads = codec.loads
+    return name
+
+
+def encode(data):
+    """Body of the request, strings are passed as already encoded"""
+    if isinstance(data, str):
+        return data
+    return dumps(data)
+
+
+if os.environ.get("SHIPPER_JSON"):
+    use(os.environ["SHIPPER_JSON"])
@@ -6,6 +6,7 @@ import six
 import shlex
 
 from .utils import from_epoch, parse_ports
+from .record import Record
 
 
 class ContainerConfig(dict):
@@ -39,22 +40,31 @@ class ContainerConfig(dict):
             'StdinOnce': get('stdin_once', False)
         })
 
-    def to_json(self):
-        return self
+    def to_json(self, api=None):
+        """Body of the create request for the :class:`shipper.api.Api`,
+        memory limit is in HostConfig since 1.18
+        """
+        if api is None or not api.supports('host_config'):
+            return self
+        body = dict(self)
+        host_config = dict(body.get('HostConfig') or {})
+        host_config['Memory'] = body.pop('Memory')
+        body['HostConfig'] = host_config
+        return body
 
 
-class Container(dict):
+class Container(Record):
     """Helper wrapper around container dictionary
     to ease access to certain properties
     """
-    def __init__(self, host, values):
-        dict.__init__(self)
-        self.host = host
-        self.update(values)
+    __slots__ = ()
+
+    _id = 'Id'
+    _interned = ('Image',)
 
     def __str__(self):
         return "Container(host={}, {})".format(
-            self.host, dict.__str__(self))
+            self.host, self.to_dict())
 
     @property
     def id(self):
@@ -66,11 +76,11 @@ class Container(dict):
 
     @property
     def is_running(self):
-        return self.status.startswith("Up")
+        return (self.get('Status') or "").startswith("Up")
 
     @property
     def is_stopped(self):
-        return self.status.startswith("Exit")
+        return (self.get('Status') or "").startswith("Exit")
 
     @property
     def image(self):
@@ -78,7 +88,7 @@ class Container(dict):
 
     @property
     def created(self):
-        return from_epoch(self['Created'])
+        return self._cached('created', lambda: from_epoch(self['Created']))
 
     @property
     def status(self):
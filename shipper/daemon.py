@@ -0,0 +1,341 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Long lived shipper daemon.
+
+Daemon keeps the reactor, persistent connections, placement snapshots,
+container listings, metrics, the api versions negotiated with the hosts,
+the host inventory and the loaded scripts warm between the commands:
+
+    python -m shipper.daemon --socket /tmp/shipper.sock
+
+Runner scripts forward their commands to the daemon over the UNIX socket
+when SHIPPER_SOCKET points to it, the output is streamed back and the
+script exits with the command's exit code:
+
+    export SHIPPER_SOCKET=/tmp/shipper.sock
+    python env.py ps --all
+
+Scripts are loaded once and reloaded when changed. Commands run in the
+daemon's threads, so relative paths are resolved against the daemon's
+working directory. If no daemon is listening the command runs locally.
+Output of the command goes back to its client: what the command's thread
+prints, streams passed to the shipper's methods (e.g.
+`s.containers(stream=sys.stdout)`) that are written in the reactor
+thread, and records the command's thread logs.
+
+Container listings are shared by the commands for `--listings-ttl`
+seconds, creating, starting, stopping or removing containers drops the
+listings of their hosts, see :mod:`shipper.listings`.
+"""
+import os
+import sys
+import imp
+import json
+import socket
+import hashlib
+import logging
+import argparse
+import threading
+
+from twisted.internet import reactor, threads
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import LineReceiver
+
+from . import auto
+from . import runner
+from .shipper import Shipper
+from .listings import Listings
+
+DEFAULT_SOCKET = "/tmp/shipper.sock"
+FAILED = -1
+
+log = logging.getLogger(__name__)
+
+# connection of the command executed by the current thread
+_local = threading.local()
+
+
+class _Sink(object):
+    """Output of a single command, can be written from any thread"""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def write(self, data):
+        self.connection.send(self.name, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class _Output(object):
+    """Sends output of the commands to their clients,
+    everything else goes to the wrapped stream
+    """
+
+    def __init__(self, stream, name):
+        self.stream = stream
+        self.name = name
+
+    def bound(self):
+        """Returns the output of the current thread's command, so it
+        can be written later by the other threads, see `Shipper._call`
+        """
+        connection = getattr(_local, 'connection', None)
+        if connection is None:
+            return self
+        return _Sink(connection, self.name)
+
+    def write(self, data):
+        connection = getattr(_local, 'connection', None)
+        if connection is None:
+            self.stream.write(data)
+        else:
+            connection.send(self.name, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if getattr(_local, 'connection', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class _Tag(logging.Filter):
+    """Tags records with the connection of the command
+    logging them, runs in the caller's thread
+    """
+
+    def filter(self, record):
+        record.connection = getattr(_local, 'connection', None)
+        return True
+
+
+class _Untagged(logging.Filter):
+    """Skips records of the commands"""
+
+    def filter(self, record):
+        return getattr(record, 'connection', None) is None
+
+
+class _CommandLog(logging.Handler):
+    """Sends records of the commands to their clients,
+    runs in the log listener's thread
+    """
+
+    def emit(self, record):
+        connection = getattr(record, 'connection', None)
+        if connection is not None:
+            connection.send('err', self.format(record) + "\n")
+
+
+class _Command(LineReceiver):
+    """Receives a single command request and streams back json lines
+    with the output: {"out": ...}, {"err": ...} and finally {"exit": code}
+    """
+    delimiter = "\n"
+    MAX_LENGTH = 1024 * 1024
+
+    def connectionMade(self):
+        self.received = False
+
+    def lineReceived(self, line):
+        if self.received:
+            return
+        self.received = True
+        try:
+            request = json.loads(line)
+            script = self.factory.daemon.load(request['script'])
+        except Exception as e:
+            log.exception("Failed to load the command")
+            self.send('err', "Failed to load the command: {}\n".format(e))
+            self.finish(FAILED)
+            return
+
+        d = threads.deferToThread(
+            self.factory.daemon.execute, self, script, request['argv'])
+        d.addCallback(self.finish)
+
+    def send(self, name, data):
+        """Sends output, safe to call from any thread"""
+        if isinstance(data, str):
+            data = data.decode('utf-8', 'replace')
+        reactor.callFromThread(self._write, {name: data})
+
+    def finish(self, code):
+        reactor.callFromThread(self._write, {'exit': code})
+        reactor.callFromThread(self.transport.loseConnection)
+
+    def _write(self, message):
+        self.transport.write(json.dumps(message) + "\n")
+
+
+class _Script(object):
+    """Commands of the loaded runner script"""
+
+    def __init__(self, path, mtime, doc, functions):
+        self.path = path
+        self.mtime = mtime
+        self.doc = doc
+        self.functions = functions
+
+
+class Daemon(object):
+    """Listens on the UNIX socket and executes commands
+    of the runner scripts
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, persistent=True, ttl=5):
+        self.path = path
+        self.persistent = persistent
+        self.ttl = ttl
+        self.scripts = {}
+        self.port = None
+        self.streams = None
+
+    def start(self):
+        self.streams = sys.stdout, sys.stderr
+        sys.stdout = _Output(sys.stdout, 'out')
+        sys.stderr = _Output(sys.stderr, 'err')
+
+        kwargs = {'persistent': self.persistent}
+        tls = runner._tls()
+        if tls is not None:
+            kwargs.update(persistent=True, tls=tls)
+        Shipper.startup(**kwargs)
+        Shipper.snapshots = {}
+        Shipper.listings = Listings(self.ttl)
+        self._route_logs()
+
+        self._remove_stale_socket()
+        factory = Factory()
+        factory.protocol = _Command
+        factory.daemon = self
+        self.port = reactor.listenUNIX(self.path, factory, mode=0600)
+        log.info("Shipper daemon is listening on %s", self.path)
+
+    def _route_logs(self):
+        """Records logged by the commands go to their clients
+        instead of the daemon's console
+        """
+        if Shipper.log is None or Shipper.listener is None:
+            return
+        for h in Shipper.log.handlers:
+            h.addFilter(_Tag())
+        handler = _CommandLog()
+        for h in Shipper.listener.handlers:
+            if isinstance(h, logging.StreamHandler) and \
+                    isinstance(h.stream, _Output):
+                h.addFilter(_Untagged())
+                handler.setFormatter(h.formatter)
+        Shipper.listener.addHandler(handler)
+
+    def stop(self):
+        sys.stdout, sys.stderr = self.streams
+        Shipper.snapshots = None
+        Shipper.listings = None
+        d = self.port.stopListening()
+        d.addCallback(lambda _: Shipper.pool.closeCachedConnections())
+        return d
+
+    def load(self, path):
+        """Returns commands of the script, importing it only
+        if it's new or changed since the last load
+        """
+        mtime = os.path.getmtime(path)
+        script = self.scripts.get(path)
+        if script is None or script.mtime != mtime:
+            name = "shipper_script_" + hashlib.md5(path).hexdigest()
+            with runner.collecting() as functions:
+                module = imp.load_source(name, path)
+            script = self.scripts[path] = _Script(
+                path, mtime, module.__doc__, functions)
+        return script
+
+    def execute(self, connection, script, argv):
+        """Parses arguments and calls the command, returns exit code.
+        Called in a thread, its output goes to the connection.
+        """
+        _local.connection = connection
+        try:
+            parser = argparse.ArgumentParser(
+                prog=os.path.basename(script.path),
+                description=script.doc or "")
+            auto.generate(parser, *script.functions)
+            args = parser.parse_args(argv)
+            args.fn(args)
+        except SystemExit as e:
+            return _exit_code(e.code)
+        except:
+            log.exception("Exception calling shipper!")
+            return FAILED
+        else:
+            return 0
+        finally:
+            if Shipper.listener is not None:
+                # records of the command are sent before its exit code
+                Shipper.listener.flush()
+            _local.connection = None
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.path):
+            return
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(self.path)
+        except socket.error:
+            os.unlink(self.path)
+        else:
+            raise RuntimeError(
+                "Daemon is already listening on {}".format(self.path))
+        finally:
+            s.close()
+
+
+def _exit_code(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write("{}\n".format(code))
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shipper daemon")
+    parser.add_argument(
+        "--socket", default=os.environ.get("SHIPPER_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--no-persistent", dest="persistent",
+                        action="store_false",
+                        help="close connections to the docker hosts after "
+                        "every request, ignored with TLS")
+    parser.add_argument("--listings-ttl", type=float, default=5,
+                        help="seconds the commands share container listings")
+    parser.add_argument("--threads", type=int, default=10,
+                        help="commands executed at the same time")
+    args = parser.parse_args()
+
+    reactor.suggestThreadPoolSize(args.threads)
+    daemon = Daemon(args.socket, persistent=args.persistent,
+                    ttl=args.listings_ttl)
+    daemon.start()
+    reactor.addSystemEventTrigger("before", "shutdown", daemon.stop)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -25,3 +25,11 @@ def assert_code(code, message):
     elif 500 <= code < 600:
         raise RuntimeError('{} Server Error: {}'.format(
             code, message))
+
+
+class PlacementError(RuntimeError):
+    """Raised when requested containers do not fit on the hosts."""
+
+
+class UnsupportedError(RuntimeError):
+    """Raised when api version of the host lacks the feature."""
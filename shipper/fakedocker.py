@@ -0,0 +1,546 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Fake docker daemon for tests and benchmarks.
+
+FakeFleet starts many fake daemons on local ports, each one impersonating
+a docker host with its own containers and images. Latency distribution,
+failure rate and payload sizes are configurable per endpoint:
+
+    fleet = FakeFleet(100, containers=10000,
+                      latency={"containers/ps": lognormal(0.05, 0.5)},
+                      failures={"containers/create": 0.01})
+    Shipper(fleet.hosts).containers()
+
+Replies have the shape of the api version of the request, e.g. images
+are listed with Repository and Tag before 1.7 and memory limits are in
+HostConfig since 1.18.
+
+Fleet can also be started as a separate process, so it does not compete
+with the client for the CPU:
+
+    python -m shipper.fakedocker --hosts 100 --containers 10000
+"""
+import re
+import json
+import math
+import struct
+import tarfile
+from StringIO import StringIO
+import random
+import hashlib
+import itertools
+
+from twisted.internet import reactor, defer
+from twisted.protocols.policies import WrappingFactory
+from twisted.web.resource import Resource
+from twisted.web.server import Site, NOT_DONE_YET
+
+from .api import parse
+
+_rand = random.Random(4243)
+# body of the endpoints that keep writing after the handler returns
+_STREAMING = object()
+_ids = itertools.count(1)
+_VERSIONED = re.compile(r"^/v([\d.]+)/")
+
+
+def constant(seconds):
+    return lambda: seconds
+
+
+def uniform(low, high):
+    return lambda: _rand.uniform(low, high)
+
+
+def lognormal(median, sigma):
+    """Long tailed latency distribution typical for busy daemons"""
+    mu = math.log(median)
+    return lambda: _rand.lognormvariate(mu, sigma)
+
+
+def _make_id():
+    return hashlib.sha256(str(next(_ids))).hexdigest()
+
+
+class FakeDocker(object):
+    """State of a single fake docker host"""
+
+    def __init__(self, containers=0, images=0, memory=8 * 1024 ** 3,
+                 version="1.21"):
+        self.memory = memory
+        self.version = version
+        self.containers = {}
+        self.images = []
+        self.events = []
+        # open /events requests and their event filters
+        self.subscribers = {}
+        self.execs = {}
+        self._listing = None
+        for i in xrange(containers):
+            self.add_container("image-{}".format(i % 10), "serve", True)
+        for i in xrange(images):
+            self.images.append({
+                'Id': _make_id(),
+                'RepoTags': ["image-{}:latest".format(i)],
+                'Created': 1380000000,
+                'Size': 1024 * 1024 * (i + 1),
+                'VirtualSize': 1024 * 1024 * (i + 1)
+            })
+
+    def add_container(self, image, command, running=False, memory=0):
+        container_id = _make_id()
+        self.containers[container_id] = {
+            'Id': container_id,
+            'Image': image,
+            'Command': command,
+            'Created': 1380000000,
+            'Status': "Up 5 minutes" if running else "Exit 0",
+            'Ports': [],
+            'Memory': memory,
+            'Output': [],
+            'Files': {}
+        }
+        self._listing = None
+        return container_id
+
+    def listing(self):
+        """Containers list is big, so it's serialized once per change"""
+        if self._listing is None:
+            self._listing = json.dumps([
+                dict((k, v) for k, v in c.iteritems()
+                     if k not in ('Memory', 'Output', 'Files',
+                                  'ExitCode'))
+                for c in self.containers.itervalues()])
+        return self._listing
+
+    def add_output(self, container_id, data, stream=1):
+        """Adds output of the container, 1 is stdout, 2 is stderr"""
+        self.containers[container_id]['Output'].append((stream, data))
+
+    def set_status(self, container_id, status):
+        self.containers[container_id]['Status'] = status
+        self._listing = None
+
+    def emit(self, event, container_id):
+        """Records the event and streams it to the /events requests"""
+        self.events.append((event, container_id))
+        line = json.dumps({
+            'status': event, 'id': container_id,
+            'from': self.containers[container_id]['Image'],
+            'time': 1380000000 + len(self.events)}) + "\n"
+        for request, accepted in self.subscribers.items():
+            if not accepted or event in accepted:
+                request.write(line)
+
+    def exit(self, container_id, code=0):
+        """Container's process exits with the code"""
+        self.containers[container_id]['ExitCode'] = code
+        self.set_status(container_id, "Exit {}".format(code))
+        self.emit("die", container_id)
+
+
+def _sample(container, i):
+    memory = container['Memory'] or 64 * 1024 ** 2
+    return {
+        'read': "2014-01-01T00:00:0{}Z".format(i),
+        'cpu_stats': {
+            'cpu_usage': {'total_usage': 10 ** 8 * (i + 2),
+                          'percpu_usage': [0, 0]},
+            'system_cpu_usage': 10 ** 9 * (i + 2)},
+        'precpu_stats': {
+            'cpu_usage': {'total_usage': 10 ** 8 * (i + 1)},
+            'system_cpu_usage': 10 ** 9 * (i + 1)},
+        'memory_stats': {'usage': memory / 2, 'limit': memory},
+        'networks': {'eth0': {'rx_bytes': 1000 * i, 'tx_bytes': 500 * i}}
+    }
+
+
+class _Handler(Resource):
+    isLeaf = True
+
+    # (http method, path pattern, endpoint, handler)
+    routes = [
+        ("GET", r"version", "version", "version"),
+        ("GET", r"info", "info", "info"),
+        ("GET", r"containers/(?:ps|json)", "containers/ps", "containers"),
+        ("GET", r"images/json", "images/json", "images"),
+        ("POST", r"containers/create", "containers/create", "create"),
+        ("GET", r"containers/([^/]+)/json", "containers/{id}/json",
+         "inspect"),
+        ("POST", r"containers/([^/]+)/start", "containers/{id}/start",
+         "start"),
+        ("POST", r"containers/([^/]+)/stop", "containers/{id}/stop", "stop"),
+        ("POST", r"containers/([^/]+)/wait", "containers/{id}/wait", "wait"),
+        ("POST", r"containers/([^/]+)/attach", "containers/{id}/attach",
+         "attach"),
+        ("POST", r"containers/([^/]+)/exec", "containers/{id}/exec",
+         "exec_create"),
+        ("POST", r"exec/([^/]+)/start", "exec/{id}/start", "exec_start"),
+        ("PUT", r"containers/([^/]+)/archive", "containers/{id}/archive",
+         "put_archive"),
+        ("GET", r"containers/([^/]+)/archive", "containers/{id}/archive",
+         "get_archive"),
+        ("POST", r"containers/([^/]+)/copy", "containers/{id}/copy", "copy"),
+        ("GET", r"exec/([^/]+)/json", "exec/{id}/json", "exec_inspect"),
+        ("GET", r"containers/([^/]+)/stats", "containers/{id}/stats",
+         "stats"),
+        ("GET", r"events", "events", "events"),
+        ("DELETE", r"containers/([^/]+)", "containers/{id}",
+         "remove_container"),
+        ("DELETE", r"images/([^/]+)", "images/{id}", "remove_image"),
+        ("POST", r"build", "build", "build"),
+    ]
+
+    def __init__(self, docker, latency=None, failures=None):
+        Resource.__init__(self)
+        self.docker = docker
+        self.latency = latency or {}
+        self.failures = failures or {}
+        self.compiled = [
+            (m, re.compile(r"^(?:/v[\d.]+)?/" + p + "$"), e, h)
+            for m, p, e, h in self.routes]
+
+    def render(self, request):
+        for method, pattern, endpoint, name in self.compiled:
+            match = pattern.match(request.path)
+            if method == request.method and match:
+                break
+        else:
+            request.setResponseCode(404)
+            return "Not found: {} {}".format(request.method, request.path)
+
+        delay = self.latency.get(endpoint, self.latency.get("*"))
+        delay = delay() if delay else 0
+        failure_rate = self.failures.get(
+            endpoint, self.failures.get("*")) or 0
+
+        lost = []
+        request.notifyFinish().addErrback(lambda _: lost.append(True))
+
+        def respond():
+            if lost:
+                return
+            if failure_rate and _rand.random() < failure_rate:
+                request.setResponseCode(500)
+                request.write("Fake failure of {}".format(endpoint))
+            else:
+                code, body = getattr(self, name)(request, *match.groups())
+                request.setResponseCode(code)
+                if body is _STREAMING:
+                    # headers go out now, the body is written later
+                    request.write("")
+                    return
+                if body:
+                    request.write(body)
+            request.finish()
+
+        if delay:
+            reactor.callLater(delay, respond)
+        else:
+            respond()
+        return NOT_DONE_YET
+
+    def version(self, request):
+        return 200, json.dumps({
+            'Version': '0.7.0', 'ApiVersion': self.docker.version})
+
+    def info(self, request):
+        return 200, json.dumps({
+            'Containers': len(self.docker.containers),
+            'Images': len(self.docker.images),
+            'MemTotal': self.docker.memory})
+
+    def containers(self, request):
+        if 'filters' not in request.args:
+            return 200, self.docker.listing()
+        status = json.loads(request.args['filters'][0]).get('status')
+        prefix = {'running': "Up", 'exited': "Exit"}[status[0]]
+        return 200, json.dumps([
+            c for c in json.loads(self.docker.listing())
+            if c['Status'].startswith(prefix)])
+
+    def images(self, request):
+        if self._version(request) >= (1, 7):
+            return 200, json.dumps(self.docker.images)
+        # one entry per name with Repository and Tag
+        images = []
+        for image in self.docker.images:
+            for name in image.get('RepoTags') or ["<none>:<none>"]:
+                repository, _, tag = name.rpartition(":")
+                entry = dict((k, v) for k, v in image.iteritems()
+                             if k != 'RepoTags')
+                entry.update({'Repository': repository, 'Tag': tag})
+                images.append(entry)
+        return 200, json.dumps(images)
+
+    def create(self, request):
+        config = json.loads(request.content.read() or "{}")
+        if self._version(request) >= (1, 18):
+            memory = (config.get('HostConfig') or {}).get('Memory')
+        else:
+            memory = config.get('Memory')
+        container_id = self.docker.add_container(
+            config.get('Image'), " ".join(config.get('Cmd') or []),
+            memory=memory or 0)
+        return 201, json.dumps({'Id': container_id, 'Warnings': []})
+
+    def inspect(self, request, container_id):
+        c = self.docker.containers.get(container_id)
+        if c is None:
+            return 404, "No such container: {}".format(container_id)
+        reply = {
+            'Id': c['Id'],
+            'Image': c['Image'],
+            'Config': {'Image': c['Image']},
+            'State': {'Running': c['Status'].startswith("Up"),
+                      'ExitCode': c.get('ExitCode', 0)},
+            'NetworkSettings': {'IPAddress': '172.17.0.2'}
+        }
+        if self._version(request) >= (1, 18):
+            reply['HostConfig'] = {'Memory': c['Memory']}
+        else:
+            reply['Config']['Memory'] = c['Memory']
+        return 200, json.dumps(reply)
+
+    def start(self, request, container_id):
+        return self._transition(container_id, "Up 1 second", "start")
+
+    def stop(self, request, container_id):
+        return self._transition(container_id, "Exit 0", "die")
+
+    def wait(self, request, container_id):
+        if container_id not in self.docker.containers:
+            return 404, "No such container: {}".format(container_id)
+        return 200, json.dumps({'StatusCode': 0})
+
+    def attach(self, request, container_id):
+        c = self.docker.containers.get(container_id)
+        if c is None:
+            return 404, "No such container: {}".format(container_id)
+        return 200, "".join(
+            struct.pack(">BxxxL", stream, len(data)) + data
+            for stream, data in c['Output']
+            if request.args.get({1: 'stdout', 2: 'stderr'}[stream]) == ['1'])
+
+    def stats(self, request, container_id):
+        """Samples derived from the container's memory, streamed
+        replies are three samples a line each
+        """
+        c = self.docker.containers.get(container_id)
+        if c is None:
+            return 404, "No such container: {}".format(container_id)
+        count = 3 if request.args.get('stream') == ['1'] else 1
+        return 200, "".join(
+            json.dumps(_sample(c, i)) + "\n" for i in xrange(count))
+
+    def events(self, request):
+        """Streams the events emitted from now on until the client
+        disconnects, honors the event type filters
+        """
+        filters = json.loads(request.args.get('filters', ['{}'])[0])
+        subscribers = self.docker.subscribers
+        subscribers[request] = set(filters.get('event') or [])
+        request.notifyFinish().addBoth(
+            lambda _: subscribers.pop(request, None))
+        return 200, _STREAMING
+
+    def exec_create(self, request, container_id):
+        c = self.docker.containers.get(container_id)
+        if c is None:
+            return 404, "No such container: {}".format(container_id)
+        config = json.loads(request.content.read() or "{}")
+        exec_id = _make_id()
+        self.docker.execs[exec_id] = {
+            'Container': container_id, 'Cmd': config.get('Cmd') or [],
+            'ExitCode': None}
+        return 201, json.dumps({'Id': exec_id})
+
+    def exec_start(self, request, exec_id):
+        """Fake commands print their arguments, `false` exits with 1"""
+        e = self.docker.execs.get(exec_id)
+        if e is None:
+            return 404, "No such exec instance: {}".format(exec_id)
+        cmd = e['Cmd']
+        e['ExitCode'] = 1 if cmd[:1] == ["false"] else 0
+        output = "{} {}\n".format(e['Container'][:12], " ".join(cmd[1:]))
+        return 200, struct.pack(">BxxxL", 1, len(output)) + output
+
+    def exec_inspect(self, request, exec_id):
+        e = self.docker.execs.get(exec_id)
+        if e is None:
+            return 404, "No such exec instance: {}".format(exec_id)
+        return 200, json.dumps({
+            'ID': exec_id, 'Running': e['ExitCode'] is None,
+            'ExitCode': e['ExitCode']})
+
+    def put_archive(self, request, container_id):
+        """Extracts files of the archive to the container's files"""
+        c = self.docker.containers.get(container_id)
+        if c is None:
+            return 404, "No such container: {}".format(container_id)
+        directory = request.args.get('path', ['/'])[0].rstrip("/")
+        t = tarfile.open(fileobj=request.content)
+        for member in t.getmembers():
+            if member.isfile():
+                name = member.name[2:] if member.name.startswith("./") \
+                    else member.name
+                c['Files'][directory + "/" + name] = \
+                    t.extractfile(member).read()
+        return 200, None
+
+    def get_archive(self, request, container_id):
+        """Archives the files of the container under the path"""
+        c = self.docker.containers.get(container_id)
+        if c is None:
+            return 404, "No such container: {}".format(container_id)
+        path = request.args.get('path', ['/'])[0].rstrip("/")
+        out = StringIO()
+        t = tarfile.open(mode='w', fileobj=out)
+        for name, data in sorted(c['Files'].iteritems()):
+            if name == path or name.startswith(path + "/"):
+                info = tarfile.TarInfo(name.lstrip("/"))
+                info.size = len(data)
+                t.addfile(info, StringIO(data))
+        t.close()
+        return 200, out.getvalue()
+
+    def copy(self, request, container_id):
+        """Api before 1.20 copied the resource as an archive"""
+        resource = json.loads(request.content.read() or "{}")
+        request.args['path'] = [resource.get('Resource', '/')]
+        return self.get_archive(request, container_id)
+
+    def remove_container(self, request, container_id):
+        if self.docker.containers.pop(container_id, None) is None:
+            return 404, "No such container: {}".format(container_id)
+        self.docker._listing = None
+        return 204, None
+
+    def remove_image(self, request, image_id):
+        for image in self.docker.images:
+            if image['Id'] == image_id:
+                self.docker.images.remove(image)
+                return 200, json.dumps([{'Deleted': image_id}])
+        return 404, "No such image: {}".format(image_id)
+
+    def build(self, request):
+        request.content.read()
+        return 200, "Step 1 : FROM base\nSuccessfully built {}\n".format(
+            _make_id()[:12])
+
+    def _version(self, request):
+        """Api version in the path of the request, unversioned
+        requests get the version of the daemon
+        """
+        match = _VERSIONED.match(request.path)
+        return parse(match.group(1) if match else self.docker.version)
+
+    def _transition(self, container_id, status, event):
+        if container_id not in self.docker.containers:
+            return 404, "No such container: {}".format(container_id)
+        self.docker.set_status(container_id, status)
+        self.docker.emit(event, container_id)
+        return 204, None
+
+
+class FakeFleet(object):
+    """Starts `count` fake docker daemons listening on local ports.
+    Latencies and failure rates are dictionaries keyed by the endpoint,
+    e.g. "containers/ps", "containers/{id}/start", or "*" for all of them.
+    `version` is the api version of all the daemons or a list of versions
+    of every daemon for mixed fleets. With `tls` context factory, e.g.
+    :class:`twisted.internet.ssl.CertificateOptions`, daemons listen
+    on https.
+    """
+
+    def __init__(self, count, containers=0, images=0, latency=None,
+                 failures=None, version="1.21", interface="127.0.0.1",
+                 tls=None):
+        self.dockers = []
+        self.ports = []
+        self.factories = []
+        self.tls = tls
+        if isinstance(version, basestring):
+            version = [version] * count
+        for i in xrange(count):
+            docker = FakeDocker(containers, images, version=version[i])
+            site = Site(_Handler(docker, latency, failures))
+            site.noisy = False
+            self.dockers.append(docker)
+            factory = _Connections(site)
+            if tls is None:
+                port = reactor.listenTCP(0, factory, interface=interface)
+            else:
+                port = reactor.listenSSL(0, factory, tls, interface=interface)
+            self.ports.append(port)
+            self.factories.append(factory)
+
+    @property
+    def hosts(self):
+        return ["{}{}:{}".format("https://" if self.tls else "",
+                                 p.getHost().host, p.getHost().port)
+                for p in self.ports]
+
+    def stop(self):
+        """Stops listening and closes the connections, returns deferred
+        firing once they are closed
+        """
+        return defer.gatherResults(
+            [port.stopListening() for port in self.ports] +
+            [factory.close() for factory in self.factories])
+
+
+class _Connections(WrappingFactory):
+    """Tracks the connections, so they can be closed on stop"""
+
+    def __init__(self, factory):
+        WrappingFactory.__init__(self, factory)
+        self.closed = []
+
+    def unregisterProtocol(self, protocol):
+        WrappingFactory.unregisterProtocol(self, protocol)
+        if not self.protocols:
+            closed, self.closed = self.closed, []
+            for d in closed:
+                d.callback(None)
+
+    def close(self):
+        if not self.protocols:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.closed.append(d)
+        for protocol in list(self.protocols):
+            protocol.transport.loseConnection()
+        return d
+
+
+def main():
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fake docker fleet")
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--containers", type=int, default=0)
+    parser.add_argument("--images", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="median latency of all endpoints, seconds")
+    parser.add_argument("--sigma", type=float, default=0.5,
+                        help="spread of the lognormal latency")
+    parser.add_argument("--failures", type=float, default=0,
+                        help="failure rate of all endpoints")
+    args = parser.parse_args()
+
+    latency = {}
+    if args.latency:
+        latency["*"] = lognormal(args.latency, args.sigma)
+    fleet = FakeFleet(args.hosts, args.containers, args.images,
+                      latency=latency, failures={"*": args.failures})
+    sys.stdout.write(" ".join(fleet.hosts) + "\n")
+    sys.stdout.flush()
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""History of the fleet in a local SQLite database.
+
+Listings of containers and images and inspect replies are recorded,
+so questions about the past are answered without contacting the hosts:
+
+    Shipper.open_history("~/.shipper/history.db")
+    Shipper(hosts).containers(all=True)
+    Shipper.history.hosts("registry/web*", since=time.time() - 86400)
+    Shipper.history.changes(since=last_deploy)
+
+or from the command line:
+
+    python -m shipper.history hosts 'registry/web*' --since 1d
+    python -m shipper.history changes --since 2h --format json
+
+Every row keeps a state of a container (image, inspect reply) from the
+time it was first seen until it changed or disappeared, so listings of
+a stable fleet write nothing but the time of the snapshot. Replies are
+converted and written in batches by a background thread, the reactor
+never waits for the disk.
+"""
+import os
+import sys
+import json
+import time
+import Queue
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+from contextlib import closing
+
+DEFAULT_PATH = "~/.shipper/history.db"
+
+_STOP = object()
+
+log = logging.getLogger(__name__)
+
+
+def _state(status):
+    """Stable state of the container from its changing status,
+    e.g. "Up 5 minutes" is running
+    """
+    status = status or ""
+    if status.startswith("Up"):
+        return "paused" if "(Paused)" in status else "running"
+    if status.startswith("Exit"):
+        return "exited"
+    return (status.split() or ["created"])[0].lower()
+
+
+def _containers(c):
+    yield (c.get('Id'), c.get('Image'), c.get('Command'),
+           _state(c.get('Status')), c.get('Created'))
+
+
+def _images(i):
+    tags = i.get('RepoTags')
+    if tags is None:
+        tags = ["{}:{}".format(i.get('Repository') or '<none>',
+                               i.get('Tag') or '<none>')]
+    for tag in tags:
+        repository, _, tag = tag.rpartition(":")
+        yield (i.get('Id'), repository, tag,
+               i.get('VirtualSize') or i.get('Size'), i.get('Created'))
+
+
+def _inspections(c):
+    state = c.get('State') or {}
+    yield (c.get('Id') or c.get('ID'),
+           (c.get('Config') or {}).get('Image') or c.get('Image'),
+           "running" if state.get('Running') else "exited",
+           (c.get('NetworkSettings') or {}).get('IPAddress'),
+           json.dumps(c, sort_keys=True))
+
+
+class _Table(object):
+    def __init__(self, name, columns, keys, rows):
+        self.name = name
+        self.columns = columns
+        self.keys = keys
+        self.rows = rows
+
+
+_TABLES = dict((t.name, t) for t in [
+    _Table('containers', ('id', 'image', 'command', 'state', 'created'),
+           1, _containers),
+    _Table('images', ('id', 'repository', 'tag', 'size', 'created'),
+           3, _images),
+    _Table('inspections', ('id', 'image', 'state', 'ip', 'data'),
+           1, _inspections),
+])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS containers (
+    host TEXT, id TEXT, image TEXT, command TEXT, state TEXT,
+    created INTEGER, first_seen REAL, last_seen REAL);
+CREATE INDEX IF NOT EXISTS containers_host
+    ON containers (host, last_seen);
+CREATE INDEX IF NOT EXISTS containers_image ON containers (image);
+CREATE INDEX IF NOT EXISTS containers_state ON containers (state);
+CREATE INDEX IF NOT EXISTS containers_first_seen
+    ON containers (first_seen);
+CREATE INDEX IF NOT EXISTS containers_last_seen ON containers (last_seen);
+
+CREATE TABLE IF NOT EXISTS images (
+    host TEXT, id TEXT, repository TEXT, tag TEXT, size INTEGER,
+    created INTEGER, first_seen REAL, last_seen REAL);
+CREATE INDEX IF NOT EXISTS images_host ON images (host, last_seen);
+CREATE INDEX IF NOT EXISTS images_repository ON images (repository);
+CREATE INDEX IF NOT EXISTS images_first_seen ON images (first_seen);
+CREATE INDEX IF NOT EXISTS images_last_seen ON images (last_seen);
+
+CREATE TABLE IF NOT EXISTS inspections (
+    host TEXT, id TEXT, image TEXT, state TEXT, ip TEXT, data TEXT,
+    first_seen REAL, last_seen REAL);
+CREATE INDEX IF NOT EXISTS inspections_host
+    ON inspections (host, id, last_seen);
+CREATE INDEX IF NOT EXISTS inspections_first_seen
+    ON inspections (first_seen);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    host TEXT, kind TEXT, time REAL, PRIMARY KEY (host, kind));
+"""
+
+
+class History(object):
+    """Records snapshots of the hosts to the database at `path` in the
+    background thread, queries read the database directly. Snapshots
+    that do not fit in the queue of `size` are dropped and counted.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, size=1000):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.queue = Queue.Queue(size)
+        self.dropped = 0
+        # current rows of (table, host): {key: (rowid, row)},
+        # used by the writer thread only
+        self._current = {}
+        with closing(self._connect()) as db:
+            db.executescript(_SCHEMA)
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, kind, host, replies, scope=None, now=None):
+        """Queues docker replies of the host: listing of "containers" or
+        "images", or "inspections". Rows of the host missing in the
+        listing are closed, `scope` limits that to the containers in
+        the states, e.g. ("running",) if stopped ones were not listed.
+        Never blocks the caller.
+        """
+        host = getattr(host, 'url', host)
+        try:
+            self.queue.put_nowait(
+                (kind, host, replies, scope, now or time.time()))
+        except Queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Waits until the queued snapshots are written"""
+        self.queue.join()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+
+    def containers(self, host=None, image=None, state=None,
+                   since=None, until=None):
+        """Containers that existed between `since` and `until`, current
+        ones if neither is set. `image` is a glob pattern.
+        """
+        return self._select('containers', host, since, until, [
+            ("image GLOB ?", image), ("state = ?", state)])
+
+    def images(self, host=None, repository=None, since=None, until=None):
+        return self._select('images', host, since, until, [
+            ("repository GLOB ?", repository)])
+
+    def hosts(self, image, since=None, until=None):
+        """Hosts that ran containers of the image between `since`
+        and `until`
+        """
+        rows = self.containers(
+            image=image, state="running", since=since, until=until)
+        return sorted(set(r['host'] for r in rows))
+
+    def inspection(self, host, container):
+        """Latest recorded inspect reply of the container"""
+        rows = self._query(
+            "SELECT data FROM inspections WHERE host = ? AND id = ? "
+            "ORDER BY first_seen DESC LIMIT 1",
+            (getattr(host, 'url', host), container))
+        return json.loads(rows[0]['data']) if rows else None
+
+    def changes(self, since, kind='containers', host=None):
+        """What was added, changed or removed since the time, oldest
+        first, e.g. since the last deploy
+        """
+        table = _TABLES[kind]
+        where = "(first_seen > ? OR last_seen > ?)"
+        params = [since, since]
+        if host is not None:
+            where += " AND host = ?"
+            params.append(getattr(host, 'url', host))
+        rows = self._query(
+            "SELECT * FROM {} WHERE {} ORDER BY first_seen".format(
+                table.name, where), params)
+
+        def key(row):
+            return (row['host'],) + tuple(
+                row[c] for c in table.columns[:table.keys])
+
+        started = set((key(r), r['first_seen']) for r in rows)
+        ended = set((key(r), r['last_seen']) for r in rows)
+        out = []
+        for row in rows:
+            if row['first_seen'] > since:
+                change = "changed" if (key(row), row['first_seen']) in \
+                    ended else "added"
+                out.append(dict(row, change=change, time=row['first_seen']))
+            if row['last_seen'] is not None and row['last_seen'] > since \
+                    and (key(row), row['last_seen']) not in started:
+                out.append(dict(row, change="removed",
+                                time=row['last_seen']))
+        return sorted(out, key=lambda r: r['time'])
+
+    def snapshots(self, kind='containers'):
+        """Time of the last snapshot of every host"""
+        return dict((r['host'], r['time']) for r in self._query(
+            "SELECT host, time FROM snapshots WHERE kind = ?", (kind,)))
+
+    def _select(self, name, host, since, until, filters):
+        if since is None and until is None:
+            where, params = ["last_seen IS NULL"], []
+        else:
+            where = ["first_seen <= ?",
+                     "(last_seen IS NULL OR last_seen >= ?)"]
+            params = [until or time.time(), since or 0]
+        if host is not None:
+            filters = filters + [("host = ?", getattr(host, 'url', host))]
+        for condition, value in filters:
+            if value is not None:
+                where.append(condition)
+                params.append(value)
+        return self._query(
+            "SELECT * FROM {} WHERE {} ORDER BY host, first_seen".format(
+                name, " AND ".join(where)), params)
+
+    def _query(self, sql, params):
+        with closing(self._connect()) as db:
+            db.row_factory = sqlite3.Row
+            return [dict(r) for r in db.execute(sql, params)]
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        # readers are not blocked by the writer
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _write(self):
+        db = self._connect()
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            try:
+                with db:
+                    for item in batch:
+                        if item is not _STOP:
+                            self._apply(db, *item)
+            except Exception:
+                log.exception("Failed to record history")
+                # rolled back, current rows are reloaded
+                self._current.clear()
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if _STOP in batch:
+                db.close()
+                return
+
+    def _apply(self, db, kind, host, replies, scope, now):
+        table = _TABLES[kind]
+        current = self._load(db, table, host)
+        seen = {}
+        for reply in replies or []:
+            for row in table.rows(reply):
+                seen[row[:table.keys]] = row
+
+        closed, added = [], []
+        for key, row in seen.iteritems():
+            old = current.get(key)
+            if old is not None and old[1] == row:
+                continue
+            if old is not None:
+                closed.append((now, old[0]))
+            added.append((host,) + row + (now,))
+
+        if kind != 'inspections':
+            state = table.columns.index('state') \
+                if 'state' in table.columns else None
+            for key, (rowid, row) in current.iteritems():
+                if key in seen:
+                    continue
+                if scope is None or row[state] in scope:
+                    closed.append((now, rowid))
+
+        if closed:
+            db.executemany(
+                "UPDATE {} SET last_seen = ? WHERE rowid = ?".format(
+                    table.name), closed)
+        if added:
+            db.executemany(
+                "INSERT INTO {} (host, {}, first_seen) VALUES ({})".format(
+                    table.name, ", ".join(table.columns),
+                    ", ".join("?" * (len(table.columns) + 2))), added)
+        if closed or added:
+            # reloaded with the new row ids on the next snapshot
+            self._current.pop((table.name, host), None)
+        db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)",
+                   (host, kind, now))
+
+    def _load(self, db, table, host):
+        current = self._current.get((table.name, host))
+        if current is None:
+            current = self._current[(table.name, host)] = {}
+            rows = db.execute(
+                "SELECT rowid, {} FROM {} WHERE host = ? AND "
+                "last_seen IS NULL".format(
+                    ", ".join(table.columns), table.name), (host,))
+            for row in rows:
+                values = tuple(row[1:])
+                current[values[:table.keys]] = (row[0], values)
+        return current
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Queries the recorded history of the fleet")
+    parser.add_argument(
+        "--db", default=os.environ.get("SHIPPER_HISTORY", DEFAULT_PATH))
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--format", default="table",
+                        choices=["table", "json", "csv"])
+    subparsers = parser.add_subparsers()
+
+    p = subparsers.add_parser(
+        "containers", help="containers of the hosts", parents=[output])
+    p.add_argument("--host")
+    p.add_argument("--image", help="glob pattern")
+    p.add_argument("--state", help="e.g. running or exited")
+    _add_window(p)
+    p.set_defaults(command="containers")
+
+    p = subparsers.add_parser(
+        "images", help="images of the hosts", parents=[output])
+    p.add_argument("--host")
+    p.add_argument("--repository", help="glob pattern")
+    _add_window(p)
+    p.set_defaults(command="images")
+
+    p = subparsers.add_parser("hosts", help="hosts that ran the image")
+    p.add_argument("image", help="glob pattern")
+    _add_window(p)
+    p.set_defaults(command="hosts")
+
+    p = subparsers.add_parser(
+        "changes", help="changes since the time", parents=[output])
+    p.add_argument("--since", required=True, type=parse_time)
+    p.add_argument("--host")
+    p.add_argument("--kind", default="containers",
+                   choices=["containers", "images"])
+    p.set_defaults(command="changes")
+
+    args = parser.parse_args()
+    if not os.path.exists(os.path.expanduser(args.db)):
+        parser.error("No history at {}".format(args.db))
+    history = History(args.db)
+    try:
+        sys.stdout.write(_execute(history, args))
+    finally:
+        history.close()
+
+
+def _add_window(parser):
+    parser.add_argument("--since", type=parse_time,
+                        help="epoch, date or age like 2h, 1d")
+    parser.add_argument("--until", type=parse_time)
+
+
+def _execute(history, args):
+    from . import pretty
+    if args.command == "hosts":
+        return "".join(h + "\n" for h in history.hosts(
+            args.image, args.since, args.until))
+    if args.command == "changes":
+        rows = history.changes(args.since, args.kind, args.host)
+        columns = pretty.CHANGE_COLUMNS
+    elif args.command == "images":
+        rows = history.images(
+            args.host, args.repository, args.since, args.until)
+        columns = pretty.HISTORY_IMAGE_COLUMNS
+    else:
+        rows = history.containers(
+            args.host, args.image, args.state, args.since, args.until)
+        columns = pretty.HISTORY_CONTAINER_COLUMNS
+    return pretty.history_to_text(rows, columns, args.format)
+
+
+def parse_time(value, now=None):
+    """Epoch seconds, ISO date "2014-01-30", "2014-01-30T10:00:00"
+    or age, e.g. "30m", "2h" or "1d"
+    """
+    now = now or time.time()
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+    try:
+        if value[-1:] in units:
+            return now - float(value[:-1]) * units[value[-1]]
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return time.mktime(parsed.timetuple())
+    raise argparse.ArgumentTypeError("Invalid time: {}".format(value))
+
+
+if __name__ == "__main__":
+    main()
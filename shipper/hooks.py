@@ -0,0 +1,110 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Request lifecycle hooks for tracing and profiling.
+
+Hooks are called by :class:`shipper.client.Client` in the reactor thread:
+
+* before_request - right before the request is sent
+* first_byte - when response status and headers have arrived
+* after_response - when the whole response body has been read, for the
+  streamed requests (build, attach, logs, stats, events) when the
+  stream ends
+* error - when request failed or docker replied with an error
+
+Every hook gets a :class:`Request` with the host, http method, api path,
+timings and the :class:`Operation` that issued the request, e.g. one
+`Shipper.run` spanning create, start and inspect calls:
+
+    from shipper import hooks
+
+    def trace(request):
+        print request.operation, request.path, request.latency
+
+    hooks.registry.add("after_response", trace)
+
+When no hooks are registered the client skips all of this work.
+"""
+import time
+import logging
+import itertools
+
+from .utils import notify
+
+EVENTS = ("before_request", "first_byte", "after_response", "error")
+
+_ids = itertools.count(1)
+
+log = logging.getLogger(__name__)
+
+
+class Operation(object):
+    """Logical shipper operation, correlates the requests it issued"""
+
+    def __init__(self, name):
+        self.id = next(_ids)
+        self.name = name
+
+    def __repr__(self):
+        return "Operation({}, id={})".format(self.name, self.id)
+
+
+class Request(object):
+    """Single docker api request as seen by the hooks"""
+
+    def __init__(self, host, method, path, operation=None):
+        self.host = host
+        self.method = method
+        self.path = path
+        self.operation = operation
+        self.started = time.time()
+        self.first_byte = None
+        self.finished = None
+        self.code = None
+        self.error = None
+
+    def __repr__(self):
+        return "Request({} {} {}, operation={})".format(
+            self.method, self.host, self.path, self.operation)
+
+    @property
+    def latency(self):
+        """Seconds from sending the request till the end of response"""
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    @property
+    def time_to_first_byte(self):
+        if self.first_byte is None:
+            return None
+        return self.first_byte - self.started
+
+
+class Hooks(object):
+    """Registry of the hooks, evaluates to False if empty"""
+
+    def __init__(self):
+        self.hooks = dict((e, []) for e in EVENTS)
+        self.active = False
+
+    def __nonzero__(self):
+        return self.active
+
+    def add(self, event, hook):
+        if event not in self.hooks:
+            raise ValueError("Unsupported event: {}".format(event))
+        self.hooks[event].append(hook)
+        self.active = True
+
+    def remove(self, event, hook):
+        self.hooks[event].remove(hook)
+        self.active = any(self.hooks.itervalues())
+
+    def fire(self, event, request):
+        notify(self.hooks[event], log, request)
+
+
+# hooks of the clients that were not given their own
+registry = Hooks()
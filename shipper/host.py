@@ -12,7 +12,10 @@ def parse_hosts(hosts, default_port=4243):
     out = []
     for param in (hosts or []):
 
-        if isinstance(param, (tuple, list)):
+        if isinstance(param, Host):
+            out.append(param)
+
+        elif isinstance(param, (tuple, list)):
             if len(param) != 2:
                 raise ValueError("Param should be (host, port)")
             host, port = param
@@ -32,12 +35,30 @@ def parse_hosts(hosts, default_port=4243):
     return out
 
 
+def netloc(host):
+    """"host:port" of the :class:`Host`, anything else as a string"""
+    return host.a.netloc if isinstance(host, Host) else str(host)
+
+
 class Host(object):
     """Represents docker-enabled host.
     Is hasheable, can be put into dictionaries.
+
+    Hosts are interned: the same url always gives the same object, and
+    the identity and hash are computed once, so grouping large result
+    sets by host is cheap.
     """
-    def __init__(self, url):
-        self.a = urlparse(url)
+    _interned = {}
+
+    def __new__(cls, url):
+        host = cls._interned.get(url)
+        if host is None:
+            host = object.__new__(cls)
+            host.a = urlparse(url)
+            host._key = str(host.a)
+            host._hash = hash(host._key)
+            host = cls._interned.setdefault(url, host)
+        return host
 
     @property
     def url(self):
@@ -50,7 +71,14 @@ class Host(object):
         return "Host({})".format(self.a.netloc)
 
     def __hash__(self):
-        return hash(str(self.a))
+        return self._hash
 
     def __eq__(self, other):
-        return str(self.a) == other
+        if self is other:
+            return True
+        if isinstance(other, Host):
+            return self._key == other._key
+        return self._key == other
+
+    def __ne__(self, other):
+        return not self == other
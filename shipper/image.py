@@ -3,29 +3,30 @@
 # See LICENSE for details
 
 from .utils import from_epoch
+from .record import Record
 
 
-class Image(dict):
-    def __init__(self, host, values):
-        dict.__init__(self)
-        self.update(values)
-        self.host = host
+class Image(Record):
+    __slots__ = ()
+
+    _id = 'Id'
+    _interned = ('Repository', 'Tag')
 
     def __str__(self):
         return "Image(host={}, values={})".format(
-            self.host, dict.__str__(self))
+            self.host, self.to_dict())
 
     @property
     def repository(self):
-        return self.get('Repository') or ''
+        return self.get('Repository') or self._name()[0]
 
     @property
     def tag(self):
-        return self.get('Tag') or ''
+        return self.get('Tag') or self._name()[1]
 
     @property
     def created(self):
-        return from_epoch(self['Created'])
+        return self._cached('created', lambda: from_epoch(self['Created']))
 
     @property
     def id(self):
@@ -34,3 +35,25 @@ class Image(dict):
     @property
     def size(self):
         return self['Size']
+
+    @property
+    def tags(self):
+        """Returns repository:tag names of the image"""
+        tags = self.get('RepoTags')
+        if tags is None:
+            tags = ["{}:{}".format(self.repository, self.tag or "<none>")]
+        return [t for t in tags if not t.startswith("<none>:")]
+
+    @property
+    def is_dangling(self):
+        return not self.tags
+
+    def _name(self):
+        """Repository and tag of the first name, images/json lists only
+        RepoTags since api 1.7
+        """
+        for name in self.get('RepoTags') or ():
+            if not name.startswith("<none>:"):
+                repository, _, tag = name.rpartition(":")
+                return (repository, tag) if repository else (name, '')
+        return ('', '')
@@ -0,0 +1,180 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Host inventory with tags, groups and consistent hashing.
+
+Inventory file lists hosts one per line, optionally followed by tags.
+Sections in square brackets put the hosts below them into a group:
+
+    # frontends
+    [web]
+    web-1:4243 tags=ssd,eu
+    web-2      tags=eu
+
+    [db]
+    db-1 tags=ssd
+
+Hosts are then selected with selectors like "tag:ssd", "group:web",
+"all", a host name, or a comma separated union of those. Terms joined
+with "&" are intersected, e.g. "group:web&tag:eu".
+"""
+import bisect
+import hashlib
+
+from .host import parse_hosts
+
+
+class Inventory(object):
+    """Indexed collection of hosts. All the indexes are built
+    on load, so selecting hosts is a dictionary lookup.
+    """
+
+    def __init__(self, entries=None, default_port=4243):
+        self.default_port = default_port
+        self.hosts = []
+        self.tags = {}
+        self.groups = {}
+        self.names = {}
+        self._known = set()
+        self._indexed = set()
+        self._selections = {}
+        self._rings = {}
+        for name, tags, groups in (entries or []):
+            self.add(name, tags, groups)
+
+    @classmethod
+    def load(cls, path, default_port=4243):
+        with open(path) as f:
+            return cls.parse(f, default_port=default_port)
+
+    @classmethod
+    def parse(cls, lines, default_port=4243):
+        entries = []
+        group = None
+        for number, line in enumerate(lines, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith("["):
+                if not line.endswith("]"):
+                    raise ValueError(
+                        "Bad group header on line {}: {}".format(
+                            number, line))
+                group = line[1:-1].strip()
+                continue
+            parts = line.split()
+            tags = []
+            for part in parts[1:]:
+                if not part.startswith("tags="):
+                    raise ValueError(
+                        "Unsupported option on line {}: {}".format(
+                            number, part))
+                tags.extend(t for t in part[5:].split(",") if t)
+            entries.append((parts[0], tags, [group] if group else []))
+        return cls(entries, default_port=default_port)
+
+    def add(self, name, tags=None, groups=None):
+        host, = parse_hosts([name], default_port=self.default_port)
+        if host not in self._known:
+            self._known.add(host)
+            self.hosts.append(host)
+        self.names[name] = host
+        self.names[host.a.netloc] = host
+        for tag in (tags or []):
+            self._index(self.tags, "tag", tag, host)
+        for group in (groups or []):
+            self._index(self.groups, "group", group, host)
+        self._selections.clear()
+        self._rings.clear()
+        return host
+
+    def select(self, selector):
+        """Returns list of hosts matching the selector"""
+        hosts = self._selections.get(selector)
+        if hosts is None:
+            hosts = self._selections[selector] = self._select(selector)
+        return list(hosts)
+
+    def ring(self, selector="all", replicas=100):
+        """Returns consistent hash ring over the selected hosts"""
+        key = (selector, replicas)
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = HashRing(
+                self.select(selector), replicas=replicas)
+        return ring
+
+    def _index(self, index, kind, key, host):
+        if (kind, key, host) not in self._indexed:
+            self._indexed.add((kind, key, host))
+            index.setdefault(key, []).append(host)
+
+    def _select(self, selector):
+        selected = []
+        seen = set()
+        for term in selector.split(","):
+            hosts = None
+            for part in term.split("&"):
+                matched = self._lookup(part.strip())
+                if hosts is None:
+                    hosts = matched
+                else:
+                    allowed = set(matched)
+                    hosts = [h for h in hosts if h in allowed]
+            for host in hosts:
+                if host not in seen:
+                    seen.add(host)
+                    selected.append(host)
+        return tuple(selected)
+
+    def _lookup(self, part):
+        if part == "all":
+            return self.hosts
+        if part.startswith("tag:"):
+            return self.tags.get(part[4:], [])
+        if part.startswith("group:"):
+            return self.groups.get(part[6:], [])
+        if part.startswith("host:"):
+            part = part[5:]
+        host = self.names.get(part)
+        if host is not None:
+            return [host]
+        # hosts that are not in the inventory can still be used directly
+        return parse_hosts([part], default_port=self.default_port)
+
+
+class HashRing(object):
+    """Consistent hash ring, assigns keys to hosts so that adding or
+    removing a host moves only the keys of that host.
+    """
+
+    def __init__(self, hosts, replicas=100):
+        self.hosts = list(hosts)
+        points = []
+        for host in self.hosts:
+            for i in xrange(replicas):
+                points.append((_hash("{}-{}".format(host.url, i)), host))
+        points.sort(key=lambda p: p[0])
+        self._keys = [p[0] for p in points]
+        self._hosts = [p[1] for p in points]
+
+    def get(self, key):
+        """Returns host responsible for the key"""
+        if not self._keys:
+            raise ValueError("Hash ring is empty")
+        index = bisect.bisect(self._keys, _hash(key))
+        if index == len(self._keys):
+            index = 0
+        return self._hosts[index]
+
+    def assign(self, keys):
+        """Returns dictionary {host: [keys]}"""
+        assigned = {}
+        for key in keys:
+            assigned.setdefault(self.get(key), []).append(key)
+        return assigned
+
+
+def _hash(value):
+    return int(hashlib.md5(str(value)).hexdigest()[:16], 16)
@@ -0,0 +1,54 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Container listings shared between the commands.
+
+Commands executed one after another by the daemon often list the
+containers of the same hosts. Listings keeps the replies for `ttl`
+seconds, creating, starting, stopping or removing containers on a host
+drops its replies, so the next listing sees the change.
+"""
+import time
+
+from twisted.internet import defer
+
+
+class Listings(object):
+    """Replies of the container listings keyed by the host and the
+    listing parameters
+    """
+
+    def __init__(self, ttl=5, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self.replies = {}
+        # bumped on every change, so listings that were in flight
+        # when the host changed are not kept
+        self.generations = {}
+
+    def cached(self, method):
+        """Wraps client's `containers` method to return fresh replies
+        from the cache and to keep the new ones
+        """
+        def containers(host, **kwargs):
+            key = tuple(sorted(kwargs.iteritems()))
+            cached = self.replies.get(host, {}).get(key)
+            if cached is not None and self.clock() - cached[0] < self.ttl:
+                return defer.succeed(cached[1])
+
+            listed = self.clock()
+            generation = self.generations.get(host, 0)
+
+            def keep(reply):
+                if self.generations.get(host, 0) == generation:
+                    self.replies.setdefault(host, {})[key] = (listed, reply)
+                return reply
+            return method(host, **kwargs).addCallback(keep)
+        return containers
+
+    def invalidate(self, hosts):
+        """Drops replies of the hosts whose containers changed"""
+        for host in hosts:
+            self.replies.pop(host, None)
+            self.generations[host] = self.generations.get(host, 0) + 1
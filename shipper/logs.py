@@ -0,0 +1,193 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Logging that does not block the reactor.
+
+Log records are put to a bounded queue by :class:`QueueHandler` and
+formatted and written by the handlers in the :class:`QueueListener`
+thread, so slow consoles and syslog never stall the reactor. If the
+queue is full the records are dropped and counted instead.
+
+Lines streamed by the hosts (build and attach output) go through
+:class:`HostOutput` that samples and rate limits them per host, and can be
+routed to per host files with :class:`HostFileHandler`:
+
+    Shipper.startup(every=10, rate=100, directory="/var/log/shipper")
+"""
+import os
+import copy
+import time
+import Queue
+import logging
+import threading
+
+from .host import netloc
+
+_STOP = object()
+_formatter = logging.Formatter()
+
+
+class QueueHandler(logging.Handler):
+    """Puts records to the queue, never blocks the caller. The message
+    and the traceback are merged on the caller's thread, see `prepare`,
+    the handlers of the listener format the records.
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Merges the arguments into the message and renders the
+        traceback, as the stdlib handler does, so the queued record
+        does not keep the objects alive and shows their state at the
+        time of the call
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """Thread passing the queued records to the handlers"""
+
+    def __init__(self, handlers=None, size=10000):
+        self.queue = Queue.Queue(size)
+        self.handlers = list(handlers or [])
+        self.thread = None
+
+    def addHandler(self, handler):
+        self.handlers.append(handler)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._listen)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        """Writes out queued records and stops the thread"""
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def flush(self, timeout=5):
+        """Waits until the records queued so far are handled"""
+        if self.thread is None:
+            return
+        handled = threading.Event()
+        try:
+            self.queue.put(handled, timeout=timeout)
+        except Queue.Full:
+            return
+        handled.wait(timeout)
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _listen(self):
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                return
+            if isinstance(record, threading._Event):
+                record.set()
+                continue
+            try:
+                self.handle(record)
+            except Exception:
+                # the thread has to survive broken handlers
+                pass
+
+
+class HostOutput(object):
+    """Logs lines streamed by the hosts, keeping `every` n-th line
+    and at most `rate` lines per second (with bursts of `burst` lines)
+    of every host. Records carry the host, so they can be routed
+    to the per host files.
+    """
+
+    def __init__(self, log, every=1, rate=None, burst=None):
+        self.log = log
+        self.every = max(1, every or 1)
+        self.rate = rate
+        self.burst = burst or rate
+        self.seen = {}
+        self.dropped = {}
+        self._buckets = {}
+
+    def line(self, host, line):
+        if not line or not self.log.isEnabledFor(logging.DEBUG):
+            return
+        key = netloc(host)
+        seen = self.seen[key] = self.seen.get(key, 0) + 1
+        if (seen - 1) % self.every or not self._allowed(key):
+            self.dropped[key] = self.dropped.get(key, 0) + 1
+            return
+        self.log.debug("%s: %s", key, line.rstrip(), extra={'host': key})
+
+    def _allowed(self, key):
+        """Token bucket rate limiter"""
+        if not self.rate:
+            return True
+        now = time.time()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+
+class HostFileHandler(logging.Handler):
+    """Writes host output records to <directory>/<host>.log"""
+
+    def __init__(self, directory):
+        logging.Handler.__init__(self)
+        self.directory = directory
+        self.files = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def emit(self, record):
+        host = getattr(record, 'host', None)
+        if host is None:
+            return
+        f = self.files.get(host)
+        if f is None:
+            name = host.replace("/", "_").replace(":", "_") + ".log"
+            f = self.files[host] = open(
+                os.path.join(self.directory, name), "a")
+        f.write(self.format(record) + "\n")
+        f.flush()
+
+    def close(self):
+        for f in self.files.itervalues():
+            f.close()
+        self.files.clear()
+        logging.Handler.close(self)
+
+
+class SkipHostOutput(logging.Filter):
+    """Keeps the host output off the handlers when it goes to files"""
+
+    def filter(self, record):
+        return not hasattr(record, 'host')
@@ -0,0 +1,204 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Request metrics collected by the client.
+
+Every request made by :class:`shipper.client.Client` is recorded in a fixed
+bucket latency histogram keyed by host, http method and path template
+(container and image ids are replaced with `{id}`), together with bytes
+sent and received, status codes and errors. Collected metrics can be
+exported in Prometheus text format or as a JSON friendly snapshot:
+
+    from shipper import metrics
+    print metrics.registry.to_prometheus()
+"""
+import re
+import bisect
+
+# latency buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_ID = re.compile(
+    r'^(containers|images|exec)/(?!(?:json|ps|create|viz|search)(?:/|$))'
+    r'[^/]+')
+
+
+def template(path):
+    """Replaces container and image ids in the api path with {id}
+    so requests to the same endpoint share the metrics
+
+    >>> template("containers/5fe8c1d2e3f4/json")
+    'containers/{id}/json'
+    """
+    return _ID.sub(r'\1/{id}', path)
+
+
+class Histogram(object):
+    """Histogram with fixed buckets, recording a value is
+    a binary search and an increment
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Returns upper bound of the bucket holding the quantile,
+        None if there are no observations or it's beyond the last bucket
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def cumulative(self):
+        """Returns list of (upper bound, cumulative count) tuples"""
+        out = []
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            out.append((bound, seen))
+        return out
+
+
+class Endpoint(object):
+    """Metrics of a single (host, method, path template)"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.latency = Histogram(buckets)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.codes = {}
+        self.errors = {}
+
+    def to_dict(self):
+        return {
+            'count': self.latency.count,
+            'latency_sum': self.latency.sum,
+            'latency_p50': self.latency.quantile(0.5),
+            'latency_p99': self.latency.quantile(0.99),
+            'buckets': [[b if b != float('inf') else '+Inf', c]
+                        for b, c in self.latency.cumulative()],
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'codes': dict((str(k), v) for k, v in self.codes.iteritems()),
+            'errors': dict(self.errors)
+        }
+
+
+class Metrics(object):
+    """Registry of the endpoint metrics"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.endpoints = {}
+
+    def record(self, host, method, path, latency, code=None,
+               bytes_in=0, bytes_out=0, error=None):
+        key = (host, method, template(path))
+        endpoint = self.endpoints.get(key)
+        if endpoint is None:
+            endpoint = self.endpoints[key] = Endpoint(self.buckets)
+        endpoint.latency.observe(latency)
+        endpoint.bytes_in += bytes_in
+        endpoint.bytes_out += bytes_out
+        if code is not None:
+            endpoint.codes[code] = endpoint.codes.get(code, 0) + 1
+        if error is not None:
+            endpoint.errors[error] = endpoint.errors.get(error, 0) + 1
+
+    def reset(self):
+        self.endpoints.clear()
+
+    def snapshot(self):
+        """Returns list of json serializable dictionaries,
+        one per endpoint
+        """
+        out = []
+        for (host, method, path), e in sorted(self.endpoints.iteritems()):
+            values = e.to_dict()
+            values.update(host=host, method=method, path=path)
+            out.append(values)
+        return out
+
+    def slowest(self, q=0.99, limit=10):
+        """Returns endpoints with the highest latency quantile"""
+        ranked = []
+        for key, e in self.endpoints.iteritems():
+            value = e.latency.quantile(q)
+            ranked.append((float('inf') if value is None else value, key))
+        ranked.sort(reverse=True)
+        return ranked[:limit]
+
+    def to_prometheus(self, prefix="shipper"):
+        """Renders metrics in Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+
+        items = sorted(self.endpoints.iteritems())
+
+        metric("request_duration_seconds", "histogram",
+               "Docker API request latency")
+        for key, e in items:
+            labels = _labels(*key)
+            for bound, count in e.latency.cumulative():
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(
+                    '{}_request_duration_seconds_bucket{{{},le="{}"}} {}'
+                    .format(prefix, labels, le, count))
+            lines.append("{}_request_duration_seconds_sum{{{}}} {}".format(
+                prefix, labels, repr(e.latency.sum)))
+            lines.append("{}_request_duration_seconds_count{{{}}} {}".format(
+                prefix, labels, e.latency.count))
+
+        for name, attr, help in (
+                ("request_bytes_total", "bytes_out", "Bytes sent"),
+                ("response_bytes_total", "bytes_in", "Bytes received")):
+            metric(name, "counter", help)
+            for key, e in items:
+                lines.append("{}_{}{{{}}} {}".format(
+                    prefix, name, _labels(*key), getattr(e, attr)))
+
+        metric("responses_total", "counter", "Responses by status code")
+        for key, e in items:
+            for code, count in sorted(e.codes.iteritems()):
+                lines.append('{}_responses_total{{{},code="{}"}} {}'.format(
+                    prefix, _labels(*key), code, count))
+
+        metric("errors_total", "counter", "Failed requests by error")
+        for key, e in items:
+            for error, count in sorted(e.errors.iteritems()):
+                lines.append('{}_errors_total{{{},error="{}"}} {}'.format(
+                    prefix, _labels(*key), _escape(error), count))
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(host, method, path):
+    return 'host="{}",method="{}",path="{}"'.format(
+        _escape(host), _escape(method), _escape(path))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+# metrics of the clients that were not given their own
+registry = Metrics()
@@ -0,0 +1,156 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Resource-aware placement of containers on docker hosts.
+
+Placement works on a :class:`Snapshot` of the fleet: host memory capacity
+from `/info` and memory reserved by running containers. Snapshot is gathered
+once and then all the placement decisions are made locally, so placing
+hundreds of containers does not touch the network.
+"""
+import time
+import heapq
+
+from .errors import PlacementError
+
+SPREAD = "spread"
+PACK = "pack"
+
+
+class HostState(object):
+    """Resources of a single docker host as seen at snapshot time.
+    Capacity of None means that host did not report memory and
+    is treated as unlimited.
+    """
+    def __init__(self, host, capacity=None, used=0, images=None):
+        self.host = host
+        self.capacity = capacity
+        self.used = used
+        self.images = images or {}
+
+    def __repr__(self):
+        return "HostState({}, capacity={}, used={}, containers={})".format(
+            self.host, self.capacity, self.used, self.count)
+
+    @property
+    def free(self):
+        if self.capacity is None:
+            return float('inf')
+        return self.capacity - self.used
+
+    @property
+    def count(self):
+        return sum(self.images.itervalues())
+
+    def fits(self, mem_limit):
+        return self.free >= mem_limit
+
+    def reserve(self, image, mem_limit):
+        self.used += mem_limit
+        self.images[image] = self.images.get(image, 0) + 1
+
+    def release(self, image, mem_limit):
+        self.used -= mem_limit
+        self.images[image] -= 1
+
+
+class Snapshot(object):
+    """Cached view of the fleet resources used for placement"""
+
+    def __init__(self, states, taken_at=None):
+        self.states = states
+        self.taken_at = time.time() if taken_at is None else taken_at
+
+    def age(self):
+        return time.time() - self.taken_at
+
+    def is_fresh(self, ttl):
+        return ttl is None or self.age() <= ttl
+
+    @classmethod
+    def from_responses(cls, hosts, infos, containers, details):
+        """Builds snapshot out of `/info` responses (one per host),
+        running containers and results of inspecting them
+        """
+        states = {}
+        for host, info in zip(hosts, infos):
+            capacity = (info or {}).get('MemTotal') or None
+            states[host] = HostState(host, capacity)
+
+        images = dict((c.id, c.image) for c in containers)
+        for d in details:
+            state = states.get(d.host)
+            if state is None:
+                continue
+            config = d.get('Config') or {}
+            image = images.get(d.id) or config.get('Image') or ''
+            # api 1.18 moved the limit to HostConfig
+            memory = (d.get('HostConfig') or {}).get('Memory') or \
+                config.get('Memory') or 0
+            state.reserve(image, memory)
+
+        return cls([states[h] for h in hosts])
+
+
+def place(snapshot, count, mem_limit=0, image=None,
+          anti_affinity=False, strategy=SPREAD):
+    """Decides where to put `count` containers with `mem_limit` bytes
+    of memory each. Returns a list of hosts, one per container, and
+    reserves the resources in the snapshot, so subsequent placements
+    take these containers into account.
+
+    * spread strategy puts every next container on the host with most
+    free memory (and the least containers for unlimited containers)
+    * pack strategy fills the fullest host that still has the room
+
+    With `anti_affinity` set, no two containers of the same image end up
+    on the same host, including containers that are already running.
+    """
+    if strategy not in (SPREAD, PACK):
+        raise ValueError("Unsupported strategy: {}".format(strategy))
+
+    mem_limit = mem_limit or 0
+    heap = []
+    for index, state in enumerate(snapshot.states):
+        if not state.fits(mem_limit):
+            continue
+        if anti_affinity and state.images.get(image):
+            continue
+        heapq.heappush(heap, (_priority(state, strategy), index, state))
+
+    placed = []
+    while len(placed) < count and heap:
+        _, index, state = heapq.heappop(heap)
+        state.reserve(image, mem_limit)
+        placed.append(state.host)
+        if not anti_affinity and state.fits(mem_limit):
+            heapq.heappush(heap, (_priority(state, strategy), index, state))
+
+    if len(placed) < count:
+        # placement is all or nothing
+        release(snapshot, placed, mem_limit, image)
+        raise PlacementError(
+            "Can place only {} out of {} containers of {}".format(
+                len(placed), count, image))
+    return placed
+
+
+def release(snapshot, hosts, mem_limit=0, image=None):
+    """Returns the resources reserved by :func:`place` on the hosts
+    back to the snapshot, e.g. when creating the containers failed
+    """
+    for host in hosts:
+        _find(snapshot, host).release(image, mem_limit or 0)
+
+
+def _priority(state, strategy):
+    if strategy == SPREAD:
+        return (-state.free, state.count)
+    return (state.free, -state.count)
+
+
+def _find(snapshot, host):
+    for state in snapshot.states:
+        if state.host == host:
+            return state
@@ -0,0 +1,95 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Batched operation plans.
+
+Plan records a chain of dependent operations and executes the whole chain
+for every host independently inside the reactor, e.g.:
+
+    s.plan().containers(image="web").stop().run("web", "serve").submit()
+
+Every step gets the result of the previous step on the same host, so a
+slow host does not hold up the others between the steps, and the calling
+thread crosses into the reactor only once.
+"""
+from twisted.internet import defer
+
+
+class Plan(object):
+    """Sequence of operations executed per host by :class:`AsyncShipper`.
+    Steps operate on the list of containers produced by the previous step.
+    """
+
+    def __init__(self, shipper, submit=None):
+        self.shipper = shipper
+        self.steps = []
+        self._submit = submit
+
+    def containers(self, **kwargs):
+        """Lists containers on the host, see `AsyncShipper.containers`"""
+        return self.then(lambda s, _: s.containers(**kwargs))
+
+    def stop(self, **kwargs):
+        """Stops containers returned by the previous step"""
+        return self.then(lambda s, cs: s.stop(*cs, **kwargs).addCallback(
+            lambda stopped: list(stopped)))
+
+    def start(self, **kwargs):
+        """Starts containers returned by the previous step"""
+        return self.then(lambda s, cs: s.start(*cs, **kwargs).addCallback(
+            lambda _: cs))
+
+    def run(self, image, command, **kwargs):
+        """Runs new containers on the host, see `AsyncShipper.run`"""
+        return self.then(lambda s, _: s.run(image, command, **kwargs))
+
+    def inspect(self):
+        """Inspects containers returned by the previous step"""
+        return self.then(lambda s, cs: s.inspect(*cs))
+
+    def wait(self):
+        """Waits for containers returned by the previous step to stop,
+        results in list of (container, status) tuples
+        """
+        return self.then(lambda s, cs: s.wait(*cs))
+
+    def then(self, fn):
+        """Adds custom step, `fn(shipper, previous)` gets AsyncShipper
+        limited to the single host and result of the previous step,
+        and returns a deferred or a value
+        """
+        self.steps.append(fn)
+        return self
+
+    def submit(self):
+        """Executes the plan and returns flat list of the last step
+        results from all the hosts.
+        """
+        if self._submit is not None:
+            return self._submit(self.execute)
+        return self.execute()
+
+    def execute(self):
+        """Executes the plan in the reactor thread, returns deferred"""
+        deferreds = [self._chain(self.shipper.on([host]))
+                     for host in self.shipper.hosts]
+        d = defer.gatherResults(deferreds, consumeErrors=True)
+        d.addCallback(_concat)
+        return d
+
+    def _chain(self, shipper):
+        d = defer.succeed([])
+        for step in self.steps:
+            d.addCallback(lambda previous, step=step: step(shipper, previous))
+        return d
+
+
+def _concat(results):
+    out = []
+    for result in results:
+        if isinstance(result, (list, tuple)):
+            out.extend(result)
+        else:
+            out.append(result)
+    return out
@@ -1,10 +1,12 @@
 """Pretty printing for containers and images
 """
+import csv
+import json
 from StringIO import StringIO
+from datetime import datetime
 from contextlib import closing
 
-from texttable import Texttable as TextTable
-
+from .host import netloc
 from .utils import time_ago, human_size
 
 
@@ -13,6 +15,7 @@ def images_to_ascii_table(images):
     Expects dictionary {host: [images]}
     and prints multiple tables
     """
+    from texttable import Texttable as TextTable
     with closing(StringIO()) as out:
         for host, values in images.iteritems():
             out.write(str(host) + "\n")
@@ -40,6 +43,7 @@ def containers_to_ascii_table(containers):
     Expects dictionary {host: [images]}
     and prints multiple tables
     """
+    from texttable import Texttable as TextTable
     with closing(StringIO()) as out:
         for host, values in containers.iteritems():
             out.write("[" + str(host) + "] \n")
@@ -63,3 +67,197 @@ def containers_to_ascii_table(containers):
             t.add_rows(rows)
             out.write(t.draw() + "\n\n")
         return out.getvalue()
+
+
+def _ports(ports):
+    if not isinstance(ports, list):
+        return str(ports or '')
+    out = []
+    for p in ports:
+        if isinstance(p, dict):
+            out.append("{}->{}/{}".format(
+                p.get('PublicPort', ''), p.get('PrivatePort', ''),
+                p.get('Type', 'tcp')))
+        else:
+            out.append(str(p))
+    return ", ".join(out)
+
+
+# (header, width, getter) of the columns of streamed tables
+CONTAINER_COLUMNS = [
+    ('Id', 12, lambda c: c.id[:12]),
+    ('Image', 25, lambda c: c.image),
+    ('Command', 25, lambda c: c.command[:20]),
+    ('Created', 15, lambda c: time_ago(c.created)),
+    ('Status', 20, lambda c: c.status),
+    ('Ports', 15, lambda c: _ports(c.ports)),
+]
+
+IMAGE_COLUMNS = [
+    ('Repository', 30, lambda i: i.repository or '<none>'),
+    ('Tag', 15, lambda i: i.tag or '<none>'),
+    ('Id', 12, lambda i: i.id[:12]),
+    ('Created', 15, lambda i: time_ago(i.created)),
+    ('Size', 10, lambda i: human_size(i.size)),
+]
+
+
+class Stream(object):
+    """Writes records of every host to the output as soon as they arrive.
+
+    Supported formats are:
+
+    * table - fixed width columns, no need to see all the rows first
+    * json - one json object per line
+    * csv - comma separated values with a single header line
+    """
+
+    def __init__(self, out, columns, format="table"):
+        if format not in ("table", "json", "csv"):
+            raise ValueError("Unsupported format: {}".format(format))
+        self.out = out
+        self.columns = columns
+        self.format = format
+        self.header = "  ".join(
+            h.ljust(w) for h, w, _ in columns).rstrip()
+        self._csv = None
+
+    def write(self, host, values):
+        getattr(self, "_write_" + self.format)(host, values)
+        self.out.flush()
+
+    def _write_table(self, host, values):
+        lines = ["[" + str(host) + "]", self.header,
+                 "=" * len(self.header)]
+        for v in values:
+            lines.append("  ".join(
+                _fit(get(v), width)
+                for _, width, get in self.columns).rstrip())
+        self.out.write("\n".join(lines) + "\n\n")
+
+    def _write_json(self, host, values):
+        for v in values:
+            record = dict(v)
+            record['Host'] = netloc(host)
+            self.out.write(json.dumps(record, default=str) + "\n")
+
+    def _write_csv(self, host, values):
+        if self._csv is None:
+            self._csv = csv.writer(self.out)
+            self._csv.writerow(['Host'] + [h for h, _, _ in self.columns])
+        name = netloc(host)
+        for v in values:
+            self._csv.writerow([name] + [
+                _encode(get(v)) for _, _, get in self.columns])
+
+
+STATS_COLUMNS = [
+    ('Id', 12, lambda s: s['Id'][:12]),
+    ('Image', 25, lambda s: s['Image']),
+    ('CPU %', 7, lambda s: "{:.1f}".format(s['CPU'])),
+    ('Memory', 10, lambda s: human_size(s['Memory'])),
+    ('Limit', 10, lambda s: human_size(s['MemoryLimit'])),
+    ('Net In/s', 10, lambda s: human_size(int(s['NetIn']))),
+    ('Net Out/s', 10, lambda s: human_size(int(s['NetOut']))),
+]
+
+ROLLUP_COLUMNS = [
+    ('Group', 30, lambda s: s['Group']),
+    ('Containers', 10, lambda s: s['Containers']),
+    ('CPU %', 7, lambda s: "{:.1f}".format(s['CPU'])),
+    ('Memory', 10, lambda s: human_size(s['Memory'])),
+    ('Net In/s', 10, lambda s: human_size(int(s['NetIn']))),
+    ('Net Out/s', 10, lambda s: human_size(int(s['NetOut']))),
+]
+
+
+def stats_to_text(stats, by=None, top=None, key='CPU', format="table"):
+    """Formats :class:`shipper.stats.Stats` as tables per host, rolled up
+    `by` host or image, or `top` containers sorted by the `key`,
+    in any format supported by :class:`Stream`
+    """
+    with closing(StringIO()) as out:
+        if by:
+            Stream(out, ROLLUP_COLUMNS, format).write(
+                "by " + by, stats.rollup(by))
+        elif top:
+            Stream(out, STATS_COLUMNS, format).write(
+                "top {} by {}".format(top, key), stats.top(top, key))
+        else:
+            stream = Stream(out, STATS_COLUMNS, format)
+            rows = {}
+            for row in stats.rows():
+                rows.setdefault(row['Host'], []).append(row)
+            for host in sorted(rows):
+                stream.write(host, sorted(rows[host], key=lambda r: r['Id']))
+        return out.getvalue()
+
+
+def _when(epoch):
+    if epoch is None:
+        return "now"
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# columns of the rows recorded by :class:`shipper.history.History`
+HISTORY_CONTAINER_COLUMNS = [
+    ('Id', 12, lambda r: r['id'][:12]),
+    ('Image', 25, lambda r: r['image']),
+    ('Command', 25, lambda r: (r['command'] or '')[:20]),
+    ('State', 10, lambda r: r['state']),
+    ('First seen', 19, lambda r: _when(r['first_seen'])),
+    ('Last seen', 19, lambda r: _when(r['last_seen'])),
+]
+
+HISTORY_IMAGE_COLUMNS = [
+    ('Repository', 30, lambda r: r['repository']),
+    ('Tag', 15, lambda r: r['tag']),
+    ('Id', 12, lambda r: r['id'][:12]),
+    ('Size', 10, lambda r: human_size(r['size'] or 0)),
+    ('First seen', 19, lambda r: _when(r['first_seen'])),
+    ('Last seen', 19, lambda r: _when(r['last_seen'])),
+]
+
+CHANGE_COLUMNS = [
+    ('Time', 19, lambda r: _when(r['time'])),
+    ('Change', 8, lambda r: r['change']),
+    ('Id', 12, lambda r: r['id'][:12]),
+    ('Image', 25, lambda r: r.get('image') or r.get('repository')),
+    ('State', 10, lambda r: r.get('state') or r.get('tag')),
+]
+
+
+def history_to_text(rows, columns, format="table"):
+    """Formats rows of :class:`shipper.history.History` grouped by host"""
+    with closing(StringIO()) as out:
+        stream = Stream(out, columns, format)
+        hosts = []
+        grouped = {}
+        for row in rows:
+            if row['host'] not in grouped:
+                hosts.append(row['host'])
+            grouped.setdefault(row['host'], []).append(row)
+        for host in hosts:
+            stream.write(host, grouped[host])
+        return out.getvalue()
+
+
+def containers_stream(out, format="table"):
+    return Stream(out, CONTAINER_COLUMNS, format)
+
+
+def images_stream(out, format="table"):
+    return Stream(out, IMAGE_COLUMNS, format)
+
+
+def _fit(value, width):
+    value = _encode(value)
+    if len(value) > width:
+        return value[:width - 1] + "~"
+    return value.ljust(width)
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
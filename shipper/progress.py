@@ -0,0 +1,277 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Live progress of the fleet operations.
+
+Every fan-out of :class:`shipper.async_shipper.AsyncShipper` to the hosts
+is tracked as :class:`Progress` while there are callbacks watching it.
+Callbacks are called in the reactor thread when the operation starts,
+when every host finishes and when the whole operation is done:
+
+    from shipper import progress
+
+    def report(p):
+        print p.name, p.counts(), p.eta(), p.slowest(3)
+
+    progress.registry.add(report)
+
+:class:`StatusLine` renders the operations in flight as a single line on
+the terminal, the runner shows it when SHIPPER_PROGRESS is set.
+"""
+import sys
+import time
+import bisect
+import logging
+
+from .host import netloc
+from .utils import notify
+
+log = logging.getLogger(__name__)
+
+PENDING, RUNNING, SUCCEEDED, FAILED = (
+    "pending", "running", "succeeded", "failed")
+
+
+class Task(object):
+    """Call of the operation on a single host"""
+
+    __slots__ = ('progress', 'host', 'started', 'finished', 'state')
+
+    def __init__(self, progress, host):
+        self.progress = progress
+        self.host = host
+        self.started = None
+        self.finished = None
+        self.state = PENDING
+
+    def start(self):
+        self.started = self.progress.clock()
+        self.state = RUNNING
+
+    def finish(self, result):
+        """Deferred callback and errback, passes the result through"""
+        from twisted.python.failure import Failure
+        self.finished = self.progress.clock()
+        self.state = FAILED if isinstance(result, Failure) else SUCCEEDED
+        self.progress._finished(self)
+        return result
+
+    def elapsed(self, now=None):
+        if self.started is None:
+            return 0.0
+        return (self.finished or now or self.progress.clock()) - self.started
+
+
+class Progress(object):
+    """Progress of an operation across the hosts"""
+
+    def __init__(self, name, monitor=None, clock=time.time):
+        self.name = name
+        self.monitor = monitor
+        self.clock = clock
+        self.started = clock()
+        self.tasks = []
+        self.outstanding = 0
+        self.closed = False
+        self.done = False
+
+    def add(self, host):
+        task = Task(self, host)
+        self.tasks.append(task)
+        self.outstanding += 1
+        return task
+
+    def track(self, host, d):
+        """Tracks the call of the host that is already in flight"""
+        task = self.add(host)
+        task.start()
+        return d.addBoth(task.finish)
+
+    def close(self):
+        """No more tasks are added, the operation is done once
+        the outstanding ones finish
+        """
+        self.closed = True
+        self._fire()
+
+    def counts(self):
+        counts = dict.fromkeys((PENDING, RUNNING, SUCCEEDED, FAILED), 0)
+        for task in self.tasks:
+            counts[task.state] += 1
+        return counts
+
+    def elapsed(self):
+        """Seconds spent by every host, finished hosts first"""
+        now = self.clock()
+        return [(netloc(t.host), t.elapsed(now)) for t in self.tasks
+                if t.started is not None]
+
+    def slowest(self, n=5):
+        """Outstanding hosts that take the longest"""
+        now = self.clock()
+        running = [t for t in self.tasks if t.state == RUNNING]
+        running.sort(key=lambda t: t.started)
+        return [(netloc(t.host), t.elapsed(now)) for t in running[:n]]
+
+    def eta(self):
+        """Seconds till the operation is done, None if it's unknown.
+        Running hosts are expected to take as long as the finished
+        hosts that ran longer than them, pending ones the median time.
+        """
+        if self.done:
+            return 0.0
+        times = sorted(t.elapsed() for t in self.tasks if t.finished)
+        if not times:
+            return None
+        now = self.clock()
+        remaining = [0.0]
+        for task in self.tasks:
+            if task.state == RUNNING:
+                elapsed = task.elapsed(now)
+                later = bisect.bisect_left(times, elapsed)
+                if later == len(times):
+                    # outlived every finished host
+                    return None
+                remaining.append(times[later] - elapsed)
+        pending = any(t.state == PENDING for t in self.tasks)
+        return max(remaining) + (times[len(times) // 2] if pending else 0.0)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'counts': self.counts(),
+            'elapsed': self.clock() - self.started,
+            'eta': self.eta(),
+            'slowest': self.slowest(),
+            'done': self.done,
+        }
+
+    def __repr__(self):
+        return "Progress({}, {})".format(self.name, self.counts())
+
+    def _finished(self, task):
+        self.outstanding -= 1
+        self._fire()
+
+    def _fire(self):
+        self.done = self.closed and self.outstanding == 0
+        if self.monitor is not None:
+            self.monitor.fire(self)
+
+
+class Monitor(object):
+    """Registry of the progress callbacks and the operations in
+    flight, evaluates to False if there are no callbacks
+    """
+
+    def __init__(self):
+        self.callbacks = []
+        self.active = []
+
+    def __nonzero__(self):
+        return bool(self.callbacks)
+
+    def add(self, callback):
+        self.callbacks.append(callback)
+
+    def remove(self, callback):
+        self.callbacks.remove(callback)
+
+    def start(self, name):
+        """Returns new :class:`Progress` of the operation"""
+        progress = Progress(name, self)
+        self.active.append(progress)
+        return progress
+
+    def fire(self, progress):
+        if progress.done and progress in self.active:
+            self.active.remove(progress)
+        notify(self.callbacks, log, progress)
+
+
+class StatusLine(object):
+    """Progress callback rendering the operations in flight as a single
+    line, rewritten in place on terminals, at most every `interval`
+    seconds. `refresh` keeps elapsed times and ETA ticking while the
+    hosts are silent.
+    """
+
+    def __init__(self, stream=None, interval=0.5, monitor=None):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.monitor = monitor or registry
+        self.tty = getattr(self.stream, 'isatty', lambda: False)()
+        self.written = 0
+        self.last = 0
+        self.loop = None
+
+    def __call__(self, progress):
+        now = time.time()
+        if progress.done:
+            self._write(render(progress), final=True)
+        elif now - self.last >= self.interval:
+            self.refresh()
+
+    def refresh(self):
+        self.last = time.time()
+        if self.monitor.active:
+            self._write(" | ".join(render(p) for p in self.monitor.active))
+
+    def start(self):
+        """Registers the callback and refreshes the line periodically"""
+        from twisted.internet import task
+        self.monitor.add(self)
+        self.loop = task.LoopingCall(self.refresh)
+        self.loop.start(self.interval, now=False)
+
+    def stop(self):
+        self.monitor.remove(self)
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        if self.written:
+            self.stream.write("\n")
+            self.written = 0
+
+    def _write(self, line, final=False):
+        if not self.tty:
+            self.stream.write(line + "\n")
+        else:
+            padding = " " * max(0, self.written - len(line))
+            self.stream.write("\r" + line + padding)
+            self.written = len(line)
+            if final:
+                self.stream.write("\n")
+                self.written = 0
+        self.stream.flush()
+
+
+def render(progress):
+    """One line summary of the operation"""
+    counts = progress.counts()
+    finished = counts[SUCCEEDED] + counts[FAILED]
+    parts = ["{} {}/{}".format(progress.name, finished, len(progress.tasks))]
+    if counts[FAILED]:
+        parts.append("failed={}".format(counts[FAILED]))
+    if counts[RUNNING]:
+        parts.append("running={}".format(counts[RUNNING]))
+    if counts[PENDING]:
+        parts.append("pending={}".format(counts[PENDING]))
+    if progress.done:
+        parts.append("done in {:.1f}s".format(
+            progress.clock() - progress.started))
+        return " ".join(parts)
+    eta = progress.eta()
+    if eta is not None:
+        parts.append("eta {:.0f}s".format(eta))
+    # hosts that just started are not worth the attention
+    slowest = [(host, elapsed) for host, elapsed in progress.slowest(3)
+               if elapsed >= 1]
+    if slowest:
+        parts.append("slowest " + ", ".join(
+            "{} {:.1f}s".format(host, elapsed) for host, elapsed in slowest))
+    return " ".join(parts)
+
+
+# callbacks watching the fan-outs of all the shippers
+registry = Monitor()
@@ -0,0 +1,207 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Compact read-only records for docker api replies.
+
+Listing containers on a large fleet gives hundreds of thousands of
+replies. Instead of copying every reply into a dictionary, records keep
+the values in a single tuple. Replies of one listing share the same
+keys, so the keys, their positions and the getter extracting the values
+in one call live in a layout shared by all the records shaped alike.
+Image names are interned, as they repeat across the records, and ids
+are stored as byte strings.
+
+Records support dictionary style reads, so `c['Id']`, `c.get('Ports')`,
+`'Status' in c`, iteration and `dict(c)` work as before. They are
+registered as Mapping, but they are not dicts: `isinstance(c, dict)` is
+False, they can't be changed and `json.dumps` needs `c.to_dict()`, which
+also gives a copy to change.
+"""
+from operator import itemgetter
+from collections import Mapping
+
+# repeated strings shared between the records, the table is cleared
+# once it outgrows the limit, so it stays bounded on any fleet
+_strings = {}
+_LIMIT = 10000
+
+# layouts kept per record class, replies with unusual keys can't grow
+# the table past the limit
+_LAYOUTS = 100
+
+
+def _getter(fields):
+    if not fields:
+        return lambda values: ()
+    if len(fields) == 1:
+        return lambda values: (values[fields[0]],)
+    return itemgetter(*fields)
+
+
+def _compact(value):
+    """Ascii unicode strings (ids) take 3 times less memory
+    as byte strings
+    """
+    if type(value) is not unicode:
+        return value
+    try:
+        return str(value)
+    except UnicodeEncodeError:
+        return value
+
+
+def _preparer(compact, shared):
+    """Returns function compacting the id and interning the strings
+    leading the row, or None if there is nothing to do
+    """
+    if not shared:
+        return None
+    start = 1 if compact else 0
+
+    def prepare(row):
+        if len(_strings) > _LIMIT:
+            _strings.clear()
+        intern = _strings.setdefault
+        head = [intern(s, s) for s in row[start:shared]]
+        if compact:
+            head.insert(0, _compact(row[0]))
+        return tuple(head) + row[shared:]
+    return prepare
+
+
+class _Layout(object):
+    """Keys shared by the replies shaped alike, the id goes first,
+    then the interned fields
+    """
+    __slots__ = ('fields', 'index', 'size', 'get', 'prepare')
+
+    def __init__(self, keys, id, interned):
+        first = [f for f in (id,) + interned if f in keys]
+        self.fields = tuple(first + sorted(set(keys) - set(first)))
+        self.index = dict((f, i) for i, f in enumerate(self.fields))
+        self.size = len(self.fields)
+        self.get = _getter(self.fields)
+        self.prepare = _preparer(id in keys, len(first))
+
+
+class Record(object):
+    """Base for the compact records.
+
+    Subclasses name the id field in `_id` and the strings repeating
+    across the records in `_interned`.
+    """
+    __slots__ = ('host', '_layout', '_values', '_cache')
+
+    _id = None
+    _interned = ()
+
+    class __metaclass__(type):
+        def __init__(cls, name, bases, attrs):
+            type.__init__(cls, name, bases, attrs)
+            cls._layouts = {}
+            cls._last = _Layout((), cls._id, cls._interned)
+
+    @classmethod
+    def _shape(cls, values):
+        keys = frozenset(values)
+        layout = cls._layouts.get(keys)
+        if layout is None:
+            if len(cls._layouts) >= _LAYOUTS:
+                cls._layouts.clear()
+            layout = cls._layouts[keys] = _Layout(
+                keys, cls._id, cls._interned)
+        cls._last = layout
+        return layout
+
+    def __init__(self, host, values):
+        self.host = host
+        self._cache = None
+        layout = self._last
+        try:
+            row = layout.get(values)
+            if len(values) != layout.size:
+                raise KeyError()
+        except KeyError:
+            layout = self._shape(values)
+            row = layout.get(values)
+        self._layout = layout
+        if layout.prepare is not None:
+            row = layout.prepare(row)
+        self._values = row
+
+    def __reduce__(self):
+        return (self.__class__, (self.host, self.to_dict()))
+
+    def __getitem__(self, key):
+        return self._values[self._layout.index[key]]
+
+    def __contains__(self, key):
+        return key in self._layout.index
+
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        index = self._layout.index.get(key)
+        return default if index is None else self._values[index]
+
+    def iteritems(self):
+        return iter(zip(self._layout.fields, self._values))
+
+    def iterkeys(self):
+        return iter(self._layout.fields)
+
+    def itervalues(self):
+        return iter(self._values)
+
+    __iter__ = iterkeys
+
+    def items(self):
+        return zip(self._layout.fields, self._values)
+
+    def keys(self):
+        return list(self._layout.fields)
+
+    def values(self):
+        return list(self._values)
+
+    def __len__(self):
+        return self._layout.size
+
+    def to_dict(self):
+        return dict(zip(self._layout.fields, self._values))
+
+    def copy(self):
+        return self.to_dict()
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{}(host={}, {})".format(
+            self.__class__.__name__, self.host, self.to_dict())
+
+    __str__ = __repr__
+
+    def _cached(self, name, compute):
+        """Returns derived property, computing it once"""
+        if self._cache is None:
+            self._cache = {}
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = compute()
+            return value
+
+
+Mapping.register(Record)
@@ -14,18 +14,29 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
+import sys
+import json
+import time
+import shlex
+import socket
 import argparse
 import inspect
 import logging
 from threading import Thread
-
-from twisted.internet import reactor
+from collections import namedtuple
+from contextlib import closing, contextmanager
 
 from . import auto
-from . import Shipper
 
 functions = []
 
+# set while the daemon loads the scripts, so `run` collects
+# the commands instead of executing them
+_collected = None
+
+Step = namedtuple("Step", "line text args parallel")
+
 
 def command(fn):
     """Decorator that just register the function
@@ -43,40 +54,63 @@ def run(*args):
     global functions
     functions = functions + list(args)
 
+    if _collected is not None:
+        _collected.extend(functions)
+        return
+
     parser = argparse.ArgumentParser(
         description=_info())
 
-    auto.generate(parser, *functions)
+    subparsers = auto.generate(parser, *functions)
+    if "batch" not in [f.__name__ for f in functions]:
+        _add_batch(subparsers)
 
+    # help and usage errors exit here, before the reactor is imported
     args = parser.parse_args()
-    function = args.fn
+    batch = getattr(args, 'batch_file', None)
+    if batch is not None:
+        function = _batch(parser, batch, args.keep_going)
+    else:
+        function = args.fn
+
+    # the command is executed by the daemon if there is one listening,
+    # batches already run all their commands in a single process
+    path = os.environ.get("SHIPPER_SOCKET")
+    if path and batch is None:
+        code = _forward(path, os.path.abspath(sys.argv[0]), sys.argv[1:])
+        if code is not None:
+            exit(code)
+
+    from twisted.internet import reactor
+    from .shipper import Shipper
 
-    Shipper.startup()
+    Shipper.startup(tls=_tls())
+    if os.environ.get("SHIPPER_HISTORY"):
+        Shipper.open_history(os.environ["SHIPPER_HISTORY"])
+    status = _status_line()
     log = logging.getLogger(__name__)
     failed = []
 
     def call(*args, **kwargs):
         try:
             function(*args, **kwargs)
+        except _StepsFailed:
+            failed.append(True)
         except:
             log.exception("Exception calling shipper!")
             failed.append(True)
         else:
             failed.append(False)
+        finally:
+            Shipper.shutdown()
+            if status is not None:
+                reactor.callFromThread(status.stop)
+            reactor.callFromThread(reactor.stop)
 
     t = Thread(target=call, args=(args,))
     t.daemon = True
     t.start()
 
-    def waiter(th):
-        th.join()
-        Shipper.shutdown()
-        reactor.callFromThread(reactor.stop)
-
-    w = Thread(target=waiter, args=(t,))
-    w.daemon = True
-    w.start()
-
     reactor.run()
 
     if failed[0]:
@@ -86,6 +120,178 @@ def run(*args):
         log.error("Shipper executed successfully")
 
 
+class _StepsFailed(Exception):
+    pass
+
+
+def _add_batch(subparsers):
+    parser = subparsers.add_parser(
+        "batch",
+        help="Runs commands listed in the file, one per line, "
+        "in a single session. Consecutive commands ending with & "
+        "run in parallel. Reads stdin if the file is -")
+    parser.add_argument("batch_file", metavar="file")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="run the rest of the commands if one fails")
+
+
+def _batch(parser, path, keep_going=False):
+    """Parses commands listed in the file and returns function running
+    them, exits with usage error if any of the commands is invalid
+    """
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as f:
+            lines = f.readlines()
+
+    steps = []
+    for number, text in enumerate(lines, 1):
+        tokens = shlex.split(text, comments=True)
+        if not tokens:
+            continue
+        parallel = tokens[-1] == "&"
+        if parallel:
+            tokens.pop()
+        try:
+            args = parser.parse_args(tokens)
+        except SystemExit:
+            parser.exit(2, "{}:{}: invalid command: {}\n".format(
+                path, number, text.strip()))
+        if getattr(args, 'batch_file', None) is not None:
+            parser.exit(2, "{}:{}: batches can not be nested\n".format(
+                path, number))
+        steps.append(Step(number, " ".join(tokens), args, parallel))
+
+    return lambda _: _run_steps(steps, keep_going)
+
+
+def _run_steps(steps, keep_going):
+    """Runs the steps in order, consecutive parallel steps are run
+    at the same time, and logs the summary
+    """
+    log = logging.getLogger(__name__)
+    results = []
+
+    def step(s):
+        started = time.time()
+        try:
+            s.args.fn(s.args)
+        except:
+            log.exception("Step %s failed: %s", s.line, s.text)
+            results.append((s, False, time.time() - started))
+        else:
+            results.append((s, True, time.time() - started))
+
+    for group in _groups(steps):
+        if len(group) == 1:
+            step(group[0])
+        else:
+            workers = [Thread(target=step, args=(s,)) for s in group]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        if not keep_going and not all(ok for _, ok, _ in results):
+            break
+
+    results.sort(key=lambda r: r[0].line)
+    executed = set(s.line for s, _, _ in results)
+    for s, ok, elapsed in results:
+        log.info("%4s %-7s %8.2fs  %s",
+                 s.line, "ok" if ok else "FAILED", elapsed, s.text)
+    for s in steps:
+        if s.line not in executed:
+            log.info("%4s %-7s %9s  %s", s.line, "skipped", "", s.text)
+
+    if not all(ok for _, ok, _ in results) or len(results) < len(steps):
+        raise _StepsFailed()
+
+
+def _groups(steps):
+    """Splits steps into groups executed at the same time"""
+    groups = []
+    for s in steps:
+        if s.parallel and groups and groups[-1][-1].parallel:
+            groups[-1].append(s)
+        else:
+            groups.append([s])
+    return groups
+
+
+@contextmanager
+def collecting():
+    """Collects commands of the scripts imported in the block
+    instead of running them
+    """
+    global functions, _collected
+    saved, functions, _collected = functions, [], []
+    commands = _collected
+    try:
+        yield commands
+    finally:
+        if not commands:
+            # script does not call run, e.g. it's guarded by __main__
+            commands.extend(functions)
+        functions, _collected = saved, None
+
+
+def _forward(path, script, argv, stdout=None, stderr=None):
+    """Executes command in the daemon listening on the UNIX socket
+    and streams its output, returns the exit code or None if
+    there is no daemon
+    """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except socket.error:
+        s.close()
+        return None
+
+    with closing(s):
+        s.sendall(json.dumps({'script': script, 'argv': argv}) + "\n")
+        for line in s.makefile():
+            message = json.loads(line)
+            if 'exit' in message:
+                return message['exit']
+            if 'out' in message:
+                stream = stdout or sys.stdout
+            else:
+                stream = stderr or sys.stderr
+            stream.write(
+                (message.get('out') or message.get('err')).encode('utf-8'))
+            stream.flush()
+    return -1
+
+
+def _tls():
+    """TLS options from the environment, the ssl modules
+    are imported only if the certificates are set
+    """
+    if os.environ.get("SHIPPER_CERT_PATH") or \
+            os.environ.get("DOCKER_CERT_PATH"):
+        from .tls import from_environment
+        return from_environment()
+    return None
+
+
+def _status_line():
+    """Live status line of the operations in flight on stderr if
+    SHIPPER_PROGRESS is set to the refresh interval in seconds
+    """
+    interval = os.environ.get("SHIPPER_PROGRESS")
+    if not interval:
+        return None
+    from .progress import StatusLine
+    try:
+        interval = max(0.1, float(interval))
+    except ValueError:
+        interval = 0.5
+    status = StatusLine(interval=interval)
+    status.start()
+    return status
+
+
 def _info():
     """Returns the module doc string"""
     frm = inspect.stack()[-1]
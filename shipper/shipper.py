@@ -6,241 +6,304 @@
 quirks of the official docker-py client.
 """
 
-import re
+import os
+import atexit
 import logging
 import logging.handlers
 import socket
-from copy import copy
-from collections import namedtuple
 
-from twisted.internet import reactor
-from twisted.web.client import HTTPConnectionPool
-from twisted.internet import threads
-from twisted.internet import defer
-
-from .utils import parse_volumes, parse_ports
-from .container import Container, ContainerConfig
-from .image import Image
-from .host import parse_hosts
-from .pretty import images_to_ascii_table, containers_to_ascii_table
-from .client import Client
-from .build import DockerFile
+from .inventory import Inventory
+from .placement import SPREAD
+from . import hooks
+from . import progress
+from . import logs
 
 
 class Shipper(object):
     """Shipper is a class providing parallelized operations
     docker client on multiple hosts and various shortcuts and
     convenience methods on top of the raw docker client.
+
+    Shipper methods block the calling thread until the operation is
+    done in the reactor thread, see :class:`AsyncShipper`
+    for the non-blocking flavour.
+
+    Twisted and the docker client are imported on the first use, so
+    scripts importing Shipper can parse arguments and print help fast.
     """
 
     pool = None
     log = None
+    listener = None
+    output = None
+    inventory = None
+    # (path, mtime, default port) the inventory was loaded from
+    _inventory_source = None
+    # :class:`shipper.tls.TLSOptions` of the https hosts
+    tls = None
+    # :class:`shipper.history.History` recording the listings
+    history = None
+    # placement snapshots shared by all the shippers if set,
+    # the daemon keeps them warm between the commands
+    snapshots = None
+    # :class:`shipper.listings.Listings` shared by all the shippers
+    # if set, the daemon's commands share the container listings
+    listings = None
 
     @classmethod
-    def startup(cls):
-        """Initiates connection pool and logging.
-
-        We can not use persisten connections here as docker server
-        has some troubles with those
+    def startup(cls, persistent=None, tls=None, **kwargs):
+        """Initiates connection pool and logging, see `_init_logging`
+        for the logging options. https hosts are connected with `tls`
+        options, see :mod:`shipper.tls`.
+
+        We do not use persisten connections by default as docker server
+        has some troubles with those, unless TLS is set, as handshakes
+        cost more than the troubles
         """
-        cls.pool = HTTPConnectionPool(reactor, persistent=False)
-        cls._init_logging()
+        from twisted.internet import reactor
+        from twisted.web.client import HTTPConnectionPool
+        if persistent is None:
+            persistent = tls is not None
+        cls.pool = HTTPConnectionPool(reactor, persistent=persistent)
+        cls.tls = tls
+        cls._init_logging(**kwargs)
 
     @classmethod
     def shutdown(cls):
         """Shuts down connection pool"""
+        from twisted.internet import reactor, threads
         threads.blockingCallFromThread(
             reactor, cls.pool.closeCachedConnections)
+        if cls.history is not None:
+            cls.history.flush()
 
-    def __init__(self, hosts=None, version="1.6", timeout=None,
-                 client_builder=None):
-        self.hosts = parse_hosts(hosts or ["localhost"])
-
-        if client_builder is None:
-            client_builder = Client
-        self.c = client_builder(
-            version, timeout, log=self.log, pool=self.pool)
+    @classmethod
+    def open_history(cls, path=None):
+        """Records listings of containers and images and inspect replies
+        of all the shippers to the SQLite database, see
+        :mod:`shipper.history`
+        """
+        from .history import History, DEFAULT_PATH
+        cls.history = History(path or DEFAULT_PATH)
+        return cls.history
 
-        self.version = version
-        self.timeout = timeout
+    @classmethod
+    def load_inventory(cls, path, default_port=4243):
+        """Loads host inventory file, so hosts can be selected
+        by tags and groups, e.g. Shipper("tag:web"). The same file is
+        loaded again only when it changes, so the daemon's commands
+        share the inventory and its indexes.
+        """
+        source = (os.path.abspath(path), os.path.getmtime(path),
+                  default_port)
+        if cls.inventory is None or cls._inventory_source != source:
+            cls.inventory = Inventory.load(path, default_port=default_port)
+            cls._inventory_source = source
+        return cls.inventory
+
+    def __init__(self, hosts=None, version=None, timeout=None,
+                 client_builder=None, processes=None):
+        from .async_shipper import AsyncShipper
+        self.a = AsyncShipper(
+            hosts, version, timeout,
+            client_builder=client_builder,
+            processes=processes,
+            pool=self.pool,
+            log=self.log,
+            inventory=self.inventory,
+            snapshots=self.snapshots,
+            output=self.output,
+            tls=self.tls,
+            history=self.history,
+            listings=self.listings)
+
+    @property
+    def hosts(self):
+        return self.a.hosts
+
+    @property
+    def c(self):
+        return self.a.c
+
+    def negotiate(self):
+        """Returns api versions of the hosts, see `AsyncShipper.negotiate`
+        """
+        return self._call("negotiate")
 
     def build(self, path=None, fobj=None, tag=None,
               quiet=False, nocache=False, rm=False):
         """Run build of a container from buildfile
         that can be passed as local/remote path or file object(fobj)
         """
-        dockerfile = DockerFile(path, fobj)
-
-        def call():
-            deferreds = []
-            for host in self.hosts:
-                deferreds.append(
-                    self.c.build(
-                        host, dockerfile, tag=tag, quiet=quiet,
-                        nocache=nocache, rm=rm))
-            return defer.gatherResults(deferreds, consumeErrors=True)
-
-        responses = threads.blockingCallFromThread(reactor, call)
-        return [Response(h, 200, r) for h, r in zip(self.hosts, responses)]
+        return self._call(
+            "build", path=path, fobj=fobj, tag=tag,
+            quiet=quiet, nocache=nocache, rm=rm)
 
     def parallel(self, method, params):
-        def call():
-            if isinstance(params, dict):
-                # we assume that it's all the same call to all default hosts
-                # with the same arguments
-                deferreds = [method(h, **copy(params)) for h in self.hosts]
-            elif isinstance(params, list):
-                # we assume that it's a list of tuples (host, kwargs)
-                # (useful in case if you have parallel calls to
-                # different endpoints)
-                deferreds = []
-                for host, kwargs in params:
-                    deferreds.append(method(host, **copy(kwargs)))
-
-            return defer.gatherResults(deferreds, consumeErrors=True)
-
-        return threads.blockingCallFromThread(reactor, call)
+        return self._call("parallel", method, params)
 
     def images(self, **kwargs):
-        pretty = kwargs.pop('pretty', False)
-        responses = self.parallel(self.c.images, kwargs)
-
-        images = _flatten(responses, self.hosts, Image)
-        if pretty:
-            return images_to_ascii_table(_grouped_by_host(images))
-        else:
-            return images
+        return self._call("images", **kwargs)
 
     def containers(self, **kwargs):
-        pretty = kwargs.pop('pretty', False)
-        running = kwargs.pop('running', True)
-        image = kwargs.pop('image', None)
-        command = kwargs.pop('command', None)
-        responses = self.parallel(self.c.containers, kwargs)
-
-        containers = _flatten(responses, self.hosts, Container)
-
-        if running is not None:
-            if running:
-                f = lambda x: x.is_running
-            else:
-                f = lambda x: x.is_stopped
-            containers = filter(f, containers)
-
-        if image is not None:
-            f = lambda x: re.match(image, x.image)
-            containers = filter(f, containers)
-
-        if command is not None:
-            f = lambda x: re.match(command, x.command)
-            containers = filter(f, containers)
-
-        if pretty:
-            return containers_to_ascii_table(_grouped_by_host(containers))
-        else:
-            return containers
+        return self._call("containers", **kwargs)
 
     def create_container(self, config, hosts=None, name=None):
-        hosts = hosts or self.hosts
-        kwargs = [(host, {"config": config, "name": name}) for host in hosts]
-        responses = self.parallel(self.c.create_container, kwargs)
-        return _flatten(responses, hosts, Container)
+        return self._call("create_container", config, hosts=hosts, name=name)
 
     def start(self, *containers, **kwargs):
-        self.log.debug("Starting {}".format(containers))
-        _, port_binds = parse_ports(kwargs.get('ports', []))
-        kwargs = [(c.host, {"container": c,
-                            "binds": kwargs.get("binds"),
-                            "port_binds": port_binds,
-                            "links": kwargs.get("links", [])})
-                  for c in containers]
-        self.parallel(self.c.start, kwargs)
+        return self._call("start", *containers, **kwargs)
 
     def stop(self, *containers, **kwargs):
-        self.log.debug("Stopping {}".format(containers))
-        stop_args = [(c.host,
-                      {"container": c,
-                       "wait_seconds": kwargs.get('wait_seconds', 5)})
-                     for c in containers]
-        self.parallel(self.c.stop, stop_args)
-        return containers
+        return self._call("stop", *containers, **kwargs)
 
     def attach(self, *containers, **kwargs):
-        self.log.debug("Attaching to {}".format(containers))
-        calls = []
-        for c in containers:
-            kw = copy(kwargs)
-            kw['container'] = c
-            calls.append((c.host, kw))
-        self.parallel(self.c.attach, calls)
-        return containers
-
-    def wait(self, *containers):
+        return self._call("attach", *containers, **kwargs)
+
+    def logs(self, *containers, **kwargs):
+        """Collects output of the containers in the `sink`, see
+        :mod:`shipper.streams`, and returns it
+        """
+        return self._call("logs", *containers, **kwargs)
+
+    def execute(self, *containers, **kwargs):
+        """Runs `cmd` in every container in parallel and returns list of
+        (container, exit_code, output), e.g.
+
+            s.execute(*s.containers(image="web"), cmd="df -h")
+
+        `exec` is a reserved word in python 2, hence the name.
+        """
+        return self._call("execute", *containers, **kwargs)
+
+    def stats(self, *containers, **kwargs):
+        """Samples resource usage of the containers and returns
+        :class:`shipper.stats.Stats`, see `pretty.stats_to_text`
+        """
+        return self._call("stats", *containers, **kwargs)
+
+    def put_archive(self, source, path, *containers):
+        """Copies local file or folder to `path` in the containers"""
+        return self._call("put_archive", source, path, *containers)
+
+    def get_archive(self, path, directory, *containers):
+        """Downloads `path` of the containers as tar archives
+        to the local `directory`, returns the archives' paths
+        """
+        return self._call("get_archive", path, directory, *containers)
+
+    def gc(self, older_than=3600, pattern=None, containers=True,
+           images=True, batch=5, interval=0.5, dry_run=False):
+        """Removes exited containers and untagged images older than
+        `older_than` seconds in rate limited batches, returns report
+        with the removed items and reclaimed bytes. `pattern` narrows
+        them to the containers and untagged images of the matching
+        images, tagged images are never removed.
+        """
+        return self._call(
+            "gc", older_than=older_than, pattern=pattern,
+            containers=containers, images=images, batch=batch,
+            interval=interval, dry_run=dry_run)
+
+    def wait(self, *containers, **kwargs):
         """
         Blocks until all the container stop, and returns a list of
         tuples of the container and a JSON blob containing its status code.
+        With `events` set waits on a single events stream per host, see
+        :meth:`AsyncShipper.wait` for `timeout`, `each` and `limit`.
         """
-        calls = []
-        hosts = []
-        for c in containers:
-            calls.append((c.host, {'container': c}))
-            hosts.append(c.host)
-        responses = self.parallel(self.c.wait, calls)
-        return zip(containers, responses)
+        return self._call("wait", *containers, **kwargs)
 
     def inspect(self, *containers):
-        calls = []
-        hosts = []
-        for c in containers:
-            calls.append((c.host, {'container': c}))
-            hosts.append(c.host)
-        responses = self.parallel(self.c.inspect, calls)
-        return _flatten(responses, hosts, Container)
+        return self._call("inspect", *containers)
 
     def run(self, image, command, **kwargs):
         """Creates a container and runs it
         """
-        hosts = copy(self.hosts)
-        once = kwargs.pop('once', False)
-        detailed = kwargs.pop('detailed', False)
-        if once:
-            containers = self.containers(
-                image=image, command=command, running=True)
-            for host, values in _grouped_by_host(containers).iteritems():
-                if len(values):
-                    hosts.remove(host)
-                    self.log.debug(
-                        "Container {} {} is already running on {}".format(
-                            image, host, command))
-        if not hosts:
-            return []
-
-        volumes, binds = parse_volumes(kwargs.pop('volumes', []))
-        kwargs['volumes'] = volumes
-        config = ContainerConfig(image, command, **kwargs)
-        containers = self.create_container(
-            config, hosts=hosts, name=kwargs.get('name'))
-
-        self.start(*containers,
-                   binds=binds,
-                   ports=kwargs.get('ports', []),
-                   links=kwargs.get('links', []))
-        self.log.debug("Containers({}) {} {} started".format(
-            containers, image, command))
-
-        if detailed:
-            return self.inspect(*containers)
-        return containers
+        return self._call("run", image, command, **kwargs)
+
+    def snapshot(self, refresh=False, ttl=30):
+        """Returns resources snapshot of the hosts used for placement.
+        Snapshot is cached and re-gathered only if it's older than `ttl`
+        seconds or `refresh` is set.
+        """
+        return self._call("snapshot", refresh=refresh, ttl=ttl)
+
+    def place(self, image, command, count=1, anti_affinity=False,
+              strategy=SPREAD, refresh=False, ttl=30, **kwargs):
+        """Places `count` containers on the hosts that have room for them
+        (respecting `mem_limit`) and runs them. With `anti_affinity` set
+        every host gets at most one container of the image.
+        """
+        return self._call(
+            "place", image, command, count=count,
+            anti_affinity=anti_affinity, strategy=strategy,
+            refresh=refresh, ttl=ttl, **kwargs)
+
+    def plan(self):
+        """Returns :class:`Plan` recording a chain of operations
+        executed per host with a single call into the reactor, e.g.
+
+            s.plan().containers(image="web").stop().run("web", "serve")
+        """
+        from .plan import Plan
+        shipper = self.a.traced("plan") if self._watched() else self.a
+        return Plan(shipper, submit=self._blocking)
+
+    def _call(self, name, *args, **kwargs):
+        """Calls AsyncShipper method in the reactor thread, tagging
+        its requests with an operation if there are hooks or progress
+        callbacks to see it
+        """
+        shipper = self.a
+        if self._watched():
+            shipper = shipper.traced(name)
+        return self._blocking(getattr(shipper, name), *args, **kwargs)
+
+    def _watched(self):
+        return hooks.registry or progress.registry
+
+    def _blocking(self, method, *args, **kwargs):
+        """Calls method in the reactor thread and waits for the result.
+        Streams that write to the caller's destination, like the
+        daemon's command output, are bound to it before they cross to
+        the reactor thread.
+        """
+        from twisted.internet import reactor, threads
+        args = [_bound(a) for a in args]
+        kwargs = dict((k, _bound(v)) for k, v in kwargs.iteritems())
+        return threads.blockingCallFromThread(
+            reactor, method, *args, **kwargs)
 
     @classmethod
-    def _init_logging(cls, **kwargs):
+    def _init_logging(cls, level=logging.DEBUG, directory=None,
+                      every=1, rate=None, burst=None):
+        """Logs are written by the handlers in a separate thread.
+        Output streamed by the hosts keeps `every` n-th line, at most
+        `rate` lines per second per host, and goes to the per host
+        files in `directory` if it's set.
+        """
         cls.log = logging.getLogger("shipper")
-        cls.log.setLevel(logging.DEBUG)
+        cls.log.setLevel(level)
 
         formatter = logging.Formatter(
             "%(levelname)-5.5s PID:%(process)d [%(name)s] %(message)s")
-        cls._add_console_output(cls.log, formatter)
-        cls._add_syslog_output(cls.log, formatter)
+        cls.listener = logs.QueueListener()
+        cls._add_console_output(cls.listener, formatter)
+        cls._add_syslog_output(cls.listener, formatter)
+        if directory:
+            for h in cls.listener.handlers:
+                h.addFilter(logs.SkipHostOutput())
+            h = logs.HostFileHandler(directory)
+            h.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            cls.listener.addHandler(h)
+        cls.listener.start()
+        # queued records are written out before the process exits
+        atexit.register(cls.listener.stop)
+        cls.log.addHandler(logs.QueueHandler(cls.listener.queue))
+
+        cls.output = logs.HostOutput(
+            cls.log, every=every, rate=rate, burst=burst)
 
     @classmethod
     def _add_console_output(cls, log, formatter):
@@ -265,21 +328,6 @@ class Shipper(object):
             pass
 
 
-Response = namedtuple("Response", "host code content")
-
-
-def _grouped_by_host(values):
-    grouped = {}
-    for v in values:
-        grouped.setdefault(v.host, []).append(v)
-    return grouped
-
-
-def _flatten(values, hosts, cls):
-    out = []
-    for h, host_values in zip(hosts, values):
-        if not isinstance(host_values, list):
-            host_values = [host_values]
-        for value in host_values:
-            out.append(cls(h, value))
-    return out
+def _bound(value):
+    bound = getattr(type(value), 'bound', None)
+    return value if bound is None else bound(value)
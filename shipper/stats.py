@@ -0,0 +1,157 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Resource usage of the containers across the fleet.
+
+Samples of CPU, memory and network usage are kept in a fixed size ring
+buffer per container and rolled up per host and per image:
+
+    stats = Shipper(hosts).stats(*containers)
+    print pretty.stats_to_text(stats, by="image")
+    print stats.top(5, key="Memory")
+
+Series of containers that stopped reporting are dropped after about
+`expire` seconds, so memory stays bounded however long the collection
+runs.
+"""
+import time
+from collections import deque, namedtuple
+
+from .host import netloc
+
+Sample = namedtuple("Sample", "time cpu memory memory_limit rx tx")
+
+
+def parse(raw, previous=None, now=None):
+    """Converts docker's stats reply to :class:`Sample`, CPU usage in
+    percents is calculated against `precpu_stats` or the `previous`
+    cpu_stats if docker did not send them
+    """
+    cpu = raw.get('cpu_stats') or {}
+    before = raw.get('precpu_stats') or {}
+    if not _total(before):
+        before = previous or cpu
+
+    percent = 0.0
+    used = _total(cpu) - _total(before)
+    system = cpu.get('system_cpu_usage', 0) - \
+        before.get('system_cpu_usage', 0)
+    if used > 0 and system > 0:
+        cpus = len(cpu.get('cpu_usage', {}).get('percpu_usage') or []) or 1
+        percent = float(used) / system * cpus * 100
+
+    memory = raw.get('memory_stats') or {}
+    networks = raw.get('networks') or {'eth0': raw.get('network') or {}}
+    return Sample(
+        now or time.time(), percent,
+        memory.get('usage', 0), memory.get('limit', 0),
+        sum(n.get('rx_bytes', 0) for n in networks.itervalues()),
+        sum(n.get('tx_bytes', 0) for n in networks.itervalues()))
+
+
+def _total(cpu):
+    return cpu.get('cpu_usage', {}).get('total_usage', 0)
+
+
+class Series(object):
+    """Last `size` samples of the container"""
+
+    def __init__(self, container, size):
+        self.container = container
+        self.samples = deque(maxlen=size)
+        self.cpu = None
+
+    def add(self, raw, now=None):
+        sample = parse(raw, self.cpu, now)
+        self.cpu = raw.get('cpu_stats')
+        self.samples.append(sample)
+        return sample
+
+    @property
+    def latest(self):
+        return self.samples[-1]
+
+    def rate(self, field):
+        """Bytes per second over the samples in the buffer"""
+        if len(self.samples) < 2:
+            return 0.0
+        first, last = self.samples[0], self.samples[-1]
+        elapsed = last.time - first.time
+        if elapsed <= 0:
+            return 0.0
+        return max(0.0, (getattr(last, field) - getattr(first, field)) /
+                   elapsed)
+
+    def row(self):
+        latest = self.latest
+        return {
+            'Host': netloc(self.container.host),
+            'Id': self.container.id,
+            'Image': self.container.get('Image') or '',
+            'CPU': latest.cpu,
+            'Memory': latest.memory,
+            'MemoryLimit': latest.memory_limit,
+            'NetIn': self.rate('rx'),
+            'NetOut': self.rate('tx'),
+        }
+
+
+class Stats(object):
+    """Ring buffers of samples of the containers, with rollups"""
+
+    def __init__(self, size=60, expire=300):
+        self.size = size
+        self.expire = expire
+        self.series = {}
+        self.updated = {}
+        self.expired = 0
+
+    def add(self, container, raw, now=None):
+        now = now or time.time()
+        key = (container.host, container.id)
+        series = self.series.get(key)
+        if series is None:
+            # the scan is linear, so it runs at most every tenth of
+            # `expire`, not for every new container of the round
+            if now - self.expired >= self.expire / 10.0:
+                self._expire(now)
+            series = self.series[key] = Series(container, self.size)
+        self.updated[key] = now
+        return series.add(raw, now)
+
+    def rows(self):
+        """Latest usage of every container"""
+        return [s.row() for s in self.series.itervalues() if s.samples]
+
+    def top(self, n=10, key='CPU'):
+        return sorted(self.rows(), key=lambda r: r[key], reverse=True)[:n]
+
+    def rollup(self, by='host'):
+        """Usage summed per host or per image"""
+        field = {'host': 'Host', 'image': 'Image'}[by]
+        groups = {}
+        for row in self.rows():
+            group = groups.get(row[field])
+            if group is None:
+                group = groups[row[field]] = {
+                    'Group': row[field], 'Containers': 0, 'CPU': 0.0,
+                    'Memory': 0, 'NetIn': 0.0, 'NetOut': 0.0}
+            group['Containers'] += 1
+            for name in ('CPU', 'Memory', 'NetIn', 'NetOut'):
+                group[name] += row[name]
+        return sorted(groups.itervalues(), key=lambda g: g['Group'])
+
+    def to_dict(self):
+        return {
+            'containers': self.rows(),
+            'hosts': self.rollup('host'),
+            'images': self.rollup('image')
+        }
+
+    def _expire(self, now):
+        self.expired = now
+        for key, updated in self.updated.items():
+            if now - updated > self.expire:
+                del self.updated[key]
+                del self.series[key]
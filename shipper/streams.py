@@ -0,0 +1,301 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Streaming output of the containers.
+
+Docker multiplexes stdout and stderr of the container in a single stream
+of frames, each one prefixed with 8 byte header: stream type, 3 zero
+bytes and payload length. :class:`Demuxer` splits the frames without
+joining the chunks, payloads are passed as memoryview slices of the
+received data, only split headers (at most 8 bytes) are buffered.
+
+Every container's output goes to a sink, an object with
+`write(container, stream, data)` method:
+
+* :class:`RingSink` keeps the last bytes of every container in memory
+* :class:`FileSink` appends output to a file per container
+* :class:`CallbackSink` calls a function with every chunk
+* :class:`LineSink` calls a function with every complete line
+
+:class:`JSONReader` decodes streams of json objects, e.g. stats.
+
+If `write` returns a deferred, reading of the container's stream
+is paused until it fires, so slow sinks apply backpressure. Sinks
+buffering the output can have `flush(container)` method, it's called
+once the container's stream ends.
+"""
+import os
+import re
+import struct
+from collections import deque
+
+from twisted.internet.defer import Deferred
+from twisted.internet.protocol import Protocol
+from twisted.web.client import ResponseDone
+
+from . import codec as _codec
+
+STDIN, STDOUT, STDERR = 0, 1, 2
+
+_HEADER = struct.Struct(">BxxxL")
+
+
+class Demuxer(object):
+    """Splits docker's multiplexed stream into the frames,
+    calls `callback(stream, data)` for every piece of payload.
+    Streams of containers with tty are not multiplexed, they are
+    detected by the header and passed as stdout.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.header = ""
+        self.stream = STDOUT
+        self.remaining = 0
+        self.raw = None
+
+    def feed(self, data):
+        if not data:
+            return
+        if self.raw is None:
+            self.raw = not (data[0] in "\x00\x01\x02" and
+                            data[1:4] == "\x00" * len(data[1:4]))
+        view = memoryview(data)
+        if self.raw:
+            self.callback(STDOUT, view)
+            return
+
+        offset, size = 0, len(data)
+        while offset < size:
+            if self.remaining:
+                end = min(size, offset + self.remaining)
+                self.callback(self.stream, view[offset:end])
+                self.remaining -= end - offset
+                offset = end
+                continue
+
+            needed = _HEADER.size - len(self.header)
+            self.header += data[offset:offset + needed]
+            offset += needed
+            if len(self.header) < _HEADER.size:
+                return
+            self.stream, self.remaining = _HEADER.unpack(self.header)
+            self.header = ""
+
+
+class StreamReader(Protocol):
+    """Response body protocol feeding container's output to the sink.
+    Stops reading once `stop_line` regular expression matches.
+    """
+
+    def __init__(self, finished, container, sink, stop_line=None):
+        self.finished = finished
+        self.container = container
+        self.sink = sink
+        self.received = 0
+        self.stopped = False
+        self.paused = 0
+        self.demuxer = Demuxer(self._deliver)
+        if stop_line:
+            self.stop_line = re.compile(stop_line, re.I)
+        else:
+            self.stop_line = None
+
+    def dataReceived(self, data):
+        if self.stopped:
+            return
+        self.received += len(data)
+        self.demuxer.feed(data)
+        if self.stop_line and self.stop_line.search(data):
+            self.stopped = True
+            self.transport.stopProducing()
+
+    def connectionLost(self, reason):
+        flush = getattr(self.sink, 'flush', None)
+        if flush is not None:
+            flush(self.container)
+        if self.stopped or reason.check(ResponseDone):
+            self.finished.callback(self)
+            return
+        self.finished.errback(reason)
+
+    def _deliver(self, stream, data):
+        busy = self.sink.write(self.container, stream, data)
+        if isinstance(busy, Deferred):
+            if not self.paused:
+                self.transport.pauseProducing()
+            self.paused += 1
+            busy.addBoth(self._resume)
+
+    def _resume(self, result):
+        self.paused -= 1
+        if not self.paused and not self.stopped:
+            self.transport.resumeProducing()
+        return result
+
+    @classmethod
+    def listen(cls, response, container, sink, stop_line=None):
+        d = Deferred()
+        if response.length == 0:
+            d.callback(None)
+            return d
+        response.deliverBody(cls(d, container, sink, stop_line))
+        return d
+
+
+class JSONReader(Protocol):
+    """Response body protocol decoding stream of json objects,
+    one per line, e.g. container stats. Stops reading after
+    `limit` objects if set.
+    """
+
+    def __init__(self, finished, callback, limit=None):
+        self.finished = finished
+        self.callback = callback
+        self.limit = limit
+        self.partial = []
+        self.received = 0
+        self.stopped = False
+
+    def dataReceived(self, data):
+        if self.stopped:
+            return
+        self.received += len(data)
+        lines = data.split("\n")
+        if len(lines) > 1:
+            lines[0] = "".join(self.partial) + lines[0]
+            self.partial = []
+            for line in lines[:-1]:
+                if line.strip():
+                    self._deliver(line)
+                    if self.stopped:
+                        return
+        if lines[-1]:
+            self.partial.append(lines[-1])
+
+    def connectionLost(self, reason):
+        rest = "".join(self.partial).strip()
+        if rest and not self.stopped and reason.check(ResponseDone):
+            self._deliver(rest)
+        if self.stopped or reason.check(ResponseDone):
+            self.finished.callback(self)
+            return
+        self.finished.errback(reason)
+
+    def stop(self):
+        """Stops reading, `finished` fires once the connection is closed"""
+        if not self.stopped:
+            self.stopped = True
+            if self.transport is not None:
+                self.transport.stopProducing()
+
+    def _deliver(self, line):
+        self.callback(_codec.loads(line))
+        if self.limit is not None:
+            self.limit -= 1
+            if not self.limit:
+                self.stop()
+
+    @classmethod
+    def listen(cls, response, callback, limit=None):
+        d = Deferred()
+        response.deliverBody(cls(d, callback, limit))
+        return d
+
+
+class RingSink(object):
+    """Keeps the last `limit` bytes of output of every container"""
+
+    def __init__(self, limit=64 * 1024):
+        self.limit = limit
+        self.chunks = {}
+        self.sizes = {}
+
+    def write(self, container, stream, data):
+        key = _key(container)
+        chunks = self.chunks.get(key)
+        if chunks is None:
+            chunks = self.chunks[key] = deque()
+            self.sizes[key] = 0
+        chunk = _bytes(data)
+        chunks.append(chunk)
+        size = self.sizes[key] + len(chunk)
+        # oldest chunks are dropped while the rest still fill the limit
+        while size - len(chunks[0]) >= self.limit:
+            size -= len(chunks.popleft())
+        self.sizes[key] = size
+
+    def getvalue(self, container):
+        value = "".join(self.chunks.get(_key(container), ()))
+        return value[-self.limit:]
+
+    def lines(self, container):
+        return self.getvalue(container).splitlines()
+
+
+class FileSink(object):
+    """Appends output of every container to <directory>/<id>.log"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def write(self, container, stream, data):
+        key = _key(container)
+        f = self.files.get(key)
+        if f is None:
+            f = self.files[key] = open(
+                os.path.join(self.directory, key[:12] + ".log"), "ab")
+        f.write(data)
+
+    def close(self):
+        for f in self.files.itervalues():
+            f.close()
+        self.files.clear()
+
+
+class CallbackSink(object):
+    """Calls `fn(container, stream, data)` with every chunk of output,
+    `fn` can return deferred to pause the stream
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def write(self, container, stream, data):
+        return self.fn(container, stream, _bytes(data))
+
+
+class LineSink(object):
+    """Calls `fn(container, line)` with every complete line, the last
+    line without the newline is passed once the stream ends
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.partial = {}
+
+    def write(self, container, stream, data):
+        key = (_key(container), stream)
+        lines = (self.partial.pop(key, "") + _bytes(data)).split("\n")
+        if lines[-1]:
+            self.partial[key] = lines[-1]
+        for line in lines[:-1]:
+            self.fn(container, line)
+
+    def flush(self, container):
+        for stream in (STDOUT, STDERR):
+            line = self.partial.pop((_key(container), stream), None)
+            if line is not None:
+                self.fn(container, line)
+
+
+def _key(container):
+    return getattr(container, 'id', container)
+
+
+def _bytes(data):
+    return data.tobytes() if isinstance(data, memoryview) else data
@@ -0,0 +1,29 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+from twisted.trial.unittest import TestCase
+
+from shipper.api import Api, parse, MAXIMUM
+
+
+class ApiTestCase(TestCase):
+
+    def test_parse(self):
+        self.assertEqual((1, 16), parse("1.16"))
+        self.assertTrue(parse("1.9") < parse("1.16"))
+        self.assertEqual((1, 21), parse("1.21-dev"))
+
+    def test_negotiate(self):
+        self.assertEqual(Api("1.16"), Api.negotiate("1.16"))
+        self.assertEqual(Api(MAXIMUM), Api.negotiate("1.99"))
+        self.assertEqual(Api("1.6"), Api.negotiate(None))
+
+    def test_features(self):
+        self.assertFalse(Api("1.6").supports("exec"))
+        self.assertTrue(Api("1.15").supports("exec"))
+        self.assertFalse(Api("1.15").supports("filters"))
+        self.assertEqual(
+            set(["repo_tags", "exec", "filters", "stats", "host_config",
+                 "event_filters"]),
+            Api("1.18").features)
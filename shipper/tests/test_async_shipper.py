@@ -0,0 +1,159 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import mock
+
+from twisted.internet import threads
+from twisted.internet.defer import Deferred, FirstError, succeed, fail
+from twisted.trial.unittest import TestCase
+
+from shipper.async_shipper import AsyncShipper
+from shipper.client import Client
+from shipper.container import Container
+from shipper.listings import Listings
+
+
+class AsyncShipperCommands(TestCase):
+    """
+    Tests non-blocking commands (methods on AsyncShipper)
+    """
+    def setUp(self):
+        self.client = mock.Mock(Client)
+        self.shipper = AsyncShipper(
+            ["a", "b"],
+            client_builder=lambda *args, **kwargs: self.client)
+
+    def test_containers(self):
+        """Containers of all hosts are filtered in one deferred"""
+        self.client.containers.side_effect = lambda host, **kw: succeed([
+            {'Id': '1', 'Status': 'Up 1 second', 'Image': 'web'},
+            {'Id': '2', 'Status': 'Exit 0', 'Image': 'web'}])
+
+        d = self.shipper.containers(image="web")
+        containers = self.successResultOf(d)
+        self.assertEqual(
+            [(h, '1') for h in self.shipper.hosts],
+            [(c.host, c.id) for c in containers])
+
+    def test_listings_shared(self):
+        """Shippers sharing listings list the host again only after the
+        ttl or a change of its containers
+        """
+        self.client.containers.side_effect = lambda host, **kw: succeed([
+            {'Id': '1', 'Status': 'Up 1 second', 'Image': 'web'}])
+        self.client.stop.side_effect = lambda host, **kw: succeed(None)
+        now = [0]
+        listings = Listings(5, clock=lambda: now[0])
+        shippers = [AsyncShipper(
+            ["a", "b"], listings=listings,
+            client_builder=lambda *args, **kwargs: self.client)
+            for _ in range(2)]
+
+        self.successResultOf(shippers[0].containers())
+        containers = self.successResultOf(shippers[1].containers())
+        self.assertEqual(2, self.client.containers.call_count)
+        self.successResultOf(shippers[1].containers(all=True))
+        self.assertEqual(4, self.client.containers.call_count)
+
+        self.successResultOf(shippers[0].stop(containers[0]))
+        self.successResultOf(shippers[1].containers())
+        self.assertEqual(5, self.client.containers.call_count)
+
+        now[0] = 5
+        self.successResultOf(shippers[1].containers())
+        self.assertEqual(7, self.client.containers.call_count)
+
+    def test_run(self):
+        """Run creates and starts containers without blocking"""
+        self.client.create_container.side_effect = (
+            lambda host, **kw: succeed({'Id': host.a.hostname}))
+        self.client.start.side_effect = lambda host, **kw: succeed(None)
+
+        d = self.shipper.run("web", "echo hi", ports=["80:80"])
+        containers = self.successResultOf(d)
+
+        self.assertEqual(['a', 'b'], [c.id for c in containers])
+        self.client.start.assert_has_calls([
+            mock.call(c.host, container=c, binds=[],
+                      port_binds={'80/tcp': [
+                          {'HostIp': '', 'HostPort': '80'}]},
+                      links=[])
+            for c in containers])
+
+    def test_place_not_created(self):
+        """Room reserved for containers that failed to be created is
+        returned to the cached snapshot
+        """
+        self.client.info.side_effect = (
+            lambda host, **kw: succeed({'MemTotal': 1000}))
+        self.client.containers.side_effect = lambda host, **kw: succeed([])
+        self.client.create_container.side_effect = (
+            lambda host, **kw: fail(RuntimeError("oops")))
+
+        d = self.shipper.place("web", "serve", count=2, mem_limit=300)
+        self.failureResultOf(d, FirstError)
+
+        snapshot = self.successResultOf(self.shipper.snapshot())
+        self.assertEqual([1000, 1000], [s.free for s in snapshot.states])
+        self.assertEqual([0, 0], [s.count for s in snapshot.states])
+
+    def test_wait(self):
+        """Results are paired with the containers"""
+        self.client.wait.side_effect = (
+            lambda *args, **kwargs: succeed({'StatusCode': 0}))
+        containers = [Container('a', {'Id': '1'})]
+        d = self.shipper.wait(*containers)
+        self.assertEqual(
+            [(containers[0], {'StatusCode': 0})], self.successResultOf(d))
+
+    def test_execute_limit(self):
+        """At most `limit` commands run on a host at a time"""
+        pending = []
+
+        def execute(host, **kwargs):
+            pending.append(Deferred())
+            return pending[-1]
+
+        self.client.execute.side_effect = execute
+        containers = [Container(h, {'Id': str(i)})
+                      for h in self.shipper.hosts for i in range(3)]
+        d = self.shipper.execute(*containers, cmd="uptime", limit=2)
+        self.assertEqual(4, len(pending))
+
+        while pending:
+            pending.pop(0).callback(0)
+        results = self.successResultOf(d)
+        self.assertEqual(containers, [r.container for r in results])
+        self.assertEqual([0] * 6, [r.exit_code for r in results])
+
+    def test_archives_settle(self):
+        """Shared archive and output files are closed only after every
+        transfer is done, even if one of them has failed
+        """
+        archive = mock.Mock()
+        self.patch(threads, 'deferToThread', lambda *a: succeed(archive))
+        slow = Deferred()
+        self.client.put_archive.side_effect = (
+            lambda host, **kw: slow if host.a.hostname == 'b' else
+            fail(RuntimeError("no room")))
+        containers = [Container(h, {'Id': '1'}) for h in self.shipper.hosts]
+
+        d = self.shipper.put_archive("/etc", "/etc", *containers)
+        self.assertNoResult(d)
+        self.assertFalse(archive.close.called)
+        slow.callback(None)
+        self.failureResultOf(d, FirstError)
+        self.assertTrue(archive.close.called)
+
+        slow = Deferred()
+        self.client.get_archive.side_effect = (
+            lambda host, **kw: slow if host.a.hostname == 'b' else
+            fail(RuntimeError("no such path")))
+        d = self.shipper.get_archive("/etc", self.mktemp(), *containers)
+        self.assertNoResult(d)
+        fileobj = self.client.get_archive.call_args[1]['fileobj']
+        self.assertFalse(fileobj.closed)
+        slow.callback(fileobj)
+        self.failureResultOf(d, FirstError)
+        self.assertTrue(fileobj.closed)
@@ -0,0 +1,36 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import os
+import tarfile
+from StringIO import StringIO
+
+from twisted.trial.unittest import TestCase
+
+from shipper.build import Archive
+
+
+class ArchiveTestCase(TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+        with open(self.path, "w") as f:
+            f.write("x" * 100000)
+
+    def test_archive_file(self):
+        archive = Archive.from_path(self.path)
+        self.addCleanup(archive.close)
+        t = tarfile.open(fileobj=StringIO(archive.data[:]))
+        self.assertEqual([os.path.basename(self.path)], t.getnames())
+
+    def test_producers_share_data(self):
+        """Producers read the same memory map with their own offsets"""
+        archive = Archive.from_path(self.path)
+        self.addCleanup(archive.close)
+        a, b = archive.producer(), archive.producer()
+        self.assertEqual(archive.length, a.length)
+        self.assertEqual(archive.length, b.length)
+        self.assertEqual(archive.data[:10], a._inputFile.read(10))
+        self.assertEqual(archive.data[:20], b._inputFile.read(20))
+        self.assertEqual(archive.data[10:15], a._inputFile.read(5))
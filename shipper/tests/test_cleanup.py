@@ -0,0 +1,109 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+from twisted.trial.unittest import TestCase
+
+from shipper import cleanup
+from shipper.container import Container
+from shipper.image import Image
+
+
+def container(id, status, image="web", created=0):
+    return Container('a', {'Id': id, 'Status': status, 'Image': image,
+                           'Created': created})
+
+
+def image(id, repository="<none>", tag="<none>", parent="", created=0,
+          size=10):
+    return Image('a', {'Id': id, 'Repository': repository, 'Tag': tag,
+                       'ParentId': parent, 'Created': created, 'Size': size})
+
+
+class CleanupTestCase(TestCase):
+
+    def test_exited_containers(self):
+        containers = [
+            container('1', 'Up 1 hour'),
+            container('2', 'Exit 0'),
+            container('3', 'Exit 1', image="db"),
+            container('4', 'Exit 0', created=950)]
+        self.assertEqual(
+            ['2', '3'],
+            [c.id for c in cleanup.exited_containers(
+                containers, older_than=100, now=1000)])
+        self.assertEqual(
+            ['3'],
+            [c.id for c in cleanup.exited_containers(
+                containers, pattern="db", now=1000)])
+
+    def test_dangling_images(self):
+        images = [
+            image('base', "base", "latest"),
+            image('leaf'),
+            image('layer'),
+            image('child', parent='layer'),
+            image('used'),
+            image('young', created=990)]
+        running = [container('1', 'Up 1 hour', image="used")]
+        self.assertEqual(
+            ['leaf', 'child'],
+            [i.id for i in cleanup.dangling_images(
+                images, running, older_than=100, now=1000)])
+
+    def test_dangling_images_pattern(self):
+        """Pattern narrows untagged images by their tagged ancestor,
+        tagged images are never removed
+        """
+        images = [
+            image('web', "web", "v1"), image('db', "db", "v1"),
+            image('web-layer', parent='web'),
+            image('old-web', parent='web-layer'),
+            image('old-db', parent='db'),
+            image('orphan')]
+        self.assertEqual(
+            ['old-web'], [i.id for i in cleanup.dangling_images(
+                images, [], pattern="web:")])
+        self.assertEqual(
+            ['old-web', 'old-db'], [i.id for i in cleanup.dangling_images(
+                images, [], pattern="(web|db):")])
+
+    def test_reclaimed_sizes(self):
+        """Untagged parents removed with the image are counted, layers
+        that stay are not
+        """
+        images = [
+            image('base', "base", "latest", size=100),
+            image('layer', parent='base', size=20),
+            image('leaf', parent='layer', size=5),
+            image('shared', parent='base', size=20),
+            image('left', parent='shared', size=5),
+            image('right', parent='shared', size=5)]
+        dangling = cleanup.dangling_images(images, [])
+        self.assertEqual(
+            {('a', 'leaf'): 25, ('a', 'left'): 5, ('a', 'right'): 5},
+            cleanup.reclaimed_sizes(images, dangling))
+
+        virtual = [
+            Image('a', {'Id': 'base', 'RepoTags': ["base:latest"],
+                        'Size': 100, 'VirtualSize': 100}),
+            Image('a', {'Id': 'layer', 'RepoTags': ["<none>:<none>"],
+                        'ParentId': 'base', 'Size': 120,
+                        'VirtualSize': 120}),
+            Image('a', {'Id': 'leaf', 'RepoTags': ["<none>:<none>"],
+                        'ParentId': 'layer', 'Size': 125,
+                        'VirtualSize': 125})]
+        self.assertEqual(
+            {('a', 'leaf'): 25},
+            cleanup.reclaimed_sizes(virtual, virtual[2:]))
+
+    def test_report(self):
+        images = [image('1', size=100), image('2', size=50)]
+        report = cleanup.Report([], images)
+        report.failed.append((images[1], "409 conflict"))
+        self.assertEqual(100, report.reclaimed)
+        self.assertEqual(
+            "0 containers, 2 images, 100 bytes reclaimed, 1 failed",
+            str(report))
+        report.sizes = {('a', '1'): 120}
+        self.assertEqual(120, report.reclaimed)
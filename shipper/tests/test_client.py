@@ -12,6 +12,11 @@ from twisted.trial.unittest import TestCase
 from twisted.web.client import ResponseDone
 
 from shipper.client import Client
+from shipper.container import ContainerConfig
+from shipper.errors import UnsupportedError
+from shipper.hooks import Hooks, Operation, EVENTS
+from shipper.host import Host
+from shipper.metrics import Metrics
 
 
 class _Response(object):
@@ -47,6 +52,8 @@ class ClientCommands(TestCase):
         """
         self.treq = mock.patch('shipper.client.treq', wraps=treq).start()
         self.addCleanup(mock.patch.stopall)
+        Client.apis.clear()
+        self.addCleanup(Client.apis.clear)
 
     def test_wait(self):
         """
@@ -65,3 +72,174 @@ class ClientCommands(TestCase):
             pool=mock.ANY)
 
         self.assertEqual({'StatusCode': 0}, self.successResultOf(d))
+
+    def test_request_metrics(self):
+        """Requests are recorded in the client metrics"""
+        self.treq.get.return_value = succeed(_Response(200, []))
+        client = Client(metrics=Metrics())
+
+        d = client.get(Host("http://localhost:4243"), "containers/ps")
+        self.assertEqual([], self.successResultOf(d))
+
+        snapshot, = client.metrics.snapshot()
+        self.assertEqual(
+            ("localhost:4243", "containers/ps", {'200': 1}, 2),
+            (snapshot['host'], snapshot['path'], snapshot['codes'],
+             snapshot['bytes_in']))
+
+    def test_request_hooks(self):
+        """Hooks see the lifecycle of requests tagged with the operation"""
+        self.treq.get.return_value = succeed(_Response(200, []))
+        hooks = Hooks()
+        events = []
+        for event in EVENTS:
+            hooks.add(event, lambda r, e=event: events.append((e, r)))
+
+        operation = Operation("run")
+        client = Client(metrics=Metrics(), hooks=hooks).traced(operation)
+        client.get(Host("http://localhost:4243"), "containers/ps")
+
+        self.assertEqual(
+            ["before_request", "first_byte", "after_response"],
+            [e for e, _ in events])
+        request = events[-1][1]
+        self.assertIdentical(operation, request.operation)
+        self.assertEqual(200, request.code)
+        self.assertTrue(request.latency >= 0)
+
+    def test_request_error_hook(self):
+        """Docker errors are reported to the error hooks"""
+        self.treq.get.return_value = succeed(_Response(500, "oops"))
+        hooks = Hooks()
+        errors = []
+        hooks.add("error", errors.append)
+
+        d = Client(metrics=Metrics(), hooks=hooks).get(
+            Host("http://localhost:4243"), "containers/ps")
+
+        self.failureResultOf(d, RuntimeError)
+        self.assertEqual(500, errors[0].code)
+
+    def test_build_hooks(self):
+        """Streamed requests are seen by the hooks too"""
+        self.treq.get.return_value = succeed(
+            _Response(200, {'ApiVersion': "1.17"}))
+        self.treq.post.side_effect = [
+            succeed(_Response(200, "Successfully built 4f2a")),
+            succeed(_Response(500, "oops")),
+        ]
+        hooks = Hooks()
+        events = []
+        for event in EVENTS:
+            hooks.add(event, lambda r, e=event: events.append((e, r)))
+        client = Client(metrics=Metrics(), hooks=hooks)
+        host = Host("http://localhost:4243")
+        dockerfile = mock.Mock(is_remote=False, archive="tar")
+
+        self.assertEqual(
+            "4f2a", self.successResultOf(client.build(host, dockerfile)))
+        self.failureResultOf(client.build(host, dockerfile), RuntimeError)
+
+        self.assertEqual(
+            [("before_request", "build"), ("first_byte", "build"),
+             ("after_response", "build"), ("before_request", "build"),
+             ("first_byte", "build"), ("error", "build")],
+            [(e, r.path) for e, r in events
+             if r.path == "build"])
+        self.assertEqual(500, events[-1][1].code)
+
+    def test_negotiate(self):
+        """Api version is requested once per host and used in the urls"""
+        self.treq.get.side_effect = [
+            succeed(_Response(200, {'ApiVersion': "1.17"})),
+            succeed(_Response(200, [])),
+            succeed(_Response(200, [])),
+        ]
+        client = Client(None, metrics=Metrics())
+        host = Host("http://localhost:4243")
+
+        d = client.containers(host, all=True, running=True)
+        self.assertEqual([], self.successResultOf(d))
+        self.successResultOf(client.get(host, "images/json"))
+
+        urls = [c[1]['url'] for c in self.treq.get.call_args_list]
+        self.assertEqual([
+            "http://localhost:4243/version",
+            "http://localhost:4243/v1.17/containers/ps",
+            "http://localhost:4243/v1.17/images/json"], urls)
+        params = self.treq.get.call_args_list[1][1]['params']
+        self.assertEqual(
+            {'status': ['running']}, json.loads(params['filters']))
+
+    def test_negotiate_failure(self):
+        """Failed negotiation fails the requests and is not cached"""
+        self.treq.get.side_effect = lambda **kw: succeed(
+            _Response(500, "oops"))
+        client = Client(None, metrics=Metrics())
+        host = Host("http://localhost:4243")
+
+        self.failureResultOf(client.info(host), RuntimeError)
+        self.assertEqual({}, client.apis)
+        self.failureResultOf(
+            client.execute(host, mock.Mock(id='__id__'), "ls", None),
+            RuntimeError)
+        self.assertEqual(2, self.treq.get.call_count)
+
+    def test_unsupported(self):
+        """Features missing in the api fail before the request"""
+        d = Client("1.14").execute(
+            Host("http://localhost:4243"), mock.Mock(id='__id__'), "ls", None)
+        self.failureResultOf(d, UnsupportedError)
+        self.assertFalse(self.treq.post.called)
+
+    def test_encoded_body(self):
+        """Encoded bodies are sent as is, unset params are dropped"""
+        self.treq.post.side_effect = lambda **kw: succeed(
+            _Response(201, {'Id': '1'}))
+        client = Client()
+        host = Host("http://localhost:4243")
+
+        d = client.create_container(host, '{"Image": "web"}')
+        self.assertEqual({'Id': '1'}, self.successResultOf(d))
+        d = client.post(host, "containers/create",
+                        params={'name': None}, data={}, post_json=True)
+        self.successResultOf(d)
+
+        first, second = self.treq.post.call_args_list
+        self.assertEqual('{"Image": "web"}', first[1]['data'])
+        self.assertEqual(
+            ('{}', {}), (second[1]['data'], second[1]['params']))
+
+    def test_create_body(self):
+        """Memory limit goes to HostConfig since api 1.18, bodies are
+        encoded once per version
+        """
+        self.treq.post.side_effect = lambda **kw: succeed(
+            _Response(201, {'Id': '1'}))
+        config = ContainerConfig("web", "serve", mem_limit=100)
+        encoded = {}
+        host = Host("http://localhost:4243")
+        for version in ("1.17", "1.18", "1.18"):
+            self.successResultOf(Client(version).create_container(
+                host, config, encoded=encoded))
+
+        bodies = [json.loads(c[1]['data'])
+                  for c in self.treq.post.call_args_list]
+        self.assertEqual(100, bodies[0]['Memory'])
+        self.assertEqual(
+            ({'Memory': 100}, None),
+            (bodies[1]['HostConfig'], bodies[1].get('Memory')))
+        self.assertEqual(["1.17", "1.18"], sorted(encoded))
+
+    def test_shared_apis(self):
+        """Versions negotiated by one client are used by the others"""
+        self.treq.get.side_effect = [
+            succeed(_Response(200, {'ApiVersion': "1.17"})),
+            succeed(_Response(200, {})),
+        ]
+        host = Host("http://localhost:4243")
+        self.successResultOf(Client(None, metrics=Metrics()).api(host))
+        self.successResultOf(Client(None, metrics=Metrics()).info(host))
+        self.assertEqual(
+            "http://localhost:4243/v1.17/info",
+            self.treq.get.call_args_list[-1][1]['url'])
@@ -0,0 +1,43 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import json
+
+from twisted.trial.unittest import TestCase
+
+from shipper import codec
+
+
+class _Codec(object):
+    calls = 0
+
+    def dumps(self, data):
+        self.calls += 1
+        return json.dumps(data)
+
+    def loads(self, data):
+        self.calls += 1
+        return json.loads(data)
+
+
+class CodecTestCase(TestCase):
+
+    def setUp(self):
+        self.addCleanup(codec.use, codec.name)
+
+    def test_use(self):
+        """Codec is switched to the module like object"""
+        fake = _Codec()
+        codec.use(fake)
+        self.assertEqual({"a": 1}, codec.loads(codec.encode({"a": 1})))
+        self.assertEqual(2, fake.calls)
+
+    def test_encoded(self):
+        """Strings are not encoded again"""
+        self.assertEqual('{"a": 1}', codec.encode('{"a": 1}'))
+
+    def test_fastest(self):
+        """Some installed codec is picked"""
+        self.assertIn(codec.use(), codec.FASTEST)
+        self.assertRaises(ImportError, codec.use, "no_such_codec")
@@ -2,8 +2,14 @@
 # Licensed under the Apache License, Version 2.0 (the "License")
 # See LICENSE for details
 
+import json
+import pickle
+from collections import Mapping, MutableMapping
+from datetime import datetime
+
 from twisted.trial import unittest
-from shipper.container import ContainerConfig
+from shipper import record
+from shipper.container import Container, ContainerConfig
 
 
 class ShipperContainerTestCase(unittest.TestCase):
@@ -76,3 +82,90 @@ class ShipperContainerTestCase(unittest.TestCase):
             'VolumesFrom': 'container'
         }
         self.assertEqual(expected, config)
+
+    def test_container_dict_access(self):
+        """Containers are compact, but behave like dictionaries"""
+        values = {'Id': u'abc', 'Image': u'base', 'Status': u'Up 1 second',
+                  'Created': 1309856559, 'Custom': 1}
+        c = Container('host', values)
+
+        self.assertEqual(values, c)
+        self.assertEqual(values, dict(c))
+        self.assertEqual('abc', c['Id'])
+        self.assertEqual(1, c['Custom'])
+        self.assertEqual(None, c.get('Ports'))
+        self.assertRaises(KeyError, lambda: c['Ports'])
+        self.assertIn('Custom', c)
+        self.assertNotIn('Ports', c)
+        self.assertEqual(sorted(values), sorted(c))
+        self.assertEqual(5, len(c))
+
+    def test_container_read_only(self):
+        """Containers can't be changed, their copies can"""
+        c = Container('host', {'Id': u'abc', 'Status': u'Up 1 second'})
+
+        def change():
+            c['Status'] = 'Exit 0'
+
+        def remove():
+            del c['Status']
+
+        self.assertRaises(TypeError, change)
+        self.assertRaises(TypeError, remove)
+        self.assertFalse(hasattr(c, 'update'))
+        values = c.to_dict()
+        values['Status'] = 'Exit 0'
+        self.assertTrue(Container('host', values).is_stopped)
+        self.assertTrue(c.is_running)
+
+    def test_container_shares_strings(self):
+        """Repeating strings are shared between containers"""
+        a = Container('host', {'Id': u'1', 'Image': u''.join(['ba', 'se'])})
+        b = Container('host', {'Id': u'2', 'Image': u''.join(['ba', 'se'])})
+        self.assertIdentical(a['Image'], b['Image'])
+        self.assertIsInstance(a.id, str)
+
+    def test_container_strings_bounded(self):
+        """Only image names are shared, the table stays bounded"""
+        self.patch(record, '_LIMIT', 2)
+        for i in range(5):
+            c = Container('host', {'Id': str(i), 'Image': str(i),
+                                   'Status': "Up {}".format(i)})
+        self.assertTrue(len(record._strings) <= 3)
+        self.assertNotIn(c['Status'], record._strings)
+
+    def test_container_layouts(self):
+        """Replies with the same keys share the layout"""
+        a = Container('host', {'Id': u'1', 'Image': u'base'})
+        b = Container('host', {'Id': u'2', 'Image': u'base'})
+        c = Container('host', {'Id': u'3', 'Status': u'Up 1 second'})
+        d = Container('host', {'Id': u'4', 'Image': u'base'})
+        self.assertIdentical(a._layout, b._layout)
+        self.assertIdentical(a._layout, d._layout)
+        self.assertNotIdentical(a._layout, c._layout)
+        self.assertEqual({'Id': '3', 'Status': 'Up 1 second'}, c)
+        self.assertEqual(None, c.get('Image'))
+        self.assertTrue(c.is_running)
+        self.assertFalse(a.is_running)
+
+    def test_container_mapping(self):
+        """Containers are read-only mappings, but not dicts"""
+        c = Container('host', {'Id': '1', 'Image': 'base'})
+        self.assertIsInstance(c, Mapping)
+        self.assertNotIsInstance(c, MutableMapping)
+        self.assertNotIsInstance(c, dict)
+        self.assertEqual(
+            {'Id': '1', 'Image': 'base'}, json.loads(json.dumps(c.to_dict())))
+
+    def test_container_created_cached(self):
+        """Derived properties are computed once"""
+        c = Container('host', {'Id': '1', 'Created': 1309856559})
+        self.assertIdentical(c.created, c.created)
+        self.assertEqual(datetime(2011, 7, 5, 9, 2, 39), c.created)
+
+    def test_container_pickle(self):
+        """Containers survive pickling"""
+        c = Container('host', {'Id': '1', 'Image': 'base', 'Other': 2})
+        copy = pickle.loads(pickle.dumps(c))
+        self.assertEqual(c, copy)
+        self.assertEqual('host', copy.host)
@@ -0,0 +1,146 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import os
+import sys
+import logging
+from StringIO import StringIO
+
+import mock
+from twisted.internet import defer, threads
+from twisted.trial.unittest import TestCase
+
+from shipper import logs
+from shipper import runner
+from shipper.client import Client
+from shipper.daemon import Daemon
+from shipper.shipper import Shipper
+
+_SCRIPT = '''"""Daemon test script"""
+from shipper import Shipper, run, command
+
+@command
+def hello(name, shout=False):
+    greeting = "hello " + name
+    print greeting.upper() if shout else greeting
+
+@command
+def fail():
+    raise ValueError("boom")
+
+@command
+def later(text):
+    import sys
+    shipper = Shipper()
+    # written in the reactor thread
+    shipper._blocking(lambda stream: stream.write(text + "\\n"), sys.stdout)
+    Shipper.log.info("logged %s", text)
+
+@command
+def warm(inventory):
+    from shipper.api import Api
+    shipper = Shipper(["a"])
+    print id(Shipper.load_inventory(inventory)), shipper.a.c.apis.get(
+        shipper.a.hosts[0])
+    shipper.a.c.apis[shipper.a.hosts[0]] = Api("1.21")
+
+run()
+'''
+
+
+class DaemonTestCase(TestCase):
+
+    def setUp(self):
+        directory = self.mktemp()
+        os.makedirs(directory)
+        self.script = os.path.abspath(os.path.join(directory, "env.py"))
+        with open(self.script, "w") as f:
+            f.write(_SCRIPT)
+
+        startup = mock.patch.object(Shipper, "startup").start()
+        Shipper.pool = mock.Mock()
+        self.addCleanup(mock.patch.stopall)
+        self.addCleanup(setattr, Shipper, "pool", None)
+
+        self.daemon = Daemon(os.path.join(directory, "shipper.sock"))
+        self.daemon.start()
+        self.addCleanup(self.daemon.stop)
+        startup.assert_called_once_with(persistent=True)
+
+    @defer.inlineCallbacks
+    def forward(self, *argv):
+        out, err = StringIO(), StringIO()
+
+        code = yield threads.deferToThread(
+            runner._forward, self.daemon.path, self.script, list(argv),
+            out, err)
+        defer.returnValue((code, out.getvalue(), err.getvalue()))
+
+    @defer.inlineCallbacks
+    def test_output_is_streamed_back(self):
+        code, out, _ = yield self.forward("hello", "docker", "--shout=yes")
+        self.assertEqual((0, "HELLO DOCKER\n"), (code, out))
+
+    @defer.inlineCallbacks
+    def test_script_is_loaded_once(self):
+        yield self.forward("hello", "a")
+        script = self.daemon.scripts[self.script]
+        code, out, _ = yield self.forward("hello", "b")
+        self.assertEqual((0, "hello b\n"), (code, out))
+        self.assertIs(script, self.daemon.scripts[self.script])
+        self.assertEqual(
+            ["hello", "fail", "later", "warm"],
+            [f.__name__ for f in script.functions])
+
+    @defer.inlineCallbacks
+    def test_state_is_kept(self):
+        """Commands reuse the inventory and the negotiated apis"""
+        inventory = os.path.join(os.path.dirname(self.script), "hosts")
+        with open(inventory, "w") as f:
+            f.write("a\n")
+        Client.apis.clear()
+        self.addCleanup(Client.apis.clear)
+        self.addCleanup(setattr, Shipper, "inventory", None)
+
+        _, first, err = yield self.forward("warm", inventory)
+        _, second, _ = yield self.forward("warm", inventory)
+        first, second = first.split(), second.split()
+        self.assertEqual("None", first[1], err)
+        self.assertEqual([first[0], "Api(1.21)"], second)
+
+    @defer.inlineCallbacks
+    def test_output_of_other_threads(self):
+        """Streams written in the reactor thread and records written
+        by the log listener go to the command's client
+        """
+        listener = logs.QueueListener([logging.StreamHandler(sys.stderr)])
+        log = logging.getLogger("shipper.tests.daemon")
+        log.propagate = False
+        log.setLevel(logging.INFO)
+        log.addHandler(logs.QueueHandler(listener.queue))
+        self.patch(Shipper, "log", log)
+        self.patch(Shipper, "listener", listener)
+        self.daemon._route_logs()
+        listener.start()
+        self.addCleanup(listener.stop)
+        self.addCleanup(setattr, log, "handlers", [])
+
+        code, out, err = yield self.forward("later", "tick")
+        self.assertEqual((0, "tick\n"), (code, out))
+        self.assertIn("logged tick", err)
+
+    @defer.inlineCallbacks
+    def test_failure(self):
+        code, _, _ = yield self.forward("fail")
+        self.assertEqual(-1, code)
+
+    @defer.inlineCallbacks
+    def test_usage_error(self):
+        code, _, err = yield self.forward("hello")
+        self.assertEqual(2, code)
+        self.assertIn("too few arguments", err)
+
+    def test_no_daemon(self):
+        self.assertIsNone(runner._forward(
+            self.daemon.path + ".missing", self.script, []))
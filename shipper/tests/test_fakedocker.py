@@ -0,0 +1,264 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import os
+import time
+import tarfile
+from StringIO import StringIO
+
+from twisted.internet import defer, reactor, task
+from twisted.trial.unittest import TestCase
+from twisted.web.client import HTTPConnectionPool
+
+from shipper.async_shipper import AsyncShipper
+from shipper.client import Client
+from shipper.fakedocker import FakeFleet, constant
+from shipper.history import History
+from shipper.metrics import Metrics
+
+
+class FakeDockerTestCase(TestCase):
+    """
+    Tests shipper against the fake docker fleet
+    """
+    def setUp(self):
+        self.fleet = FakeFleet(
+            3, containers=5, latency={"containers/ps": constant(0.01)},
+            failures={"containers/create": 1})
+        self.addCleanup(self.fleet.stop)
+        # ports of the stopped fleets are reused with other versions
+        self.addCleanup(Client.apis.clear)
+        pool = HTTPConnectionPool(reactor, persistent=False)
+        self.addCleanup(pool.closeCachedConnections)
+        self.shipper = AsyncShipper(self.fleet.hosts, pool=pool)
+
+    @defer.inlineCallbacks
+    def test_containers(self):
+        """Every fake host reports its own containers"""
+        containers = yield self.shipper.containers()
+        self.assertEqual(15, len(containers))
+        self.assertEqual(
+            set(self.shipper.hosts), set(c.host for c in containers))
+
+    def test_failures(self):
+        """Failure rate makes the endpoint fail"""
+        d = self.shipper.on(self.fleet.hosts[:1]).run("image", "command")
+        return self.assertFailure(d, defer.FirstError)
+
+    @defer.inlineCallbacks
+    def test_containers_stream(self):
+        """Containers of every host are streamed as they arrive"""
+        out = StringIO()
+        containers = yield self.shipper.containers(stream=out, format="json")
+        self.assertEqual(15, len(containers))
+        self.assertEqual(15, len(out.getvalue().splitlines()))
+
+    @defer.inlineCallbacks
+    def test_logs(self):
+        """Output of the containers is demultiplexed into the sink"""
+        containers = yield self.shipper.containers()
+        for docker in self.fleet.dockers:
+            for container_id in docker.containers:
+                docker.add_output(container_id, "out " + container_id[:4])
+                docker.add_output(container_id, " err", stream=2)
+        sink = yield self.shipper.logs(*containers[:10])
+        self.assertEqual(10, len(sink.chunks))
+        c = containers[0]
+        self.assertEqual("out {} err".format(c.id[:4]), sink.getvalue(c))
+
+        sink = yield self.shipper.logs(c, stderr=False)
+        self.assertEqual("out " + c.id[:4], sink.getvalue(c))
+
+    @defer.inlineCallbacks
+    def test_execute(self):
+        """Command runs in every container, limited per host"""
+        containers = yield self.shipper.containers()
+        results = yield self.shipper.execute(
+            *containers, cmd="echo ok", limit=2)
+        self.assertEqual(15, len(results))
+        for r, c in zip(results, containers):
+            self.assertIs(c, r.container)
+            self.assertEqual(0, r.exit_code)
+            self.assertEqual("{} ok\n".format(c.id[:12]), r.output)
+
+        results = yield self.shipper.execute(containers[0], cmd=["false"])
+        self.assertEqual(1, results[0].exit_code)
+
+    @defer.inlineCallbacks
+    def test_archives(self):
+        """Folder is uploaded to the containers and downloaded back"""
+        source = self.mktemp()
+        os.makedirs(os.path.join(source, "conf.d"))
+        with open(os.path.join(source, "conf.d", "app.conf"), "w") as f:
+            f.write("workers = 4\n")
+
+        containers = yield self.shipper.containers()
+        yield self.shipper.put_archive(source, "/etc/app", *containers)
+        for docker in self.fleet.dockers:
+            for c in docker.containers.itervalues():
+                self.assertEqual(
+                    {"/etc/app/conf.d/app.conf": "workers = 4\n"},
+                    c['Files'])
+
+        directory = self.mktemp()
+        paths = yield self.shipper.get_archive(
+            "/etc/app", directory, *containers[:2])
+        self.assertEqual(2, len(paths))
+        for path in paths:
+            t = tarfile.open(path)
+            self.assertEqual(
+                "workers = 4\n",
+                t.extractfile("etc/app/conf.d/app.conf").read())
+
+    @defer.inlineCallbacks
+    def test_stats(self):
+        """Samples of every container roll up per host and image"""
+        containers = yield self.shipper.containers()
+        stats = yield self.shipper.stats(*containers, batch=4)
+        self.assertEqual(15, len(stats.rows()))
+        self.assertEqual([5, 5, 5],
+                         [g['Containers'] for g in stats.rollup('host')])
+        self.assertAlmostEqual(20.0, stats.top(1)[0]['CPU'])
+
+        stats = yield self.shipper.stats(
+            *containers[:2], follow=True, size=2)
+        for series in stats.series.itervalues():
+            self.assertEqual(2, len(series.samples))
+
+    @defer.inlineCallbacks
+    def test_mixed_versions(self):
+        """Every host gets the newest api it speaks"""
+        fleet = FakeFleet(3, containers=2, version=["1.14", "1.16", "1.99"])
+        self.addCleanup(fleet.stop)
+        shipper = AsyncShipper(fleet.hosts, pool=self.shipper.c.pool)
+
+        apis = yield shipper.negotiate()
+        self.assertEqual(["1.14", "1.16", "1.21"],
+                         [api.version for api in apis])
+
+        fleet.dockers[1].add_container("web", "serve")
+        stopped = yield shipper.containers(all=True, running=False)
+        self.assertEqual(1, len(stopped))
+
+        containers = yield shipper.containers()
+        for docker in fleet.dockers:
+            for c in docker.containers.itervalues():
+                c['Files']["/etc/app.conf"] = "workers = 4\n"
+        paths = yield shipper.get_archive(
+            "/etc/app.conf", self.mktemp(), *containers)
+        self.assertEqual(
+            ["workers = 4\n"] * 6,
+            [tarfile.open(p).extractfile("etc/app.conf").read()
+             for p in paths])
+
+        execs = yield shipper.execute(*containers[2:], cmd="true")
+        self.assertEqual([0] * 4, [e.exit_code for e in execs])
+        yield self.assertFailure(
+            shipper.execute(*containers[:2], cmd="true"), defer.FirstError)
+
+    @defer.inlineCallbacks
+    def test_versioned_shapes(self):
+        """Names, memory limits and placement work with the replies
+        of the old and the new api versions
+        """
+        fleet = FakeFleet(2, images=1, version=["1.6", "1.21"])
+        self.addCleanup(fleet.stop)
+        for docker in fleet.dockers:
+            docker.memory = 1000
+        shipper = AsyncShipper(fleet.hosts, pool=self.shipper.c.pool)
+
+        images = yield shipper.images()
+        self.assertEqual(
+            [("image-0", "latest")] * 2,
+            [(i.repository, i.tag) for i in images])
+
+        yield shipper.run("web", "serve", mem_limit=300)
+        self.assertEqual(
+            [[300], [300]],
+            [[c['Memory'] for c in d.containers.itervalues()]
+             for d in fleet.dockers])
+
+        snapshot = yield shipper.snapshot()
+        self.assertEqual([700, 700], [s.free for s in snapshot.states])
+
+    @defer.inlineCallbacks
+    def test_history(self):
+        """Listings are recorded, only the changes are written"""
+        self.shipper.history = History(self.mktemp() + "/history.db")
+        self.addCleanup(self.shipper.history.close)
+        yield self.shipper.containers(all=True, running=None)
+        yield self.shipper.containers()
+        self.shipper.history.flush()
+        deployed = time.time()
+
+        docker = self.fleet.dockers[0]
+        docker.set_status(sorted(docker.containers)[0], "Exit 0")
+        yield self.shipper.containers(all=True, running=None)
+        self.shipper.history.flush()
+
+        self.assertEqual(15, len(self.shipper.history.containers()))
+        self.assertEqual(
+            ["changed"],
+            [c['change'] for c in self.shipper.history.changes(deployed)])
+
+    @defer.inlineCallbacks
+    def test_gc(self):
+        """Exited containers and dangling images are removed in batches"""
+        for docker in self.fleet.dockers:
+            for i in range(3):
+                docker.add_container("image-1", "sleep")
+            for i in range(2):
+                docker.images.append({
+                    'Id': "dangling-{}".format(i),
+                    'RepoTags': ["<none>:<none>"],
+                    'Created': 1380000000, 'Size': 100})
+
+        report = yield self.shipper.gc(dry_run=True)
+        self.assertEqual((9, 6, 600), (
+            len(report.containers), len(report.images), report.reclaimed))
+        self.assertEqual(8, len(self.fleet.dockers[0].containers))
+
+        report = yield self.shipper.gc(batch=2, interval=0.01)
+        self.assertEqual((9, 6, 600, []), (
+            len(report.containers), len(report.images), report.reclaimed,
+            report.failed))
+        for docker in self.fleet.dockers:
+            self.assertEqual(5, len(docker.containers))
+            self.assertEqual([], docker.images)
+
+    @defer.inlineCallbacks
+    def test_wait_events(self):
+        """Containers are resolved by the die events of their hosts"""
+        self.shipper.c.metrics = Metrics()
+        docker = self.fleet.dockers[0]
+        exited = docker.add_container("batch", "false")
+        docker.exit(exited, 3)
+        containers = yield self.shipper.containers(all=True, running=None)
+        finished = []
+
+        d = self.shipper.wait(*containers, events=True, timeout=10,
+                              each=lambda c, r: finished.append(c.id))
+        # the exited container is found by the listing once
+        # the streams are open
+        while not finished:
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        self.assertEqual([exited], finished)
+        self.assertTrue(
+            all(docker.subscribers for docker in self.fleet.dockers))
+        for docker in self.fleet.dockers:
+            for i, container_id in enumerate(sorted(docker.containers)):
+                if container_id != exited:
+                    docker.exit(container_id, i % 2)
+
+        results = yield d
+        self.assertEqual(16, len(finished))
+        codes = dict((c.id, r['StatusCode']) for c, r in results)
+        self.assertEqual(3, codes[exited])
+        self.assertEqual(set([0, 1, 3]), set(codes.itervalues()))
+        # streams are closed once all the containers are done
+        while any(docker.subscribers for docker in self.fleet.dockers):
+            yield task.deferLater(reactor, 0.01, lambda: None)
+        paths = [s['path'] for s in self.shipper.c.metrics.snapshot()]
+        self.assertEqual(3, paths.count("events"))
+        self.assertFalse([p for p in paths if p.endswith("wait")])
@@ -0,0 +1,108 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import json
+import sqlite3
+from argparse import Namespace
+from contextlib import closing
+
+from twisted.trial.unittest import TestCase
+
+from shipper import history
+
+
+def container(id, status="Up 1 minute", image="web"):
+    return {'Id': id, 'Image': image, 'Command': "serve",
+            'Status': status, 'Created': 1380000000}
+
+
+class HistoryTestCase(TestCase):
+
+    def setUp(self):
+        self.history = history.History(self.mktemp() + "/history.db")
+        self.addCleanup(self.history.close)
+
+    def _record(self, kind, host, replies, now, scope=None):
+        self.history.record(kind, host, replies, scope, now=now)
+        self.history.flush()
+
+    def _count(self, table):
+        with closing(sqlite3.connect(self.history.path)) as db:
+            return db.execute(
+                "SELECT count(*) FROM {}".format(table)).fetchone()[0]
+
+    def test_only_changes_are_written(self):
+        for now in (100, 200, 300):
+            self._record("containers", "a", [
+                container("1"), container("2", status="Up 5 minutes")], now)
+        self.assertEqual(2, self._count("containers"))
+
+        self._record("containers", "a", [container("1", "Exit 0")], 400)
+        self.assertEqual(3, self._count("containers"))
+        self.assertEqual(
+            [("1", "exited", 400, None)],
+            [(r['id'], r['state'], r['first_seen'], r['last_seen'])
+             for r in self.history.containers()])
+        self.assertEqual({"a": 400}, self.history.snapshots())
+
+    def test_scope(self):
+        """Stopped containers are kept if only running ones are listed"""
+        self._record("containers", "a", [
+            container("1"), container("2", "Exit 1")], 100)
+        self._record("containers", "a", [], 200, scope=("running",))
+        self.assertEqual(
+            ["2"], [r['id'] for r in self.history.containers()])
+
+    def test_hosts_and_window(self):
+        self._record("containers", "a", [container("1", image="web:1")], 100)
+        self._record("containers", "b", [container("2", image="web:2")], 100)
+        self._record("containers", "a", [], 200)
+        self._record("containers", "b", [container("3", image="db")], 300)
+
+        self.assertEqual(["a", "b"], self.history.hosts("web*", since=150))
+        self.assertEqual(["b"], self.history.hosts("web*", since=250))
+        self.assertEqual(["b"], self.history.hosts("db", since=300))
+        self.assertEqual(
+            ["1", "2"],
+            [r['id'] for r in self.history.containers(since=0, until=150)])
+
+    def test_changes(self):
+        self._record("containers", "a", [container("1"), container("2")], 100)
+        self._record("containers", "a", [
+            container("2", "Exit 0"), container("3")], 200)
+        self.assertEqual(
+            [("1", "removed"), ("2", "changed"), ("3", "added")],
+            sorted((c['id'], c['change'])
+                   for c in self.history.changes(since=150)))
+
+    def test_images_and_inspections(self):
+        image = {'Id': "abc", 'RepoTags': ["web:1", "web:latest"],
+                 'Size': 10, 'Created': 1380000000}
+        self._record("images", "a", [image], 100)
+        self.assertEqual(
+            ["1", "latest"],
+            sorted(r['tag'] for r in self.history.images(repository="web")))
+
+        details = {'Id': "1", 'Config': {'Image': "web"},
+                   'State': {'Running': True}}
+        self._record("inspections", "a", [details], 100)
+        self._record("inspections", "a", [details], 200)
+        self.assertEqual(1, self._count("inspections"))
+        self.assertEqual(details, self.history.inspection("a", "1"))
+
+    def test_cli(self):
+        self._record("containers", "http://a:4243", [container("1")], 100)
+        out = history._execute(self.history, Namespace(
+            command="containers", host=None, image="web", state=None,
+            since=None, until=None, format="json"))
+        self.assertEqual(
+            ["1"], [json.loads(line)['id'] for line in out.splitlines()])
+        out = history._execute(self.history, Namespace(
+            command="hosts", image="web", since=0, until=None))
+        self.assertEqual("http://a:4243\n", out)
+
+    def test_parse_time(self):
+        self.assertEqual(1000 - 7200, history.parse_time("2h", now=1000))
+        self.assertEqual(1390000000, history.parse_time("1390000000"))
+        self.assertRaises(Exception, history.parse_time, "yesterday")
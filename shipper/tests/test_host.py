@@ -3,7 +3,7 @@
 # See LICENSE for details
 
 from twisted.trial import unittest
-from shipper.host import Host, parse_hosts
+from shipper.host import Host, netloc, parse_hosts
 
 
 class ShipperHostTestCase(unittest.TestCase):
@@ -26,6 +26,11 @@ class ShipperHostTestCase(unittest.TestCase):
         self.assertEqual(
             "http://google.com:1234", H("http://google.com:1234").url)
 
+    def test_netloc(self):
+        self.assertEqual(
+            "localhost:4243", netloc(Host("http://localhost:4243")))
+        self.assertEqual("a", netloc("a"))
+
     def test_host_mapping(self):
         """Ensure that hosts can be used in hashes
         """
@@ -61,3 +66,9 @@ class ShipperHostTestCase(unittest.TestCase):
         self.assertEqual(
             [H("https://google.com:123")],
             ph(["https://google.com"], default_port=123))
+
+    def test_host_interned(self):
+        """Same url gives the same host object"""
+        self.assertIdentical(Host("http://a:1"), Host("http://a:1"))
+        self.assertEqual(
+            [Host("http://a:1")], parse_hosts([Host("http://a:1")]))
@@ -0,0 +1,63 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+from twisted.trial import unittest
+
+from shipper.host import Host
+from shipper.inventory import Inventory, HashRing
+
+INVENTORY = """
+# frontends
+[web]
+web-1:1234 tags=ssd,eu
+web-2      tags=eu
+
+[db]
+db-1 tags=ssd
+"""
+
+
+class ShipperInventoryTestCase(unittest.TestCase):
+    """
+    Tests host inventory and selectors
+    """
+
+    def setUp(self):
+        self.inventory = Inventory.parse(INVENTORY.splitlines())
+
+    def test_select(self):
+        """Hosts are selected by tags, groups and names"""
+        H = Host
+        select = self.inventory.select
+        web1, web2, db1 = (
+            H("http://web-1:1234"), H("http://web-2:4243"),
+            H("http://db-1:4243"))
+
+        self.assertEqual([web1, web2, db1], select("all"))
+        self.assertEqual([web1, db1], select("tag:ssd"))
+        self.assertEqual([web1, web2], select("group:web"))
+        self.assertEqual([web1], select("group:web&tag:ssd"))
+        self.assertEqual([db1, web2], select("group:db,web-2"))
+        self.assertEqual([H("http://other:4243")], select("other"))
+        self.assertEqual([], select("tag:missing"))
+
+    def test_parse_invalid(self):
+        """Broken lines are reported"""
+        self.assertRaises(
+            ValueError, Inventory.parse, ["[web", "host"])
+        self.assertRaises(
+            ValueError, Inventory.parse, ["host ports=1"])
+
+    def test_hash_ring(self):
+        """Keys stick to hosts and move only from removed hosts"""
+        hosts = [Host("http://h{}:1".format(i)) for i in range(5)]
+        keys = ["key-{}".format(i) for i in range(200)]
+        ring = HashRing(hosts)
+        before = dict((k, ring.get(k)) for k in keys)
+        self.assertEqual(5, len(ring.assign(keys)))
+
+        smaller = HashRing(hosts[:-1])
+        for key in keys:
+            if before[key] != hosts[-1]:
+                self.assertEqual(before[key], smaller.get(key))
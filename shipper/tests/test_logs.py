@@ -0,0 +1,114 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import os
+import Queue
+import logging
+
+import mock
+from twisted.trial.unittest import TestCase
+
+from shipper import logs
+from shipper.host import Host
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def _logger(name, handler):
+    log = logging.getLogger(name)
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    log.handlers = [handler]
+    return log
+
+
+class LogsTestCase(TestCase):
+
+    def test_queue_handler_drops_when_full(self):
+        handler = logs.QueueHandler(Queue.Queue(1))
+        log = _logger("test.queue", handler)
+        log.debug("one")
+        log.debug("two")
+        self.assertEqual(1, handler.dropped)
+        self.assertEqual("one", handler.queue.get().getMessage())
+
+    def test_queue_handler_prepares(self):
+        """Queued records have the arguments merged and the traceback
+        rendered
+        """
+        handler = logs.QueueHandler(Queue.Queue())
+        log = _logger("test.prepare", handler)
+        state = ["before"]
+        log.info("state %s", state)
+        state[0] = "after"
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            log.exception("failed %d", 1)
+
+        first, second = handler.queue.get(), handler.queue.get()
+        self.assertEqual(("state ['before']", None), (first.msg, first.args))
+        self.assertEqual("failed 1", second.getMessage())
+        self.assertIdentical(None, second.exc_info)
+        self.assertIn("ZeroDivisionError", logging.Formatter().format(second))
+
+    def test_listener_formats_in_thread(self):
+        collect = _Collect()
+        collect.setLevel(logging.INFO)
+        listener = logs.QueueListener([collect])
+        listener.start()
+        log = _logger("test.listener", logs.QueueHandler(listener.queue))
+        log.info("%s: %d", "host", 1)
+        log.debug("skipped")
+        listener.stop()
+        self.assertEqual(["host: 1"], collect.messages)
+
+    def test_host_output_every(self):
+        collect = _Collect()
+        output = logs.HostOutput(
+            _logger("test.every", collect), every=3)
+        for i in range(7):
+            output.line("a", "line {}\n".format(i))
+        self.assertEqual(
+            ["a: line 0", "a: line 3", "a: line 6"], collect.messages)
+        self.assertEqual({"a": 4}, output.dropped)
+
+    @mock.patch('shipper.logs.time')
+    def test_host_output_rate(self, m):
+        m.time.return_value = 100.0
+        collect = _Collect()
+        output = logs.HostOutput(
+            _logger("test.rate", collect), rate=2)
+        for i in range(4):
+            output.line("a", "a{}".format(i))
+        output.line("b", "b0")
+        m.time.return_value = 100.5
+        output.line("a", "a4")
+        self.assertEqual(["a: a0", "a: a1", "b: b0", "a: a4"],
+                         collect.messages)
+        self.assertEqual({"a": 2}, output.dropped)
+
+    def test_host_files(self):
+        directory = self.mktemp()
+        files = logs.HostFileHandler(directory)
+        console = _Collect()
+        console.addFilter(logs.SkipHostOutput())
+        log = _logger("test.files", files)
+        log.addHandler(console)
+
+        output = logs.HostOutput(log)
+        output.line(Host("http://a:4243"), "built\n")
+        log.info("done")
+        files.close()
+
+        with open(os.path.join(directory, "a_4243.log")) as f:
+            self.assertEqual("a:4243: built\n", f.read())
+        self.assertEqual(["done"], console.messages)
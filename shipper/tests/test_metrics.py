@@ -0,0 +1,55 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+from twisted.trial import unittest
+
+from shipper.metrics import Histogram, Metrics, template
+
+
+class ShipperMetricsTestCase(unittest.TestCase):
+    """
+    Tests request metrics
+    """
+
+    def test_template(self):
+        """Ids are replaced in the paths"""
+        self.assertEqual(
+            "containers/{id}/json", template("containers/5fe8c1d2e3f4/json"))
+        self.assertEqual("containers/ps", template("containers/ps"))
+        self.assertEqual("containers/create", template("containers/create"))
+        self.assertEqual("images/json", template("images/json"))
+        self.assertEqual("images/{id}", template("images/base"))
+
+    def test_histogram(self):
+        """Values are counted in fixed buckets"""
+        h = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.05, 0.5, 5):
+            h.observe(value)
+        self.assertEqual([2, 1, 1], h.counts)
+        self.assertEqual(0.1, h.quantile(0.5))
+        self.assertEqual(None, h.quantile(0.99))
+        self.assertEqual(
+            [(0.1, 2), (1.0, 3), (float('inf'), 4)], h.cumulative())
+
+    def test_export(self):
+        """Metrics are exported as prometheus text and json"""
+        m = Metrics(buckets=(0.1, 1.0))
+        m.record("a:4243", "GET", "containers/abc/json", 0.05,
+                 code=200, bytes_in=10)
+        m.record("a:4243", "GET", "containers/def/json", 0.5,
+                 error="ConnectionRefusedError")
+
+        snapshot, = m.snapshot()
+        self.assertEqual("containers/{id}/json", snapshot['path'])
+        self.assertEqual(2, snapshot['count'])
+        self.assertEqual({'200': 1}, snapshot['codes'])
+
+        text = m.to_prometheus()
+        self.assertIn(
+            'shipper_request_duration_seconds_bucket{host="a:4243",'
+            'method="GET",path="containers/{id}/json",le="0.1"} 1', text)
+        self.assertIn(
+            'shipper_response_bytes_total{host="a:4243",method="GET",'
+            'path="containers/{id}/json"} 10', text)
+        self.assertIn('error="ConnectionRefusedError"} 1', text)
@@ -0,0 +1,69 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+from twisted.trial import unittest
+
+from shipper.container import Container
+from shipper.errors import PlacementError
+from shipper.placement import HostState, Snapshot, place, PACK
+
+
+class ShipperPlacementTestCase(unittest.TestCase):
+    """
+    Tests placement of containers on hosts
+    """
+
+    def test_snapshot_from_responses(self):
+        """Memory of running containers is summed per host, limits
+        are in Config before api 1.18 and in HostConfig since
+        """
+        infos = [{'MemTotal': 1000}, {}]
+        containers = [Container('a', {'Id': '1', 'Image': 'web'}),
+                      Container('a', {'Id': '2', 'Image': 'db'})]
+        details = [Container('a', {'Id': '1', 'Config': {'Memory': 100}}),
+                   Container('a', {'Id': '2', 'Config': {},
+                                   'HostConfig': {'Memory': 200}})]
+        snapshot = Snapshot.from_responses(
+            ['a', 'b'], infos, containers, details)
+
+        a, b = snapshot.states
+        self.assertEqual(700, a.free)
+        self.assertEqual({'web': 1, 'db': 1}, a.images)
+        self.assertEqual(float('inf'), b.free)
+
+    def test_place_spread(self):
+        """Containers go to the hosts with most free memory"""
+        snapshot = Snapshot([HostState('a', 1000, 600),
+                             HostState('b', 1000)])
+        self.assertEqual(
+            ['b', 'b', 'a'], place(snapshot, 3, mem_limit=300, image='web'))
+        self.assertEqual(
+            [100, 400], [s.free for s in snapshot.states])
+
+    def test_place_pack(self):
+        """Pack fills the fullest host first"""
+        snapshot = Snapshot([HostState('a', 1000, 600),
+                             HostState('b', 1000)])
+        self.assertEqual(
+            ['a', 'b', 'b'],
+            place(snapshot, 3, mem_limit=300, strategy=PACK))
+
+    def test_place_anti_affinity(self):
+        """Only one container of an image per host"""
+        snapshot = Snapshot([HostState('a', images={'web': 1}),
+                             HostState('b'),
+                             HostState('c')])
+        self.assertEqual(
+            ['b', 'c'],
+            place(snapshot, 2, image='web', anti_affinity=True))
+        self.assertRaises(
+            PlacementError,
+            place, snapshot, 1, image='web', anti_affinity=True)
+
+    def test_place_not_enough_room(self):
+        """Placement is all or nothing"""
+        snapshot = Snapshot([HostState('a', 1000)])
+        self.assertRaises(
+            PlacementError, place, snapshot, 4, mem_limit=300)
+        self.assertEqual(1000, snapshot.states[0].free)
@@ -0,0 +1,61 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import mock
+
+from twisted.internet.defer import succeed, Deferred
+from twisted.trial.unittest import TestCase
+
+from shipper.async_shipper import AsyncShipper
+from shipper.client import Client
+
+
+class PlanTestCase(TestCase):
+    """
+    Tests execution of the operation plans
+    """
+    def setUp(self):
+        self.client = mock.Mock(Client)
+        self.shipper = AsyncShipper(
+            ["a", "b"],
+            client_builder=lambda *args, **kwargs: self.client)
+
+        self.client.containers.side_effect = lambda host, **kw: succeed([
+            {'Id': 'old-' + host.a.hostname, 'Status': 'Up', 'Image': 'web'}])
+        self.client.create_container.side_effect = (
+            lambda host, **kw: succeed({'Id': 'new-' + host.a.hostname}))
+        self.client.start.side_effect = lambda host, **kw: succeed(None)
+
+    def test_chain(self):
+        """Every step gets the containers from the previous step
+        on the same host
+        """
+        stopped = []
+        self.client.stop.side_effect = (
+            lambda host, container, **kw:
+            succeed(stopped.append(container.id)))
+
+        d = self.shipper.plan().containers(image="web").stop().run(
+            "web", "serve").submit()
+
+        self.assertEqual(
+            ['new-a', 'new-b'], [c.id for c in self.successResultOf(d)])
+        self.assertEqual(['old-a', 'old-b'], stopped)
+
+    def test_hosts_do_not_wait_for_each_other(self):
+        """Slow host does not hold the next steps of the other hosts"""
+        slow = Deferred()
+        self.client.stop.side_effect = (
+            lambda host, **kw:
+            slow if host.a.hostname == 'a' else succeed(None))
+
+        d = self.shipper.plan().containers().stop().run(
+            "web", "serve").submit()
+
+        self.assertNoResult(d)
+        self.assertEqual(
+            ['b'], [c[0][0].a.hostname
+                    for c in self.client.create_container.call_args_list])
+        slow.callback(None)
+        self.assertEqual(2, len(self.successResultOf(d)))
@@ -2,13 +2,75 @@
 # Licensed under the Apache License, Version 2.0 (the "License")
 # See LICENSE for details
 
+import json
+from StringIO import StringIO
+
+import mock
 from twisted.trial import unittest
 
+from shipper.container import Container
+from shipper.host import Host
+from shipper.pretty import containers_stream
+
 
 class ShipperPrettyTestCase(unittest.TestCase):
     """
     Tests pretty printing of images and containers
     """
 
+    def setUp(self):
+        self.host = Host("http://a:4243")
+        self.containers = [Container(self.host, {
+            'Id': '5fe8c1d2e3f4a5b6',
+            'Image': 'base',
+            'Command': 'echo hi',
+            'Created': 1362358923,
+            'Status': 'Up 1 second',
+            'Ports': [{'PublicPort': 80, 'PrivatePort': 8080,
+                       'Type': 'tcp'}]})]
+        p = mock.patch('shipper.pretty.time_ago',
+                       return_value="1 minute ago")
+        p.start()
+        self.addCleanup(p.stop)
+
     def test_pretty_print_images(self):
         pass
+
+    def test_stream_table(self):
+        """Tables have fixed width columns"""
+        out = StringIO()
+        containers_stream(out).write(self.host, self.containers)
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual("[Host(a:4243)]", lines[0])
+        self.assertTrue(lines[1].startswith("Id            Image"))
+        self.assertEqual(
+            "5fe8c1d2e3f4  base                       echo hi",
+            lines[3][:48])
+        self.assertTrue(lines[3].endswith("80->8080/tcp"))
+
+    def test_stream_json(self):
+        """Every container is a json object on its own line"""
+        out = StringIO()
+        containers_stream(out, "json").write(self.host, self.containers * 2)
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual(2, len(lines))
+        record = json.loads(lines[0])
+        self.assertEqual("a:4243", record['Host'])
+        self.assertEqual("5fe8c1d2e3f4a5b6", record['Id'])
+
+    def test_stream_csv(self):
+        """Csv has a single header for all the hosts"""
+        out = StringIO()
+        stream = containers_stream(out, "csv")
+        stream.write(self.host, self.containers)
+        stream.write(self.host, self.containers)
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual(
+            "Host,Id,Image,Command,Created,Status,Ports", lines[0])
+        self.assertEqual(3, len(lines))
+        self.assertEqual(
+            "a:4243,5fe8c1d2e3f4,base,echo hi,1 minute ago,Up 1 second,"
+            "80->8080/tcp", lines[1])
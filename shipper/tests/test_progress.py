@@ -0,0 +1,209 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import mock
+from StringIO import StringIO
+
+from twisted.internet.defer import Deferred, succeed
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+
+from shipper import hooks, progress
+from shipper.async_shipper import AsyncShipper
+from shipper.client import Client
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProgressTestCase(TestCase):
+
+    def setUp(self):
+        self.clock = _Clock()
+        self.monitor = progress.Monitor()
+        self.events = []
+        self.monitor.add(lambda p: self.events.append(p.counts()))
+
+    def _progress(self, hosts):
+        p = progress.Progress("run", self.monitor, clock=self.clock)
+        self.monitor.active.append(p)
+        return p, [p.add(host) for host in hosts]
+
+    def test_counts(self):
+        """Hosts go from pending to running to succeeded or failed"""
+        p, (a, b, c) = self._progress(["a", "b", "c"])
+        a.start()
+        b.start()
+        p.close()
+        self.assertEqual(
+            {'pending': 1, 'running': 2, 'succeeded': 0, 'failed': 0},
+            p.counts())
+
+        a.finish(None)
+        b.finish(Failure(RuntimeError()))
+        self.assertFalse(p.done)
+        c.start()
+        c.finish("ok")
+        self.assertTrue(p.done)
+        self.assertEqual(
+            {'pending': 0, 'running': 0, 'succeeded': 2, 'failed': 1},
+            self.events[-1])
+        self.assertEqual([], self.monitor.active)
+
+    def test_slowest_and_eta(self):
+        """Slowest outstanding hosts and ETA by the finished hosts"""
+        p, (a, b, c, d) = self._progress(["a", "b", "c", "d"])
+        a.start()
+        b.start()
+        p.close()
+        self.assertIdentical(None, p.eta())
+
+        self.clock.now += 1
+        a.finish(None)
+        self.clock.now += 1.5
+        c.start()
+        self.clock.now += 0.5
+        b.finish(None)
+        # a took 1 second and b 3, c is running for 0.5 and
+        # d has not started yet
+        self.assertEqual([("c", 0.5)], p.slowest())
+        self.assertEqual(0.5 + 3, p.eta())
+        d.start()
+        self.assertEqual(1.0, p.eta())
+        self.assertEqual(
+            [("a", 1), ("b", 3), ("c", 0.5), ("d", 0)], p.elapsed())
+
+        self.clock.now += 5
+        self.assertIdentical(None, p.eta())
+        self.assertEqual([("c", 5.5), ("d", 5)], p.slowest())
+
+    def test_broken_callback(self):
+        """Failing callbacks do not break the operation"""
+        self.monitor.add(lambda p: 1 / 0)
+        p, (a,) = self._progress(["a"])
+        a.start()
+        p.close()
+        self.assertEqual("ok", a.finish("ok"))
+        self.assertTrue(p.done)
+
+    def test_done_without_monitor(self):
+        """Progress knows it's done without callbacks watching it"""
+        p = progress.Progress("run", clock=self.clock)
+        a = p.add("a")
+        a.start()
+        p.close()
+        self.assertFalse(p.done)
+        a.finish(None)
+        self.assertTrue(p.done)
+
+    def test_status_line(self):
+        """Operations in flight are rendered in place on terminals"""
+        stream = StringIO()
+        stream.isatty = lambda: True
+        status = progress.StatusLine(stream, interval=0,
+                                     monitor=self.monitor)
+        self.monitor.add(status)
+        p, (a, b) = self._progress(["a", "b"])
+        a.start()
+        b.start()
+        p.close()
+        self.clock.now += 2
+        a.finish(None)
+        b.finish(None)
+
+        lines = stream.getvalue().split("\r")
+        self.assertEqual("run 0/2 running=2", lines[1].strip())
+        self.assertEqual(
+            "run 1/2 running=1 eta 0s slowest b 2.0s", lines[2].strip())
+        self.assertEqual("run 2/2 done in 2.0s", lines[3].strip())
+        self.assertTrue(lines[3].endswith("\n"))
+
+
+class ParallelProgressTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock(Client)
+        self.shipper = AsyncShipper(
+            ["a", "b"], client_builder=lambda *args, **kwargs: self.client)
+        self.reports = []
+        progress.registry.add(self.reports.append)
+        self.addCleanup(progress.registry.remove, self.reports.append)
+
+    def test_parallel(self):
+        """Fan-outs report progress of every host to the callbacks"""
+        slow = Deferred()
+        self.client.wait.side_effect = (
+            lambda host, **kw:
+            slow if host.a.hostname == 'a' else succeed({'StatusCode': 0}))
+        containers = [mock.Mock(host=h) for h in self.shipper.hosts]
+
+        self.client.wait.__name__ = "wait"
+        self.client.operation = hooks.Operation("batch")
+
+        d = self.shipper.wait(*containers)
+        report = self.reports[-1]
+        self.assertEqual("batch/wait", report.name)
+        self.assertEqual(
+            (1, 1, False), (report.counts()['running'],
+                            report.counts()['succeeded'], report.done))
+        self.assertEqual(["a:4243"], [h for h, _ in report.slowest()])
+        self.assertIn(report, progress.registry.active)
+
+        slow.callback({'StatusCode': 1})
+        self.successResultOf(d)
+        self.assertTrue(report.done)
+        self.assertEqual(2, report.counts()['succeeded'])
+        self.assertNotIn(report, progress.registry.active)
+
+    def test_not_watched(self):
+        """Nothing is tracked without the callbacks"""
+        progress.registry.remove(self.reports.append)
+        self.addCleanup(progress.registry.add, self.reports.append)
+        self.client.info.side_effect = lambda host: succeed({})
+        self.successResultOf(self.shipper.parallel(self.client.info, {}))
+        self.assertEqual([], progress.registry.active)
+
+    def test_limited_pending(self):
+        """Calls waiting for the per host limit are pending"""
+        pending = []
+
+        def execute(host, **kwargs):
+            pending.append(Deferred())
+            return pending[-1]
+
+        self.client.execute.side_effect = execute
+        self.client.execute.__name__ = "execute"
+        containers = [mock.Mock(host=h, id=str(i))
+                      for h in self.shipper.hosts for i in range(2)]
+        d = self.shipper.execute(*containers, cmd="uptime", limit=1)
+        report = self.reports[-1]
+        self.assertEqual("execute", report.name)
+        self.assertEqual(
+            (2, 2), (report.counts()['pending'], report.counts()['running']))
+
+        while pending:
+            pending.pop(0).callback(0)
+        self.successResultOf(d)
+        self.assertTrue(report.done)
+        self.assertEqual(4, report.counts()['succeeded'])
+
+    def test_raised(self):
+        """Progress is closed if a call raises"""
+        def info(host):
+            if host.a.hostname == 'b':
+                raise ValueError("boom")
+            return Deferred()
+
+        info.__name__ = "info"
+        self.assertRaises(
+            ValueError, self.shipper.parallel, info, {})
+        report = self.reports[-1]
+        self.assertTrue(report.closed)
+        self.assertEqual(
+            (1, 1), (report.counts()['running'], report.counts()['failed']))
@@ -0,0 +1,111 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import os
+import sys
+import argparse
+import subprocess
+
+from twisted.trial.unittest import TestCase
+
+import shipper
+from shipper import auto, runner
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(shipper.__file__)))
+
+_SCRIPT = """
+import sys
+from shipper import Shipper, run, command
+
+@command
+def ps(hosts="localhost"):
+    pass
+
+try:
+    run()
+finally:
+    sys.stderr.write(repr(sorted(
+        m for m in ("twisted.internet.reactor", "treq", "texttable", "ago")
+        if m in sys.modules)))
+"""
+
+
+class RunnerTestCase(TestCase):
+
+    def _script(self, *args):
+        env = dict(os.environ, PYTHONPATH=_ROOT)
+        p = subprocess.Popen(
+            [sys.executable, "-c", _SCRIPT] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        out, err = p.communicate()
+        return p.returncode, out, err
+
+    def test_help_skips_heavy_imports(self):
+        """Help is printed without importing twisted reactor and treq"""
+        code, out, err = self._script("-h")
+        self.assertEqual(0, code)
+        self.assertIn("usage", out)
+        self.assertTrue(err.endswith("[]"))
+
+    def test_usage_error_skips_heavy_imports(self):
+        code, out, err = self._script("ps", "--bogus")
+        self.assertEqual(2, code)
+        self.assertTrue(err.endswith("[]"))
+
+    def test_async_shipper_is_lazy(self):
+        from shipper import AsyncShipper
+        from shipper.async_shipper import AsyncShipper as expected
+        self.assertIs(expected, AsyncShipper)
+        self.assertIs(expected, shipper.AsyncShipper)
+
+
+class BatchTestCase(TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        def add(name):
+            self.calls.append(name)
+
+        def fail():
+            raise ValueError("boom")
+
+        self.parser = argparse.ArgumentParser()
+        runner._add_batch(auto.generate(self.parser, add, fail))
+
+    def _batch(self, text, keep_going=False):
+        path = self.mktemp()
+        with open(path, "w") as f:
+            f.write(text)
+        return runner._batch(self.parser, path, keep_going)
+
+    def test_groups(self):
+        steps = [runner.Step(i, "", None, p) for i, p in enumerate(
+            [False, True, True, False, True])]
+        self.assertEqual(
+            [[0], [1, 2], [3], [4]],
+            [[s.line for s in g] for g in runner._groups(steps)])
+
+    def test_batch(self):
+        batch = self._batch(
+            "# runbook\nadd a\n\nadd b &\nadd 'c d' &\nadd e\n")
+        batch(None)
+        self.assertEqual("a", self.calls[0])
+        self.assertEqual(set(["b", "c d"]), set(self.calls[1:3]))
+        self.assertEqual("e", self.calls[3])
+
+    def test_batch_stops_on_failure(self):
+        batch = self._batch("add a\nfail\nadd b\n")
+        self.assertRaises(runner._StepsFailed, batch, None)
+        self.assertEqual(["a"], self.calls)
+
+    def test_batch_keep_going(self):
+        batch = self._batch("fail\nadd b\n", keep_going=True)
+        self.assertRaises(runner._StepsFailed, batch, None)
+        self.assertEqual(["b"], self.calls)
+
+    def test_batch_invalid_command(self):
+        with self.assertRaises(SystemExit) as e:
+            self._batch("add a\nremove b\n")
+        self.assertEqual(2, e.exception.code)
@@ -31,7 +31,7 @@ class ShipperCommands(TestCase):
             return self.successResultOf(d)
 
         self.blocking_call = mock.patch(
-            'shipper.shipper.threads.blockingCallFromThread',
+            'twisted.internet.threads.blockingCallFromThread',
             side_effect=_fake_blocking_call_from_thread).start()
         self.addCleanup(mock.patch.stopall)
 
@@ -0,0 +1,102 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import json
+
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+from twisted.web.client import ResponseDone
+
+from shipper import stats, pretty
+from shipper.container import Container
+from shipper.streams import JSONReader
+
+
+def container(id, host='a', image="web"):
+    return Container(host, {'Id': id, 'Image': image})
+
+
+def raw(total, system, memory=100, rx=0, tx=0, pre=None):
+    sample = {
+        'cpu_stats': {'cpu_usage': {'total_usage': total,
+                                    'percpu_usage': [0, 0]},
+                      'system_cpu_usage': system},
+        'memory_stats': {'usage': memory, 'limit': 1000},
+        'network': {'rx_bytes': rx, 'tx_bytes': tx}}
+    if pre:
+        sample['precpu_stats'] = {'cpu_usage': {'total_usage': pre[0]},
+                                  'system_cpu_usage': pre[1]}
+    return sample
+
+
+class StatsTestCase(TestCase):
+
+    def test_parse(self):
+        sample = stats.parse(raw(30, 200, pre=(10, 100)), now=5)
+        self.assertEqual(
+            stats.Sample(5, 40.0, 100, 1000, 0, 0), sample)
+        self.assertEqual(0.0, stats.parse(raw(30, 200), now=5).cpu)
+        previous = raw(10, 100)['cpu_stats']
+        self.assertEqual(40.0, stats.parse(raw(30, 200), previous).cpu)
+
+    def test_ring_buffer(self):
+        s = stats.Stats(size=3)
+        c = container('1')
+        for i in range(10):
+            s.add(c, raw(i * 10, i * 100, rx=i * 1000, tx=i * 10), now=i)
+        series = s.series[('a', '1')]
+        self.assertEqual([7, 8, 9], [x.time for x in series.samples])
+        row = s.rows()[0]
+        self.assertEqual((20.0, 1000.0, 10.0),
+                         (row['CPU'], row['NetIn'], row['NetOut']))
+
+    def test_rollup_and_top(self):
+        s = stats.Stats()
+        s.add(container('1', 'a', 'web'), raw(11, 101, 100, pre=(1, 1)))
+        s.add(container('2', 'a', 'db'), raw(31, 101, 300, pre=(1, 1)))
+        s.add(container('3', 'b', 'web'), raw(21, 101, 200, pre=(1, 1)))
+        self.assertEqual(
+            [('a', 2, 400), ('b', 1, 200)],
+            [(g['Group'], g['Containers'], g['Memory'])
+             for g in s.rollup('host')])
+        self.assertEqual(
+            [('db', 1, 60.0), ('web', 2, 60.0)],
+            [(g['Group'], g['Containers'], g['CPU'])
+             for g in s.rollup('image')])
+        self.assertEqual(['2', '3'], [r['Id'] for r in s.top(2)])
+        self.assertIn("db", pretty.stats_to_text(s, by="image"))
+        lines = pretty.stats_to_text(s, format="json").splitlines()
+        self.assertEqual(['a', 'a', 'b'],
+                         sorted(json.loads(l)['Host'] for l in lines))
+
+    def test_expire(self):
+        s = stats.Stats(expire=10)
+        s.add(container('1'), raw(0, 0), now=100)
+        s.add(container('2'), raw(0, 0), now=105)
+        s.add(container('3'), raw(0, 0), now=112)
+        self.assertEqual(set([('a', '2'), ('a', '3')]), set(s.series))
+
+    def test_expire_scans(self):
+        """New containers of a round do not rescan all the series"""
+        s = stats.Stats(expire=10)
+        s.add(container('0'), raw(0, 0), now=100)
+        scans = []
+        self.patch(s, '_expire', scans.append)
+        for i in range(1, 100):
+            s.add(container(str(i)), raw(0, 0), now=100 + i * 0.01)
+        self.assertEqual([], scans)
+        s.add(container('100'), raw(0, 0), now=101)
+        self.assertEqual([101], scans)
+
+    def test_json_reader(self):
+        d = Deferred()
+        received = []
+        reader = JSONReader(d, received.append)
+        reader.dataReceived('{"a": 1}\n{"a"')
+        reader.dataReceived(': 2}\n\n{"a": ')
+        reader.dataReceived('3}')
+        reader.connectionLost(Failure(ResponseDone()))
+        self.assertEqual([{'a': 1}, {'a': 2}, {'a': 3}], received)
+        self.assertIs(reader, self.successResultOf(d))
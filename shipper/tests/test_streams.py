@@ -0,0 +1,104 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import struct
+
+import mock
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+from twisted.web.client import ResponseDone
+
+from shipper import streams
+
+
+def frame(stream, data):
+    return struct.pack(">BxxxL", stream, len(data)) + data
+
+
+class StreamsTestCase(TestCase):
+
+    def demux(self, chunks):
+        out = []
+        demuxer = streams.Demuxer(
+            lambda stream, data: out.append((stream, data.tobytes())))
+        for chunk in chunks:
+            demuxer.feed(chunk)
+        return out
+
+    def test_demux(self):
+        data = frame(1, "hello ") + frame(2, "oops") + frame(1, "world")
+        out = self.demux([data])
+        self.assertEqual(
+            [(1, "hello "), (2, "oops"), (1, "world")], out)
+
+    def test_demux_split_frames(self):
+        """Frames and headers split across chunks at any byte"""
+        data = frame(1, "hello ") + frame(2, "") + frame(1, "world")
+        for size in range(1, len(data)):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            out = self.demux(chunks)
+            self.assertEqual(
+                "hello world", "".join(d for s, d in out if s == 1))
+            self.assertEqual("", "".join(d for s, d in out if s == 2))
+
+    def test_demux_tty(self):
+        """Streams of tty containers are not multiplexed"""
+        self.assertEqual(
+            [(1, "plain output"), (1, " more")],
+            self.demux(["plain output", " more"]))
+
+    def test_ring_sink(self):
+        sink = streams.RingSink(limit=10)
+        for i in range(5):
+            sink.write("c", 1, memoryview("line {}\n".format(i)))
+        self.assertEqual(" 3\nline 4\n", sink.getvalue("c"))
+        self.assertEqual(2, len(sink.chunks["c"]))
+        self.assertEqual("", sink.getvalue("other"))
+
+    def test_line_sink(self):
+        lines = []
+        sink = streams.LineSink(lambda c, line: lines.append((c, line)))
+        sink.write("a", 1, memoryview("one\ntw"))
+        sink.write("b", 1, memoryview("x\n"))
+        sink.write("a", 1, memoryview("o\n"))
+        self.assertEqual([("a", "one"), ("b", "x"), ("a", "two")], lines)
+
+    def test_line_sink_last_line(self):
+        """Output without the final newline is passed once it ends"""
+        lines = []
+        sink = streams.LineSink(lambda c, line: lines.append((c, line)))
+        finished = Deferred()
+        reader = streams.StreamReader(finished, "a", sink)
+        reader.makeConnection(mock.Mock())
+        reader.dataReceived(frame(1, "one\ntwo") + frame(2, "err"))
+        self.assertEqual([("a", "one")], lines)
+        reader.connectionLost(Failure(ResponseDone()))
+        self.assertEqual([("a", "one"), ("a", "two"), ("a", "err")], lines)
+        self.successResultOf(finished)
+
+    def test_backpressure(self):
+        """Transport is paused until the sink is ready"""
+        busy = Deferred()
+        finished = Deferred()
+        sink = streams.CallbackSink(lambda c, stream, data: busy)
+        reader = streams.StreamReader(finished, "c", sink)
+        reader.makeConnection(mock.Mock())
+        reader.dataReceived(frame(1, "a") + frame(1, "b"))
+        reader.transport.pauseProducing.assert_called_once_with()
+
+        busy.callback(None)
+        reader.transport.resumeProducing.assert_called_once_with()
+        reader.connectionLost(Failure(ResponseDone()))
+        self.assertIs(reader, self.successResultOf(finished))
+
+    def test_stop_line(self):
+        finished = Deferred()
+        reader = streams.StreamReader(
+            finished, "c", streams.RingSink(), stop_line="ready")
+        reader.makeConnection(mock.Mock())
+        reader.dataReceived(frame(1, "server is READY"))
+        reader.transport.stopProducing.assert_called_once_with()
+        reader.connectionLost(Failure(RuntimeError("aborted")))
+        self.successResultOf(finished)
@@ -0,0 +1,143 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import os
+import datetime
+import ipaddress
+
+from twisted.internet import defer, reactor
+from twisted.trial.unittest import TestCase
+from twisted.web.client import HTTPConnectionPool
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from OpenSSL._util import lib as _lib
+    from twisted.internet import ssl
+    from shipper import tls
+except ImportError:
+    tls = None
+
+from shipper.async_shipper import AsyncShipper
+from shipper.fakedocker import FakeFleet
+
+
+def _certificate(name, issuer=None, ip=None, ca=False):
+    """Returns (certificate, key) signed by the `issuer` pair,
+    self signed if it's not set
+    """
+    key = rsa.generate_private_key(65537, 2048, default_backend())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    issuer_cert, issuer_key = issuer or (None, key)
+    now = datetime.datetime.utcnow()
+    builder = x509.CertificateBuilder().subject_name(subject).issuer_name(
+        issuer_cert.subject if issuer_cert else subject).public_key(
+        key.public_key()).serial_number(x509.random_serial_number()).\
+        not_valid_before(now - datetime.timedelta(days=1)).\
+        not_valid_after(now + datetime.timedelta(days=1)).add_extension(
+            x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+    if ip:
+        builder = builder.add_extension(x509.SubjectAlternativeName(
+            [x509.IPAddress(ipaddress.ip_address(ip))]), critical=False)
+    return builder.sign(issuer_key, hashes.SHA256(), default_backend()), key
+
+
+def _pem(certificate, key=None):
+    pem = certificate.public_bytes(serialization.Encoding.PEM)
+    if key is not None:
+        pem += key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption())
+    return pem
+
+
+class TLSTestCase(TestCase):
+    """
+    Tests shipper against fake docker daemons listening on https
+    """
+    if tls is None:
+        skip = "pyOpenSSL and service_identity are not installed"
+
+    def setUp(self):
+        self.directory = self.mktemp()
+        os.makedirs(self.directory)
+        ca = _certificate(u"ca", ca=True)
+        server = _certificate(u"docker", ca, ip=u"127.0.0.1")
+        client = _certificate(u"client", ca)
+        self.ca = self._write("ca.pem", _pem(ca[0]))
+        self.cert = self._write("cert.pem", _pem(client[0]))
+        self.key = self._write("key.pem", _pem(client[0], client[1]))
+        self.other_ca = self._write(
+            "other-ca.pem", _pem(_certificate(u"other", ca=True)[0]))
+
+        certificate = ssl.PrivateCertificate.loadPEM(_pem(*server))
+        options = ssl.CertificateOptions(
+            privateKey=certificate.privateKey.original,
+            certificate=certificate.original,
+            verify=True, requireCertificate=True,
+            caCerts=[ssl.Certificate.loadPEM(_pem(ca[0])).original])
+        self.fleet = FakeFleet(2, containers=3, tls=options)
+        self.addCleanup(self.fleet.stop)
+        # new connection for every request
+        self.pool = HTTPConnectionPool(reactor, persistent=False)
+        self.addCleanup(self.pool.closeCachedConnections)
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    @defer.inlineCallbacks
+    def test_client_certificate(self):
+        """Hosts are verified by the CA and sessions are resumed"""
+        options = tls.TLSOptions(self.ca, self.cert, self.key)
+        shipper = AsyncShipper(self.fleet.hosts, pool=self.pool, tls=options)
+        for _ in range(3):
+            containers = yield shipper.containers()
+            self.assertEqual(6, len(containers))
+
+        self.assertEqual(2, len(options.creators))
+        for creator in options.creators.itervalues():
+            self.assertTrue(creator.offered > 0)
+            self.assertTrue(_lib.SSL_session_reused(creator.last._ssl))
+
+    @defer.inlineCallbacks
+    def test_unknown_ca(self):
+        """Hosts signed by the other CA are rejected unless overridden"""
+        port = self.fleet.ports[0].getHost().port
+        options = tls.TLSOptions(
+            self.other_ca, self.cert, self.key,
+            hosts={"127.0.0.1:{}".format(port): tls.TLSOptions(
+                self.ca, self.cert, self.key)})
+        shipper = AsyncShipper(self.fleet.hosts, pool=self.pool, tls=options)
+
+        containers = yield shipper.on(self.fleet.hosts[:1]).containers()
+        self.assertEqual(3, len(containers))
+        yield self.assertFailure(
+            shipper.on(self.fleet.hosts[1:]).containers(), defer.FirstError)
+
+    @defer.inlineCallbacks
+    def test_workers(self):
+        """Sharded listings connect with the same options"""
+        options = tls.TLSOptions(self.ca, self.cert, self.key)
+        self.assertEqual(
+            options.to_dict(),
+            tls.TLSOptions.from_dict(options.to_dict()).to_dict())
+        shipper = AsyncShipper(self.fleet.hosts, pool=self.pool,
+                               tls=options, processes=2)
+        containers = yield shipper.containers()
+        self.assertEqual(6, len(containers))
+
+    def test_from_environment(self):
+        self.assertIdentical(None, tls.from_environment({}))
+        options = tls.from_environment({
+            "DOCKER_CERT_PATH": self.directory, "DOCKER_TLS_VERIFY": "0"})
+        self.assertEqual(
+            (self.ca, self.cert, self.key, False),
+            (options.ca, options.cert, options.key, options.verify))
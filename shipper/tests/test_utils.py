@@ -81,3 +81,12 @@ class ShipperUtilsTestCase(unittest.TestCase):
         self.assertEquals(
             {'8125/udp': [{'HostIp': '', 'HostPort': '8125'}]}, binds)
         self.assertEquals({'8125/udp': {}}, exposed)
+
+    def test_notify(self):
+        """Failing callbacks are logged, the rest are still called
+        """
+        log = mock.Mock()
+        called = []
+        utils.notify([lambda x: 1 / 0, called.append], log, "x")
+        self.assertEquals(["x"], called)
+        self.assertEquals(1, log.exception.call_count)
@@ -0,0 +1,150 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import mock
+
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.error import ConnectionLost
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+
+from shipper import waiter
+from shipper.client import Client
+from shipper.container import Container
+from shipper.host import Host
+
+
+class _Reader(object):
+    """Open events stream"""
+
+    def __init__(self):
+        self.finished = Deferred()
+        self.stopped = False
+
+    def stop(self):
+        if not self.stopped:
+            self.stopped = True
+            self.finished.callback(self)
+
+
+class WaiterTestCase(TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock(Client)
+        self.host = Host("a")
+        self.readers = []
+        self.callbacks = []
+
+        def events(host, callback, events=None):
+            self.callbacks.append(callback)
+            self.readers.append(_Reader())
+            return succeed(self.readers[-1])
+
+        self.client.events.side_effect = events
+        self.client.containers.side_effect = lambda host, **kw: succeed(
+            [{'Id': 'exited', 'Status': "Exited (2) 1 minute ago"},
+             {'Id': 'running-1', 'Status': "Up 1 minute"},
+             {'Id': 'running-2', 'Status': "Up 1 minute"}])
+        self.inspected = []
+        self.client.inspect.side_effect = self._inspect
+        self.containers = [
+            Container(self.host, {'Id': i})
+            for i in ("exited", "running-1", "running-2")]
+
+    def _inspect(self, host, container):
+        d = Deferred()
+        self.inspected.append((container.id, d))
+        return d
+
+    def test_events(self):
+        """Containers are resolved by the listing and the die events,
+        exit codes are inspected at most `limit` at a time
+        """
+        finished = []
+        d = waiter.wait(self.client, self.containers, limit=1,
+                        each=lambda c, r: finished.append(c.id))
+        self.assertEqual(["exited"], finished)
+        self.assertEqual(["die"], self.client.events.call_args[1]['events'])
+
+        callback, = self.callbacks
+        callback({'status': "start", 'id': "running-1"})
+        callback({'status': "die", 'id': "running-1"})
+        callback({'status': "die", 'id': "running-2"})
+        callback({'status': "die", 'id': "running-2"})
+        self.assertEqual(["running-1"], [i for i, _ in self.inspected])
+
+        self.inspected[0][1].callback({'State': {'ExitCode': 1}})
+        self.assertEqual(["exited", "running-1"], finished)
+        self.inspected[1][1].callback({'State': {'ExitCode': 0}})
+
+        self.assertEqual(
+            [2, 1, 0], [r['StatusCode'] for _, r in self.successResultOf(d)])
+        self.assertTrue(self.readers[0].stopped)
+        self.assertFalse(self.client.wait.called)
+
+    def test_exit_code_in_event(self):
+        """Exit codes sent with the events are not inspected"""
+        d = waiter.wait(self.client, self.containers)
+        for i in ("running-1", "running-2"):
+            self.callbacks[0]({'Action': "die", 'Actor': {
+                'ID': i, 'Attributes': {'exitCode': "137"}}})
+        self.assertEqual(
+            [2, 137, 137],
+            [r['StatusCode'] for _, r in self.successResultOf(d)])
+        self.assertEqual([], self.inspected)
+
+    def test_listed_not_running(self):
+        """Created and restarting containers wait for their die events,
+        containers missing from the listing are inspected
+        """
+        self.client.containers.side_effect = lambda host, **kw: succeed(
+            [{'Id': 'created', 'Status': "Created"},
+             {'Id': 'restarting', 'Status': "Restarting (1) 1 second ago"}])
+        containers = [Container(self.host, {'Id': i})
+                      for i in ("created", "restarting", "removed")]
+        d = waiter.wait(self.client, containers)
+        self.assertEqual(["removed"], [i for i, _ in self.inspected])
+
+        self.inspected[0][1].callback({'State': {'ExitCode': 0}})
+        self.assertNoResult(d)
+        for i in ("created", "restarting"):
+            self.callbacks[0]({'Action': "die", 'Actor': {
+                'ID': i, 'Attributes': {'exitCode': "1"}}})
+        self.assertEqual(
+            [1, 1, 0], [r['StatusCode'] for _, r in self.successResultOf(d)])
+
+    def test_timeout(self):
+        """Containers still running after the timeout get None"""
+        clock = Clock()
+        d = waiter.wait(self.client, self.containers, timeout=10,
+                        clock=clock)
+        self.callbacks[0]({'status': "die", 'id': "running-1"})
+        self.inspected[0][1].callback({'State': {'ExitCode': 0}})
+        self.assertNoResult(d)
+
+        clock.advance(10)
+        self.assertEqual(
+            [{'StatusCode': 2}, {'StatusCode': 0}, None],
+            [r for _, r in self.successResultOf(d)])
+        self.assertTrue(self.readers[0].stopped)
+
+    def test_broken_stream(self):
+        """Containers of the host fall back to the long polling waits
+        if its stream breaks
+        """
+        self.client.wait.side_effect = lambda host, container: succeed(
+            {'StatusCode': 5})
+        d = waiter.wait(self.client, self.containers)
+        self.readers[0].finished.errback(Failure(ConnectionLost()))
+        self.assertEqual(
+            [2, 5, 5], [r['StatusCode'] for _, r in self.successResultOf(d)])
+        self.assertEqual(2, self.client.wait.call_count)
+
+    def test_exit_code(self):
+        self.assertEqual(1, waiter.exit_code("Exited (1) 2 minutes ago"))
+        self.assertEqual(0, waiter.exit_code("Exit 0"))
+        self.assertEqual(-1, waiter.exit_code("Exited (-1) 1 second ago"))
+        self.assertIdentical(None, waiter.exit_code("Up 5 minutes"))
+        self.assertIdentical(None, waiter.exit_code(None))
@@ -0,0 +1,92 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+import json
+
+from twisted.internet import reactor, defer
+from twisted.trial.unittest import TestCase
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from shipper import worker
+from shipper.api import Api
+from shipper.host import Host
+
+
+class _Containers(Resource):
+    isLeaf = True
+
+    def __init__(self):
+        Resource.__init__(self)
+        self.paths = []
+
+    def render_GET(self, request):
+        self.paths.append(request.path)
+        if request.path == "/version":
+            return json.dumps({'ApiVersion': "1.16"})
+        return json.dumps([{'Id': request.getHost().port}])
+
+
+class ShipperWorkerTestCase(TestCase):
+    """
+    Tests sharded execution in worker processes
+    """
+
+    def test_shard(self):
+        """Hosts are split in contiguous chunks"""
+        self.assertEqual(
+            [[1, 2], [3, 4], [5]], worker.shard([1, 2, 3, 4, 5], 3))
+        self.assertEqual([[1]], worker.shard([1], 3))
+
+    def _listen(self, count):
+        hosts = []
+        self.resources = []
+        for _ in range(count):
+            resource = _Containers()
+            port = reactor.listenTCP(0, Site(resource),
+                                     interface="127.0.0.1")
+            self.addCleanup(port.stopListening)
+            hosts.append(
+                Host("http://127.0.0.1:{}".format(port.getHost().port)))
+            self.resources.append(resource)
+        return hosts
+
+    def test_execute(self):
+        """Results of all the workers are merged in order of hosts"""
+        hosts = self._listen(3)
+        d = worker.execute(hosts, "containers", {}, 2, version="1.6")
+        d.addCallback(
+            self.assertEqual,
+            [[{'Id': h.a.port}] for h in hosts])
+        return d
+
+    @defer.inlineCallbacks
+    def test_dispatch(self):
+        """Every host replies on its own, workers use and update
+        the negotiated apis
+        """
+        hosts = self._listen(2) + [Host("http://127.0.0.1:1")]
+        apis = {hosts[0]: Api("1.21")}
+        deferreds, exited = worker.dispatch(
+            hosts, "containers", {}, 2, apis=apis)
+
+        first = yield deferreds[0]
+        self.assertEqual([{'Id': hosts[0].a.port}], first)
+        yield self.assertFailure(deferreds[2], RuntimeError)
+        yield deferreds[1]
+        yield exited
+        self.assertEqual(["/v1.21/containers/ps"], self.resources[0].paths)
+        self.assertEqual(
+            ["/version", "/v1.16/containers/ps"], self.resources[1].paths)
+        self.assertEqual(
+            {hosts[0]: Api("1.21"), hosts[1]: Api("1.16")}, apis)
+
+    def test_execute_error(self):
+        """Failure of a worker fails the whole call"""
+        d = worker.execute(
+            [Host("http://127.0.0.1:1")], "containers", {}, 2)
+        self.assertFailure(d, defer.FirstError)
+        d.addCallback(
+            lambda e: self.assertIsInstance(e.subFailure.value, RuntimeError))
+        return d
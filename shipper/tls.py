@@ -0,0 +1,170 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""TLS for the docker hosts listening on https.
+
+    tls = TLSOptions(ca="ca.pem", cert="cert.pem", key="key.pem",
+                     hosts={"build1:2376": TLSOptions(ca="build-ca.pem")})
+    Shipper.startup(tls=tls)
+    Shipper(["https://web1:2376", "https://build1:2376"]).containers()
+
+The handshake is the expensive part of TLS, so `startup` makes the
+connection pool persistent when TLS is set, and new connections to a host
+offer the session of the last one to resume it instead of doing the full
+handshake. Needs pyOpenSSL and service_identity.
+"""
+import os
+
+from OpenSSL import SSL
+from zope.interface import implementer
+from twisted.internet import ssl
+from twisted.internet.interfaces import IOpenSSLClientConnectionCreator
+from twisted.web.iweb import IPolicyForHTTPS
+
+
+@implementer(IPolicyForHTTPS)
+class TLSOptions(object):
+    """Certificates of the connections to the hosts: `ca` bundle
+    verifying the hosts (system trust store if not set), client `cert`
+    and `key`. With `verify` set to False the hosts are not verified.
+    `hosts` overrides the options of some hosts, keyed by "host:port"
+    or host name.
+    """
+
+    def __init__(self, ca=None, cert=None, key=None, verify=True,
+                 hosts=None):
+        self.ca = ca
+        self.cert = cert
+        self.key = key
+        self.verify = verify
+        self.hosts = hosts or {}
+        # connection creators keyed by (host, port), they keep
+        # the sessions to resume
+        self.creators = {}
+        self._trust = None
+        self._certificate = None
+
+    def creatorForNetloc(self, hostname, port):
+        key = (hostname, port)
+        creator = self.creators.get(key)
+        if creator is None:
+            options = self.hosts.get("{}:{}".format(hostname, port)) or \
+                self.hosts.get(hostname) or self
+            creator = self.creators[key] = _Resuming(
+                options._creator(hostname))
+        return creator
+
+    def _creator(self, hostname):
+        certificate = self._client_certificate()
+        if not self.verify:
+            kwargs = {}
+            if certificate is not None:
+                kwargs['privateKey'] = certificate.privateKey.original
+                kwargs['certificate'] = certificate.original
+            return _Unverified(ssl.CertificateOptions(verify=False, **kwargs))
+
+        if self._trust is None:
+            if self.ca:
+                self._trust = ssl.trustRootFromCertificates(
+                    _certificates(self.ca))
+            else:
+                self._trust = ssl.platformTrust()
+        return ssl.optionsForClientTLS(
+            hostname.decode('ascii'), trustRoot=self._trust,
+            clientCertificate=certificate)
+
+    def _client_certificate(self):
+        if not self.cert:
+            return None
+        if self._certificate is None:
+            with open(self.cert) as f:
+                pem = f.read()
+            with open(self.key or self.cert) as f:
+                pem += "\n" + f.read()
+            self._certificate = ssl.PrivateCertificate.loadPEM(pem)
+        return self._certificate
+
+    def to_dict(self):
+        """Json serializable options, e.g. for the worker processes"""
+        return {
+            'ca': self.ca, 'cert': self.cert, 'key': self.key,
+            'verify': self.verify,
+            'hosts': dict((k, v.to_dict()) for k, v in self.hosts.iteritems())
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        hosts = dict((k, cls.from_dict(v))
+                     for k, v in (values.get('hosts') or {}).iteritems())
+        return cls(values.get('ca'), values.get('cert'), values.get('key'),
+                   values.get('verify', True), hosts)
+
+    def __repr__(self):
+        return "TLSOptions(ca={}, cert={}, verify={})".format(
+            self.ca, self.cert, self.verify)
+
+
+def from_environment(environ=None):
+    """Options from docker style environment: ca.pem, cert.pem and
+    key.pem in SHIPPER_CERT_PATH or DOCKER_CERT_PATH, hosts are not
+    verified if DOCKER_TLS_VERIFY is 0. Returns None if neither
+    path is set.
+    """
+    environ = os.environ if environ is None else environ
+    path = environ.get("SHIPPER_CERT_PATH") or environ.get("DOCKER_CERT_PATH")
+    if not path:
+        return None
+
+    def existing(name):
+        name = os.path.join(os.path.expanduser(path), name)
+        return name if os.path.exists(name) else None
+
+    return TLSOptions(
+        ca=existing("ca.pem"),
+        cert=existing("cert.pem"),
+        key=existing("key.pem"),
+        verify=environ.get("DOCKER_TLS_VERIFY", "1") != "0")
+
+
+@implementer(IOpenSSLClientConnectionCreator)
+class _Resuming(object):
+    """Offers the session of the last connection to the host
+    to the new connections
+    """
+
+    def __init__(self, creator):
+        self.creator = creator
+        self.last = None
+        self.session = None
+        self.offered = 0
+
+    def clientConnectionForTLS(self, protocol):
+        if self.last is not None:
+            self.session = self.last.get_session() or self.session
+        connection = self.creator.clientConnectionForTLS(protocol)
+        if self.session is not None:
+            connection.set_session(self.session)
+            self.offered += 1
+        self.last = connection
+        return connection
+
+
+@implementer(IOpenSSLClientConnectionCreator)
+class _Unverified(object):
+    def __init__(self, options):
+        self.options = options
+
+    def clientConnectionForTLS(self, protocol):
+        connection = SSL.Connection(self.options.getContext(), None)
+        connection.set_app_data(protocol)
+        return connection
+
+
+def _certificates(path):
+    """Loads all the certificates of the bundle"""
+    with open(path) as f:
+        data = f.read()
+    end = "-----END CERTIFICATE-----"
+    return [ssl.Certificate.loadPEM(pem + end)
+            for pem in data.split(end) if pem.strip()]
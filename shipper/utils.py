@@ -6,8 +6,6 @@ import time
 import os.path
 from datetime import datetime
 
-import ago
-
 
 def from_epoch(seconds):
     '''
@@ -50,6 +48,7 @@ def time_ago(dt):
     """Returns human readable string saying how long
     ago the event happened, e.g. "1 hour ago"
     """
+    import ago
     diff = datetime.utcnow() - dt
     return ago.human(diff, precision=1)
 
@@ -103,3 +102,14 @@ def parse_ports(vals):
             {"HostIp": "", "HostPort": host_port})
 
     return (exposed, bindings)
+
+
+def notify(callbacks, log, *args):
+    """Calls every callback with the arguments. Callbacks trace and
+    report, so their failures are logged and never break the operation.
+    """
+    for callback in callbacks:
+        try:
+            callback(*args)
+        except Exception:
+            log.exception("Callback %r failed on %r", callback, args)
@@ -0,0 +1,225 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Waiting for many containers on the events streams of the hosts.
+
+Docker's `containers/{id}/wait` holds a connection per container until it
+stops, so waiting for thousands of batch containers takes thousands of
+sockets. Instead, :func:`wait` opens one `/events` stream per host:
+
+    results = Shipper(hosts).wait(*containers, events=True, timeout=3600,
+                                  each=lambda c, r: log(c, r))
+
+* containers that stopped before the stream was open are found with
+  a single listing per host, the ones missing from it are inspected
+* `die` events resolve the containers as they stop, the exit code is
+  taken from the event (api 1.22) or fetched with `inspect`, at most
+  `limit` at a time per host
+* if the stream breaks, the remaining containers of the host fall back
+  to the long polling waits
+"""
+import re
+from collections import OrderedDict
+
+from twisted.internet import defer
+
+_EXITED = re.compile(r"^Exit(?:ed)?\s*\(?(-?\d+)\)?")
+
+
+def exit_code(status):
+    """Exit code in the listed status, e.g. "Exited (1) 2 minutes ago"
+    or "Exit 1", None if the container has not exited
+    """
+    match = _EXITED.match(status or "")
+    return int(match.group(1)) if match else None
+
+
+def wait(client, containers, timeout=None, each=None, limit=10,
+         progress=None, clock=None):
+    """Returns deferred firing with (container, {'StatusCode': code})
+    of every container in order, containers still running after
+    `timeout` seconds get None. `each(container, result)` is called as
+    soon as every container stops.
+    """
+    hosts = OrderedDict()
+    for c in containers:
+        hosts.setdefault(c.host, []).append(c)
+    waiters = [HostWaiter(client, host, values, limit)
+               for host, values in hosts.iteritems()]
+    results = {}
+    for w in waiters:
+        results.update(w.results)
+
+    deferreds = []
+    for c in containers:
+        d = results[c.id]
+        if progress is not None:
+            task = progress.add(c.host)
+            task.start()
+            d.addBoth(task.finish)
+        if each is not None:
+            d.addCallback(_each, each, c)
+        deferreds.append(d)
+    if progress is not None:
+        progress.close()
+
+    for w in waiters:
+        w.start()
+
+    timer = None
+    if timeout is not None:
+        if clock is None:
+            from twisted.internet import reactor as clock
+        timer = clock.callLater(timeout, _stop, waiters)
+
+    def done(result):
+        if timer is not None and timer.active():
+            timer.cancel()
+        # streams of the other hosts are closed if one has failed
+        _stop(waiters)
+        return result
+
+    d = defer.gatherResults(deferreds, consumeErrors=True)
+    d.addBoth(done)
+    d.addCallback(lambda codes: zip(containers, codes))
+    return d
+
+
+def _each(result, each, container):
+    if result is not None:
+        each(container, result)
+    return result
+
+
+def _stop(waiters):
+    for w in waiters:
+        w.stop()
+
+
+class HostWaiter(object):
+    """Waits for the containers of a single host on its events stream,
+    `results` are deferreds keyed by the container ids
+    """
+
+    def __init__(self, client, host, containers, limit=10):
+        self.client = client
+        self.host = host
+        self.containers = dict((c.id, c) for c in containers)
+        self.results = dict((c.id, defer.Deferred()) for c in containers)
+        self.semaphore = defer.DeferredSemaphore(limit)
+        # ids whose exit code is being fetched
+        self.resolving = set()
+        self.reader = None
+        self.waits = []
+        self.stopped = False
+
+    def start(self):
+        d = self.client.events(self.host, self._event, events=["die"])
+        d.addCallbacks(self._opened, self._fallback)
+
+    def stop(self):
+        """Stops waiting, containers that are still running get None"""
+        if self.stopped:
+            return
+        self.stopped = True
+        if self.reader is not None:
+            self.reader.stop()
+        for d in self.waits:
+            d.cancel()
+        for container_id in self.results.keys():
+            self._resolve(None, container_id)
+
+    def _opened(self, reader):
+        self.reader = reader
+        reader.finished.addBoth(self._closed)
+        if self.stopped:
+            reader.stop()
+            return
+        d = self.client.containers(self.host, all=True)
+        d.addCallbacks(self._listed, self._fallback)
+
+    def _listed(self, replies):
+        listed = set()
+        for reply in replies:
+            container_id = self._find(reply.get('Id'))
+            if container_id is None:
+                continue
+            listed.add(container_id)
+            # the rest, running, created or restarting, waits for its
+            # die event
+            code = exit_code(reply.get('Status'))
+            if code is not None:
+                self._resolve({'StatusCode': code}, container_id)
+        # missing containers were removed, inspect reports the error
+        for container_id in self.results.keys():
+            if container_id not in listed:
+                self._inspect(container_id)
+
+    def _event(self, event):
+        status = event.get('status') or event.get('Action')
+        actor = event.get('Actor') or {}
+        container_id = self._find(event.get('id') or actor.get('ID'))
+        if status != "die" or container_id is None:
+            return
+        code = (actor.get('Attributes') or {}).get('exitCode')
+        if code is not None:
+            self._resolve({'StatusCode': int(code)}, container_id)
+        else:
+            self._inspect(container_id)
+
+    def _inspect(self, container_id):
+        if container_id in self.resolving:
+            return
+        self.resolving.add(container_id)
+        d = self.semaphore.run(
+            self.client.inspect, self.host, self.containers[container_id])
+        d.addCallback(lambda reply: {'StatusCode': reply['State']['ExitCode']})
+        d.addCallbacks(self._resolve, self._fail,
+                       callbackArgs=(container_id,),
+                       errbackArgs=(container_id,))
+
+    def _closed(self, result):
+        """Stream ended, the rest waits the old way"""
+        self.reader = None
+        if not self.stopped and self.results:
+            self._fallback(result)
+
+    def _fallback(self, failure):
+        if self.stopped:
+            return
+        for container_id in self.results.keys():
+            if container_id in self.resolving:
+                continue
+            self.resolving.add(container_id)
+            d = self.client.wait(self.host, self.containers[container_id])
+            d.addCallbacks(self._resolve, self._fail,
+                           callbackArgs=(container_id,),
+                           errbackArgs=(container_id,))
+            self.waits.append(d)
+
+    def _resolve(self, result, container_id):
+        d = self.results.pop(container_id, None)
+        if d is not None:
+            d.callback(result)
+        if not self.results and self.reader is not None:
+            self.reader.stop()
+
+    def _fail(self, failure, container_id):
+        if self.stopped:
+            return
+        d = self.results.pop(container_id, None)
+        if d is not None:
+            d.errback(failure)
+
+    def _find(self, container_id):
+        """Id of the awaited container, events and listings have
+        the long ids
+        """
+        if not container_id:
+            return None
+        if container_id in self.results:
+            return container_id
+        if container_id[:12] in self.results:
+            return container_id[:12]
+        return None
@@ -0,0 +1,213 @@
+# coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License")
+# See LICENSE for details
+
+"""Worker process for sharded fan-out on large fleets.
+
+Parent shards the hosts across several worker processes, every worker
+runs its own reactor and client, executes the same call on its shard
+of hosts and streams the responses back as compact JSON lines, one per
+host as soon as it replies. This way decoding docker replies for
+thousands of hosts is spread across cores, and the parent decodes and
+builds the records of one host at a time instead of pinning its reactor
+thread with the whole shard at the end.
+
+Worker reads the job from stdin:
+
+    {"method": "containers", "hosts": [url, ...], "kwargs": {...},
+     "version": null, "apis": ["1.21", null, ...], "timeout": null,
+     "tls": {"ca": ..., "cert": ..., "key": ..., "verify": true}}
+
+`apis` are the versions the parent has already negotiated with the
+hosts. Worker writes `{"index": 0, "result": ...}` or
+`{"index": 0, "error": "..."}` lines to stdout, and finally
+`{"apis": [...]}` with the versions negotiated by the worker.
+"""
+import os
+import sys
+import json
+
+from twisted.internet import reactor, defer, protocol
+from twisted.web.client import HTTPConnectionPool
+
+from .api import Api
+from .host import Host
+from .client import Client
+from . import codec as _codec
+
+# Client calls that can be executed in the worker processes,
+# these are read only calls with json serializable arguments
+SHARDABLE = ("containers", "images", "info")
+
+# directory the shipper package is imported from, resolved at import time
+# as the working directory may change later
+_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shard(hosts, count):
+    """Splits hosts into `count` contiguous chunks of similar size"""
+    count = max(1, min(count, len(hosts)))
+    size, extra = divmod(len(hosts), count)
+    shards = []
+    start = 0
+    for i in xrange(count):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(hosts[start:end])
+        start = end
+    return shards
+
+
+def execute(hosts, method, kwargs, processes, **options):
+    """Executes client `method` on all the hosts using `processes` worker
+    processes. Must be called in the reactor thread, returns deferred
+    with the list of responses in the order of hosts.
+    """
+    results, exited = dispatch(hosts, method, kwargs, processes, **options)
+    d = defer.gatherResults(results, consumeErrors=True)
+    return when_exited(d, exited)
+
+
+def dispatch(hosts, method, kwargs, processes, version=None,
+             timeout=None, tls=None, apis=None):
+    """Same as `execute`, but returns deferreds of every host firing
+    as soon as the host replies, and deferred firing once the workers
+    exit. `tls` is :class:`shipper.tls.TLSOptions` of the client, `apis`
+    its cache of the negotiated apis, the workers use and update it.
+    """
+    apis = {} if apis is None else apis
+    results = []
+    exited = []
+    for chunk in shard(hosts, processes):
+        deferreds = [defer.Deferred() for _ in chunk]
+        job = {
+            "method": method,
+            "hosts": [h.url for h in chunk],
+            "kwargs": kwargs,
+            "version": version,
+            "apis": [apis[h].version if h in apis else None
+                     for h in chunk],
+            "timeout": timeout,
+            "tls": tls.to_dict() if tls is not None else None
+        }
+        worker = _WorkerProtocol(job, chunk, deferreds, apis)
+        _spawn(worker)
+        results.extend(deferreds)
+        exited.append(worker.exited)
+    return results, defer.gatherResults(exited)
+
+
+def when_exited(d, exited):
+    """Result of `d` once the workers have exited"""
+    return d.addBoth(lambda result: exited.addCallback(lambda _: result))
+
+
+class _WorkerProtocol(protocol.ProcessProtocol):
+    def __init__(self, job, hosts, results, apis):
+        self.job = job
+        self.hosts = hosts
+        self.results = results
+        self.apis = apis
+        self.buffer = ""
+        self.err = []
+        self.exited = defer.Deferred()
+
+    def connectionMade(self):
+        self.transport.write(json.dumps(self.job))
+        self.transport.closeStdin()
+
+    def outReceived(self, data):
+        lines = (self.buffer + data).split("\n")
+        self.buffer = lines.pop()
+        for line in lines:
+            if line:
+                self._received(_codec.loads(line))
+
+    def errReceived(self, data):
+        self.err.append(data)
+
+    def processEnded(self, reason):
+        error = RuntimeError(
+            "Worker failed: {}".format(''.join(self.err).strip()))
+        for d in self.results:
+            if not d.called:
+                d.errback(error)
+        self.exited.callback(None)
+
+    def _received(self, reply):
+        if 'apis' in reply:
+            for host, version in zip(self.hosts, reply['apis']):
+                if version:
+                    self.apis[host] = Api(version)
+            return
+        d = self.results[reply['index']]
+        if 'error' in reply:
+            d.errback(RuntimeError(reply['error']))
+        else:
+            d.callback(reply['result'])
+
+
+def _spawn(worker):
+    args = [sys.executable, "-m", "shipper.worker"]
+    reactor.spawnProcess(
+        worker, sys.executable, args, env=_environment())
+
+
+def _environment():
+    """Makes sure that workers import the same shipper package
+    as the parent, even if it's not installed
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in (_PATH, env.get('PYTHONPATH')) if p)
+    return env
+
+
+def _error(failure):
+    failure = getattr(failure.value, 'subFailure', failure)
+    return "{}: {}".format(failure.type.__name__, failure.value)
+
+
+def _write(reply):
+    sys.stdout.write(json.dumps(reply, separators=(',', ':')) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    job = json.loads(sys.stdin.read())
+    if job['method'] not in SHARDABLE:
+        raise ValueError("Unsupported method: {}".format(job['method']))
+
+    tls = None
+    if job.get('tls'):
+        from .tls import TLSOptions
+        tls = TLSOptions.from_dict(job['tls'])
+    hosts = [Host(url) for url in job['hosts']]
+    for host, version in zip(hosts, job.get('apis') or ()):
+        if version:
+            Client.apis[host] = Api(version)
+
+    client = Client(job['version'], job['timeout'], tls=tls,
+                    pool=HTTPConnectionPool(reactor, persistent=False))
+    method = getattr(client, job['method'])
+    kwargs = dict((str(k), v) for k, v in job['kwargs'].iteritems())
+
+    def call():
+        deferreds = []
+        for index, host in enumerate(hosts):
+            d = method(host, **kwargs)
+            d.addCallbacks(
+                lambda result, i=index: _write({'index': i, 'result': result}),
+                lambda f, i=index: _write({'index': i, 'error': _error(f)}))
+            deferreds.append(d)
+        d = defer.DeferredList(deferreds)
+        d.addCallback(lambda _: _write({'apis': [
+            client.apis[h].version if h in client.apis else None
+            for h in hosts]}))
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(call)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()